@@ -0,0 +1,184 @@
+"""Recall, latency and memory of small first-stage vectors.
+
+Embeds a synthetic corpus with the configured embedding backend (falling
+back to the hashing embedder offline), then for every reduction method and
+dimension runs the two-stage query used by QdrantService (prefetch on the
+small vector, rescore with the full one) and compares it with exact
+full-vector search.
+
+Usage (from the ai-service directory):
+    python -m benchmarks.dimensions --patients 30 --dims 64,128,256 --k 5
+"""
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Dict, Any, List
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, VectorParams, PointStruct, Prefetch
+
+from benchmarks.synthetic import generate_corpus
+from benchmarks.stubs import HashingEmbedder
+from services.document_service import DocumentService
+from services.embedding_service import EmbeddingService
+from services.vector_reduction import VectorReducer
+
+logger = logging.getLogger("benchmarks")
+
+
+def _corpus_texts(corpus_dir: Path) -> List[str]:
+    document_service = DocumentService()
+    texts = []
+    for patient_dir in sorted(corpus_dir.iterdir()):
+        for path in sorted(patient_dir.iterdir()):
+            texts.extend(chunk['text'] for chunk in document_service.process_file(str(path), patient_dir.name, path.name))
+    return texts
+
+
+def _exact_top_k(doc_vectors: np.ndarray, query_vectors: np.ndarray, k: int) -> List[set]:
+    scores = query_vectors @ doc_vectors.T
+    return [set(np.argsort(-row)[:k].tolist()) for row in scores]
+
+
+def bench_config(
+    method: str,
+    dimension: int,
+    doc_vectors: np.ndarray,
+    query_vectors: np.ndarray,
+    exact: List[set],
+    k: int,
+    rescore_factor: int,
+    workdir: Path
+) -> Dict[str, Any]:
+    """Two-stage search for one method/dimension, None dimension means full vectors only"""
+    full_dim = doc_vectors.shape[1]
+    client = QdrantClient(location=":memory:")
+    collection = "bench"
+
+    if dimension:
+        reducer = VectorReducer("bench", full_dim)
+        reducer.method = method
+        reducer.dimension = dimension
+        reducer.pca_path = str(workdir / f"pca-{dimension}.npz")
+        if method == "pca":
+            reducer.fit_pca(doc_vectors.tolist())
+        small_docs = reducer.reduce(doc_vectors.tolist())
+        small_queries = reducer.reduce(query_vectors.tolist())
+        client.create_collection(collection, vectors_config={
+            "full": VectorParams(size=full_dim, distance=Distance.COSINE, on_disk=True),
+            "small": VectorParams(size=dimension, distance=Distance.COSINE)
+        })
+        points = [
+            PointStruct(id=i, vector={"full": full.tolist(), "small": small})
+            for i, (full, small) in enumerate(zip(doc_vectors, small_docs))
+        ]
+    else:
+        client.create_collection(collection, vectors_config=VectorParams(size=full_dim, distance=Distance.COSINE))
+        points = [PointStruct(id=i, vector=full.tolist()) for i, full in enumerate(doc_vectors)]
+
+    for start in range(0, len(points), 512):
+        client.upsert(collection, points=points[start:start + 512])
+
+    durations = []
+    recalls = []
+    for i, query in enumerate(query_vectors):
+        start = time.perf_counter()
+        if dimension:
+            hits = client.query_points(
+                collection,
+                query=query.tolist(),
+                using="full",
+                prefetch=Prefetch(query=small_queries[i], using="small", limit=k * rescore_factor),
+                limit=k
+            ).points
+        else:
+            hits = client.query_points(collection, query=query.tolist(), limit=k).points
+        durations.append(time.perf_counter() - start)
+        recalls.append(len({hit.id for hit in hits} & exact[i]) / k)
+
+    millis = np.array(durations) * 1000
+    resident_dims = dimension or full_dim
+    return {
+        'method': method if dimension else "full",
+        'dimension': resident_dims,
+        f'recall@{k}': round(float(np.mean(recalls)), 4),
+        'p50_ms': round(float(np.percentile(millis, 50)), 3),
+        'p95_ms': round(float(np.percentile(millis, 95)), 3),
+        # Vectors that must stay in RAM; full vectors go to disk when a small one exists
+        'ram_mb': round(len(doc_vectors) * resident_dims * 4 / 1e6, 3),
+        'disk_mb': round(len(doc_vectors) * full_dim * 4 / 1e6, 3) if dimension else 0.0
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark small first-stage vector dimensions")
+    parser.add_argument("--patients", type=int, default=30)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--dims", type=lambda v: [int(d) for d in v.split(",")], default=[32, 64, 128, 256])
+    parser.add_argument("--methods", type=lambda v: v.split(","), default=["matryoshka", "pca"])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logging.getLogger("services").setLevel(logging.WARNING)
+
+    workdir = Path(tempfile.mkdtemp(prefix="ai-bench-dims-"))
+    generate_corpus(str(workdir / "corpus"), args.patients, seed=args.seed)
+    texts = _corpus_texts(workdir / "corpus")
+
+    embedding_service = EmbeddingService()
+    if embedding_service.client is None:
+        embedding_service.client = HashingEmbedder(embedding_service.get_embedding_dimension())
+        embedding_service.embedding_model = "hashing"
+
+    # Queries are sentences taken from the corpus, so each has true neighbours
+    rng = random.Random(args.seed)
+    sentences = [s.strip() for text in texts for s in text.split("\n") if len(s.strip()) > 30]
+    queries = rng.sample(sentences, min(args.queries, len(sentences)))
+
+    doc_vectors = np.asarray(embedding_service.create_embeddings(texts), dtype=np.float32)
+    query_vectors = np.asarray(embedding_service.create_embeddings(queries), dtype=np.float32)
+    doc_vectors /= np.linalg.norm(doc_vectors, axis=1, keepdims=True)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    exact = _exact_top_k(doc_vectors, query_vectors, args.k)
+    logger.info(f"{len(texts)} chunks, {len(queries)} queries, {doc_vectors.shape[1]} dims ({embedding_service.embedding_model})")
+
+    rows = [bench_config("full", 0, doc_vectors, query_vectors, exact, args.k, args.rescore_factor, workdir)]
+    for method in args.methods:
+        for dimension in args.dims:
+            if dimension < doc_vectors.shape[1]:
+                rows.append(bench_config(method, dimension, doc_vectors, query_vectors, exact, args.k, args.rescore_factor, workdir))
+
+    recall_key = f"recall@{args.k}"
+    print(f"\n{'method':12s} {'dim':>6s} {recall_key:>10s} {'p50 ms':>9s} {'p95 ms':>9s} {'RAM MB':>9s} {'disk MB':>9s}")
+    for row in rows:
+        print(
+            f"{row['method']:12s} {row['dimension']:6d} {row[recall_key]:10.3f} {row['p50_ms']:9.3f} "
+            f"{row['p95_ms']:9.3f} {row['ram_mb']:9.3f} {row['disk_mb']:9.3f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                'embedding_model': embedding_service.embedding_model,
+                'chunks': len(texts),
+                'queries': len(queries),
+                'k': args.k,
+                'rescore_factor': args.rescore_factor,
+                'results': rows
+            }, f, indent=2)
+        logger.info(f"Wrote results to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
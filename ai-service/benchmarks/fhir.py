@@ -0,0 +1,211 @@
+"""Throughput and memory of streaming FHIR Bundle ingestion.
+
+Writes synthetic FHIR R4 Bundles of the requested sizes (one patient with
+encounters, conditions, medication statements and a large number of
+observations), then chunks each bundle with DocumentService in a fresh
+process and reports MB/s, chunks/s and the peak RSS of that process. The
+same bundle loaded with json.load shows the memory the whole-file path
+would need. Embedding is not part of the measurement.
+
+Usage (from the ai-service directory):
+    python -m benchmarks.fhir --sizes-mb 20,100,300
+"""
+import os
+import sys
+import json
+import time
+import random
+import resource
+import logging
+import argparse
+import tempfile
+import multiprocessing
+from typing import Dict, Any, List
+
+from benchmarks.sidecar import WORDS
+
+logger = logging.getLogger("benchmarks")
+
+VITALS = [
+    ("8867-4", "Herzfrequenz", "/min", 50, 120),
+    ("8310-5", "Körpertemperatur", "Cel", 36.0, 39.5),
+    ("59408-5", "Sauerstoffsättigung", "%", 88, 100),
+    ("9279-1", "Atemfrequenz", "/min", 10, 30)
+]
+
+LABS = [
+    ("6598-7", "Troponin T", "ng/L", 3, 800),
+    ("2160-0", "Kreatinin", "mg/dL", 0.5, 4.0),
+    ("718-7", "Hämoglobin", "g/dL", 8, 17),
+    ("1988-5", "CRP", "mg/L", 0.5, 250),
+    ("2823-3", "Kalium", "mmol/L", 3.0, 6.0)
+]
+
+
+def _observation(rng: random.Random, index: int) -> Dict[str, Any]:
+    vital = rng.random() < 0.5
+    code, display, unit, low, high = rng.choice(VITALS if vital else LABS)
+    return {
+        'resourceType': "Observation",
+        'id': f"obs-{index}",
+        'status': "final",
+        'category': [{'coding': [{
+            'system': "http://terminology.hl7.org/CodeSystem/observation-category",
+            'code': "vital-signs" if vital else "laboratory"
+        }]}],
+        'code': {'coding': [{'system': "http://loinc.org", 'code': code, 'display': display}], 'text': display},
+        'subject': {'reference': "Patient/p1"},
+        'effectiveDateTime': f"2024-11-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00+01:00",
+        'valueQuantity': {'value': round(rng.uniform(low, high), 1), 'unit': unit, 'system': "http://unitsofmeasure.org", 'code': unit},
+        'note': [{'text': " ".join(rng.choices(WORDS, k=rng.randint(0, 12)))}]
+    }
+
+
+def _fixed_resources(rng: random.Random) -> List[Dict[str, Any]]:
+    resources = [{
+        'resourceType': "Patient",
+        'id': "p1",
+        'name': [{'use': "official", 'family': "Mustermann", 'given': ["Max"]}],
+        'gender': "male",
+        'birthDate': "1957-03-14"
+    }]
+    for i in range(3):
+        resources.append({
+            'resourceType': "Encounter",
+            'id': f"enc-{i}",
+            'status': "finished",
+            'serviceType': {'text': "Kardiologie"},
+            'period': {'start': f"2024-11-{1 + i * 9:02d}", 'end': f"2024-11-{8 + i * 9:02d}"},
+            'reasonCode': [{'text': "Akutes Koronarsyndrom"}],
+            'location': [{'location': {'display': "Station 3B"}}]
+        })
+    for i in range(20):
+        resources.append({
+            'resourceType': "Condition",
+            'id': f"cond-{i}",
+            'code': {'coding': [{'system': "http://hl7.org/fhir/sid/icd-10", 'code': f"I{20 + i}.0", 'display': " ".join(rng.choices(WORDS, k=3))}]},
+            'category': [{'coding': [{'code': "encounter-diagnosis", 'display': "Encounter Diagnosis"}]}],
+            'onsetDateTime': "2024-11-01"
+        })
+    for i in range(30):
+        resources.append({
+            'resourceType': "MedicationStatement",
+            'id': f"med-{i}",
+            'status': "active",
+            'medicationCodeableConcept': {'text': rng.choice(["Ramipril", "Bisoprolol", "ASS", "Atorvastatin", "Metformin"])},
+            'effectiveDateTime': "2024-11-02",
+            'dosage': [{
+                'text': "1-0-0",
+                'route': {'text': "oral"},
+                'doseAndRate': [{'doseQuantity': {'value': rng.choice([2.5, 5, 10, 100]), 'unit': "mg"}}]
+            }],
+            'reasonCode': [{'text': rng.choice(WORDS)}]
+        })
+    return resources
+
+
+def write_bundle(path: str, size_mb: int, seed: int) -> int:
+    """Stream a synthetic Bundle of about size_mb to disk, returns the resource count"""
+    rng = random.Random(seed)
+    target = size_mb * 1024 * 1024
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"resourceType": "Bundle", "type": "collection", "entry": [')
+        for resource_dict in _fixed_resources(rng):
+            f.write(("," if count else "") + json.dumps({'fullUrl': f"urn:uuid:{count}", 'resource': resource_dict}, ensure_ascii=False))
+            count += 1
+        while f.tell() < target:
+            f.write("," + json.dumps({'fullUrl': f"urn:uuid:{count}", 'resource': _observation(rng, count)}, ensure_ascii=False))
+            count += 1
+        f.write("]}")
+    return count
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _stream(path: str, results):
+    logging.getLogger("services").setLevel(logging.WARNING)
+    from services.document_service import DocumentService
+    service = DocumentService()
+    start = time.perf_counter()
+    chunks = 0
+    chars = 0
+    for chunk in service.process_file(path, "p1", os.path.basename(path)):
+        chunks += 1
+        chars += len(chunk['text'])
+    results.put({'seconds': time.perf_counter() - start, 'chunks': chunks, 'chars': chars, 'peak_rss_mb': _peak_rss_mb()})
+
+
+def _load_whole(path: str, results):
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        data = json.load(f)
+    entries = len(data['entry'])
+    results.put({'seconds': time.perf_counter() - start, 'entries': entries, 'peak_rss_mb': _peak_rss_mb()})
+
+
+def _run(target, path: str) -> Dict[str, Any]:
+    """Run a measurement in a fresh process so its peak RSS is its own"""
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    process = ctx.Process(target=target, args=(path, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark streaming FHIR Bundle ingestion")
+    parser.add_argument("--sizes-mb", type=lambda v: [int(x) for x in v.split(",")], default=[20, 100])
+    parser.add_argument("--skip-whole", action="store_true", help="do not measure json.load of the whole bundle")
+    parser.add_argument("--workdir", help="directory for the generated bundles (default: temp dir)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    workdir = args.workdir or tempfile.mkdtemp(prefix="ai-bench-fhir-")
+    os.makedirs(workdir, exist_ok=True)
+
+    rows = []
+    for size_mb in args.sizes_mb:
+        path = os.path.join(workdir, f"bundle-{size_mb}mb.json")
+        resources = write_bundle(path, size_mb, args.seed)
+        megabytes = os.path.getsize(path) / (1024 * 1024)
+        logger.info(f"Wrote {path}: {resources} resources, {megabytes:.1f} MB")
+
+        streamed = _run(_stream, path)
+        row = {
+            'size_mb': round(megabytes, 1),
+            'resources': resources,
+            'chunks': streamed['chunks'],
+            'seconds': round(streamed['seconds'], 2),
+            'mb_per_sec': round(megabytes / streamed['seconds'], 1),
+            'chunks_per_sec': round(streamed['chunks'] / streamed['seconds'], 1),
+            'stream_peak_rss_mb': round(streamed['peak_rss_mb'], 1)
+        }
+        if not args.skip_whole:
+            row['whole_peak_rss_mb'] = round(_run(_load_whole, path)['peak_rss_mb'], 1)
+        rows.append(row)
+        os.remove(path)
+
+    print(f"\n{'MB':>7s} {'resources':>10s} {'chunks':>7s} {'MB/s':>6s} {'chunks/s':>9s} {'stream RSS':>11s} {'json.load RSS':>14s}")
+    for row in rows:
+        whole = f"{row['whole_peak_rss_mb']:14.1f}" if 'whole_peak_rss_mb' in row else f"{'-':>14s}"
+        print(
+            f"{row['size_mb']:7.1f} {row['resources']:10d} {row['chunks']:7d} {row['mb_per_sec']:6.1f} "
+            f"{row['chunks_per_sec']:9.1f} {row['stream_peak_rss_mb']:11.1f} {whole}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({'results': rows}, f, indent=2)
+        logger.info(f"Wrote results to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
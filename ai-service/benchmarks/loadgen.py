@@ -0,0 +1,156 @@
+"""Load generator replaying chat/report/upload mixes against the AI service.
+
+Runs closed-loop workers at increasing concurrency levels and reports
+p50/p95/p99 latency and throughput per endpoint for every level.
+
+Usage (from the ai-service directory):
+    python -m benchmarks.loadgen --url http://localhost:8000 \\
+        --concurrency 1,2,4,8,16 --duration 30 --mix chat=0.8,report=0.15,upload=0.05
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import httpx
+import numpy as np
+
+from benchmarks.run import CHAT_QUESTIONS
+
+DEFAULT_UPLOAD_DIR = Path(__file__).resolve().parents[2] / "sample-data" / "patient1"
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Parse 'chat=0.8,report=0.2' into normalised weights"""
+    mix = {}
+    for part in value.split(","):
+        name, weight = part.split("=")
+        if name not in ("chat", "report", "upload"):
+            raise argparse.ArgumentTypeError(f"Unknown request type: {name}")
+        mix[name] = float(weight)
+    total = sum(mix.values())
+    return {name: weight / total for name, weight in mix.items()}
+
+
+class LoadGenerator:
+    """Replays a weighted request mix with a fixed number of concurrent workers"""
+
+    def __init__(self, url: str, patient_ids: List[str], mix: Dict[str, float], upload_files: List[Path], seed: int, timeout: float):
+        self.url = url.rstrip("/")
+        self.patient_ids = patient_ids
+        self.mix = mix
+        self.upload_files = [(f.name, f.read_bytes()) for f in upload_files]
+        self.seed = seed
+        self.timeout = timeout
+
+    async def _request(self, client: httpx.AsyncClient, kind: str, rng: random.Random) -> int:
+        patient_id = rng.choice(self.patient_ids)
+        if kind == "chat":
+            response = await client.post("/chat", json={"patient_id": patient_id, "question": rng.choice(CHAT_QUESTIONS)})
+        elif kind == "report":
+            response = await client.post("/generate-report", json={"patient_id": patient_id})
+        else:
+            files = [("files", (name, content)) for name, content in self.upload_files]
+            response = await client.post("/upload", params={"patient_id": f"loadtest-{patient_id}"}, files=files)
+        return response.status_code
+
+    async def _worker(self, worker_id: int, concurrency: int, deadline: float, client, samples: List[Tuple[str, float, bool]]):
+        # Each worker has its own seeded RNG so runs replay the same sequence
+        rng = random.Random(f"{self.seed}:{concurrency}:{worker_id}")
+        kinds, weights = zip(*self.mix.items())
+        while time.perf_counter() < deadline:
+            kind = rng.choices(kinds, weights)[0]
+            start = time.perf_counter()
+            try:
+                status = await self._request(client, kind, rng)
+                ok = status < 400
+            except httpx.HTTPError:
+                ok = False
+            samples.append((kind, time.perf_counter() - start, ok))
+
+    async def run_level(self, concurrency: int, duration: float) -> Dict[str, Dict[str, float]]:
+        """Run one concurrency level and summarise latencies per request type"""
+        samples: List[Tuple[str, float, bool]] = []
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=self.url, timeout=self.timeout, limits=limits) as client:
+            start = time.perf_counter()
+            deadline = start + duration
+            await asyncio.gather(*[
+                self._worker(i, concurrency, deadline, client, samples) for i in range(concurrency)
+            ])
+            elapsed = time.perf_counter() - start
+
+        summary = {}
+        for kind in sorted(set(k for k, _, _ in samples)) + ["all"]:
+            selected = [(d, ok) for k, d, ok in samples if kind == "all" or k == kind]
+            latencies = np.array([d for d, ok in selected if ok]) * 1000
+            errors = sum(1 for _, ok in selected if not ok)
+            summary[kind] = {
+                "requests": len(selected),
+                "errors": errors,
+                "throughput_rps": round((len(selected) - errors) / elapsed, 3),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 1) if len(latencies) else None,
+                "p95_ms": round(float(np.percentile(latencies, 95)), 1) if len(latencies) else None,
+                "p99_ms": round(float(np.percentile(latencies, 99)), 1) if len(latencies) else None,
+            }
+        return summary
+
+
+def _print_level(concurrency: int, summary: Dict[str, Dict[str, float]]):
+    print(f"\nconcurrency={concurrency}")
+    print(f"  {'type':8s} {'requests':>8s} {'errors':>6s} {'rps':>8s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}")
+    for kind, stats in summary.items():
+        print(
+            f"  {kind:8s} {stats['requests']:8d} {stats['errors']:6d} {stats['throughput_rps']:8.2f} "
+            f"{stats['p50_ms'] or 0:9.1f} {stats['p95_ms'] or 0:9.1f} {stats['p99_ms'] or 0:9.1f}"
+        )
+
+
+async def _main(args) -> int:
+    patient_ids = args.patients.split(",") if args.patients else None
+    if not patient_ids:
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+            response = await client.get("/patients")
+            response.raise_for_status()
+            patient_ids = [p["patient_id"] for p in response.json()]
+    if not patient_ids:
+        print("No patients available, pass --patients", file=sys.stderr)
+        return 1
+
+    upload_files = sorted(p for p in Path(args.upload_dir).iterdir() if p.is_file())
+    generator = LoadGenerator(args.url, patient_ids, args.mix, upload_files, args.seed, args.timeout)
+
+    results = []
+    for concurrency in args.concurrency:
+        summary = await generator.run_level(concurrency, args.duration)
+        _print_level(concurrency, summary)
+        results.append({"concurrency": concurrency, "results": summary})
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"url": args.url, "mix": args.mix, "duration_s": args.duration, "levels": results}, f, indent=2)
+        print(f"\nWrote results to {args.output}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the AI service")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=lambda v: [int(c) for c in v.split(",")], default=[1, 2, 4, 8])
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per concurrency level")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("chat=0.8,report=0.15,upload=0.05"))
+    parser.add_argument("--patients", help="comma-separated patient ids (default: GET /patients)")
+    parser.add_argument("--upload-dir", default=str(DEFAULT_UPLOAD_DIR), help="files sent with upload requests")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(_main(args)))
+
+
+if __name__ == "__main__":
+    main()
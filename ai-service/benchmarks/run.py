@@ -0,0 +1,329 @@
+"""Offline benchmark suite for the AI service.
+
+Runs on a CPU-only machine without network access: Qdrant runs in local
+in-memory mode, the LLM is replaced by an in-process stub and, if the local
+sentence-transformers model is unavailable, embeddings fall back to a
+deterministic hashing embedder.
+
+Usage (from the ai-service directory):
+    python -m benchmarks.run --patients 50 --output bench-results.json
+    python -m benchmarks.run --baseline benchmarks/baseline.json
+    python -m benchmarks.run --save-baseline benchmarks/baseline.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Any, List
+
+import numpy as np
+
+from benchmarks.synthetic import generate_corpus
+from benchmarks.stubs import HashingEmbedder, StubLLMClient
+
+logger = logging.getLogger("benchmarks")
+
+CHAT_QUESTIONS = [
+    "Wie heißt der Patient?",
+    "Welche Diagnosen wurden gestellt?",
+    "Welche Medikamente erhält der Patient?",
+    "Wie war der Troponin-Verlauf?",
+    "Welche Prozeduren wurden durchgeführt?",
+    "Gibt es Allergien?",
+]
+
+
+class BenchmarkResults:
+    """Collects metrics with their unit and preferred direction"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, name: str, value: float, unit: str, better: str):
+        self.metrics[name] = {'value': round(float(value), 4), 'unit': unit, 'better': better}
+        logger.info(f"{name}: {value:.4f} {unit}")
+
+    def add_latencies(self, name: str, durations: List[float]):
+        millis = np.array(durations) * 1000
+        self.add(f"{name}.p50_ms", np.percentile(millis, 50), "ms", "lower")
+        self.add(f"{name}.p95_ms", np.percentile(millis, 95), "ms", "lower")
+
+
+def _repeat(fn: Callable[[], Any], min_time: float, min_runs: int = 3) -> List[float]:
+    """Run fn until both min_time seconds and min_runs runs have elapsed"""
+    durations = []
+    deadline = time.perf_counter() + min_time
+    while len(durations) < min_runs or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def _load_corpus(corpus_dir: Path) -> Dict[str, Dict[str, bytes]]:
+    """Read all patient files of the corpus into memory"""
+    corpus = {}
+    for patient_dir in sorted(corpus_dir.iterdir()):
+        if patient_dir.is_dir():
+            corpus[patient_dir.name] = {f.name: f.read_bytes() for f in sorted(patient_dir.iterdir())}
+    return corpus
+
+
+def bench_chunking(results: BenchmarkResults, document_service, corpus, min_time: float):
+    """Chunking throughput for text files and JSON rendering throughput"""
+    texts = [(pid, name, content) for pid, files in corpus.items() for name, content in files.items() if name.endswith('.txt')]
+    jsons = [(pid, name, content) for pid, files in corpus.items() for name, content in files.items() if name.endswith('.json')]
+
+    text_bytes = sum(len(content) for _, _, content in texts)
+    chunk_count = sum(len(document_service.process_text(c, p, n)) for p, n, c in texts)
+    durations = _repeat(lambda: [document_service.process_text(c, p, n) for p, n, c in texts], min_time)
+    best = min(durations)
+    results.add("chunking.text.mb_per_s", text_bytes / best / 1e6, "MB/s", "higher")
+    results.add("chunking.text.chunks_per_s", chunk_count / best, "chunks/s", "higher")
+
+    durations = _repeat(lambda: [document_service.process_json(c, p, n) for p, n, c in jsons], min_time)
+    results.add("chunking.json.docs_per_s", len(jsons) / min(durations), "docs/s", "higher")
+
+
+def bench_embedding(results: BenchmarkResults, embedding_service, sample_texts: List[str], min_time: float):
+    """Embedding throughput per available offline backend"""
+    backends = {'hashing': HashingEmbedder(embedding_service.get_embedding_dimension())}
+    try:
+        from sentence_transformers import SentenceTransformer
+        backends['local'] = SentenceTransformer("all-MiniLM-L6-v2")
+    except Exception as e:
+        logger.info(f"Skipping local sentence-transformers benchmark: {str(e)}")
+
+    original_client = embedding_service.client
+    try:
+        for name, client in backends.items():
+            embedding_service.client = client
+            durations = _repeat(lambda: embedding_service.create_embeddings(sample_texts), min_time, min_runs=1)
+            results.add(f"embedding.{name}.texts_per_s", len(sample_texts) / min(durations), "texts/s", "higher")
+    finally:
+        embedding_service.client = original_client
+
+
+def bench_ingest(results: BenchmarkResults, document_service, rag_service, corpus):
+    """Parse, embed and upsert the whole corpus"""
+    total_chunks = 0
+    duplicates = 0
+    start = time.perf_counter()
+    for patient_id, files in corpus.items():
+        chunks = []
+        for name, content in files.items():
+            if name.endswith('.json'):
+                chunks.extend(document_service.process_json(content, patient_id, name))
+            elif name.endswith('.txt'):
+                chunks.extend(document_service.process_text(content, patient_id, name))
+        if chunks:
+            duplicates += rag_service.store_documents(patient_id, chunks)['duplicates']
+            total_chunks += len(chunks)
+    elapsed = time.perf_counter() - start
+    results.add("ingest.chunks_per_s", total_chunks / elapsed, "chunks/s", "higher")
+    if rag_service.dedup:
+        results.add("ingest.dedup_ratio", duplicates / max(1, total_chunks), "ratio", "higher")
+    return total_chunks
+
+
+def bench_search(results: BenchmarkResults, embedding_service, qdrant_service, patient_ids, queries: int, rng):
+    """Patient-filtered vector search latency"""
+    vectors = [embedding_service.create_embedding(q) for q in CHAT_QUESTIONS]
+    durations = []
+    for _ in range(queries):
+        vector = rng.choice(vectors)
+        patient_id = rng.choice(patient_ids)
+        start = time.perf_counter()
+        qdrant_service.search(query_vector=vector, patient_id=patient_id, limit=10, score_threshold=0.1)
+        durations.append(time.perf_counter() - start)
+    results.add_latencies("search.filtered", durations)
+
+
+def bench_end_to_end(results: BenchmarkResults, app, patient_ids, requests_per_endpoint: int, rng):
+    """End-to-end /chat and /generate-report latency with a stubbed LLM"""
+    from fastapi.testclient import TestClient
+
+    client = TestClient(app)
+
+    durations = []
+    for _ in range(requests_per_endpoint):
+        body = {'patient_id': rng.choice(patient_ids), 'question': rng.choice(CHAT_QUESTIONS)}
+        start = time.perf_counter()
+        response = client.post('/chat', json=body)
+        durations.append(time.perf_counter() - start)
+        response.raise_for_status()
+    results.add_latencies("e2e.chat", durations)
+
+    durations = []
+    for _ in range(requests_per_endpoint):
+        start = time.perf_counter()
+        response = client.post('/generate-report', json={'patient_id': rng.choice(patient_ids)})
+        durations.append(time.perf_counter() - start)
+        response.raise_for_status()
+    results.add_latencies("e2e.report", durations)
+
+
+def bench_mmr(results: BenchmarkResults, rag_service, patient_ids, requests: int, rng):
+    """Prompt size and chat latency with and without MMR selection"""
+    completions = rag_service.llm_client.chat.completions
+    original = rag_service.mmr_enabled
+    queries = [(rng.choice(patient_ids), rng.choice(CHAT_QUESTIONS)) for _ in range(requests)]
+    try:
+        for label, enabled in (("similarity", False), ("mmr", True)):
+            rag_service.mmr_enabled = enabled
+            durations, prompt_chars = [], []
+            for patient_id, question in queries:
+                start = time.perf_counter()
+                rag_service.query(patient_id, question)
+                durations.append(time.perf_counter() - start)
+                prompt_chars.append(completions.last_prompt_chars)
+            results.add(f"retrieval.{label}.prompt_chars", np.mean(prompt_chars), "chars", "lower")
+            results.add_latencies(f"retrieval.{label}.chat", durations)
+    finally:
+        rag_service.mmr_enabled = original
+
+
+def bench_report_modes(results: BenchmarkResults, report_service, patient_ids, requests: int, rng):
+    """Report latency with one prompt vs. concurrently generated sections"""
+    original = report_service.report_mode
+    selected = [rng.choice(patient_ids) for _ in range(requests)]
+    try:
+        for mode in ("single", "sections"):
+            report_service.report_mode = mode
+            durations = []
+            for patient_id in selected:
+                start = time.perf_counter()
+                report_service.generate_report(patient_id)
+                durations.append(time.perf_counter() - start)
+            results.add_latencies(f"report.{mode}", durations)
+    finally:
+        report_service.report_mode = original
+
+
+def compare_to_baseline(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return a description of every metric that regressed beyond the tolerance"""
+    regressions = []
+    for name, base in baseline.get('metrics', {}).items():
+        if name not in current['metrics']:
+            continue
+        value = current['metrics'][name]['value']
+        reference = base['value']
+        if base['better'] == 'lower':
+            regressed = value > reference * (1 + tolerance)
+        else:
+            regressed = value < reference * (1 - tolerance)
+
+        change = (value - reference) / reference * 100 if reference else 0.0
+        marker = "REGRESSION" if regressed else "ok"
+        print(f"{name:40s} {reference:12.4f} -> {value:12.4f} {base['unit']:9s} {change:+7.1f}%  {marker}")
+        if regressed:
+            regressions.append(f"{name}: {reference} -> {value} {base['unit']}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark suite for the AI service")
+    parser.add_argument("--patients", type=int, default=30, help="number of synthetic patients")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--min-time", type=float, default=1.0, help="minimum seconds per micro-benchmark")
+    parser.add_argument("--search-queries", type=int, default=200)
+    parser.add_argument("--e2e-requests", type=int, default=30)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="stubbed LLM latency in seconds")
+    parser.add_argument("--output", default="bench-results.json", help="where to write the results")
+    parser.add_argument("--baseline", help="baseline results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--save-baseline", help="also write the results as a new baseline")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    # Keep per-request service logging out of the measurements
+    logging.getLogger("services").setLevel(logging.WARNING)
+    logging.getLogger("main").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    workdir = Path(tempfile.mkdtemp(prefix="ai-bench-"))
+    corpus_dir = workdir / "sample-data"
+    patient_ids = generate_corpus(str(corpus_dir), args.patients, seed=args.seed)
+
+    # Services read their configuration at import time
+    os.environ["MODEL_TYPE"] = "local"
+    os.environ["QDRANT_LOCATION"] = ":memory:"
+    os.environ["SAMPLE_DATA_DIR"] = str(corpus_dir)
+    os.environ["CHUNK_STORE_DIR"] = str(workdir / "chunks")
+    import main as app_module
+
+    embedding_service = app_module.embedding_service
+    if embedding_service.client is None:
+        embedding_service.client = HashingEmbedder(embedding_service.get_embedding_dimension())
+        embedding_service.embedding_model = "hashing"
+
+    for service in (app_module.rag_service, app_module.report_service):
+        service.llm_client = StubLLMClient(latency=args.llm_latency)
+        service.llm_model = "stub"
+        service.model_type = "stub"
+
+    rng = random.Random(args.seed)
+    corpus = _load_corpus(corpus_dir)
+    results = BenchmarkResults()
+
+    bench_chunking(results, app_module.document_service, corpus, args.min_time)
+
+    sample_texts = [
+        chunk['text']
+        for patient_id, files in list(corpus.items())[:10]
+        for name, content in files.items() if name.endswith('.txt')
+        for chunk in app_module.document_service.process_text(content, patient_id, name)
+    ]
+    bench_embedding(results, embedding_service, sample_texts, args.min_time)
+
+    total_chunks = bench_ingest(results, app_module.document_service, app_module.rag_service, corpus)
+    bench_search(results, embedding_service, app_module.rag_service.qdrant_service, patient_ids, args.search_queries, rng)
+    bench_end_to_end(results, app_module.app, patient_ids, args.e2e_requests, rng)
+    bench_mmr(results, app_module.rag_service, patient_ids, args.e2e_requests, rng)
+    bench_report_modes(results, app_module.report_service, patient_ids, args.e2e_requests, rng)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'patients': args.patients,
+            'chunks': total_chunks,
+            'embedding_model': embedding_service.embedding_model,
+            'llm_latency_s': args.llm_latency,
+        },
+        'metrics': results.metrics
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Wrote results to {args.output}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Saved baseline to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+"""Serialization and transport overhead between backend and AI service.
+
+Part one encodes and decodes typical chat and report responses with the
+previous FastAPI default (jsonable_encoder + json.dumps), orjson and
+MessagePack and reports time per response and body size. Part two serves
+the same responses from a local uvicorn and measures the latency per request
+for a new connection per request with JSON (the old backend client) against
+keep-alive connections with orjson and MessagePack.
+
+Usage (from the ai-service directory):
+    python -m benchmarks.serialization --sources 10 --requests 500
+"""
+import sys
+import json
+import time
+import random
+import socket
+import logging
+import argparse
+import threading
+import statistics
+from typing import Dict, Any, List, Callable
+
+import msgpack
+import orjson
+import requests
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from benchmarks.sidecar import WORDS
+from services.serialization import MSGPACK_MEDIA_TYPE, encode, negotiated_response
+
+logger = logging.getLogger("benchmarks")
+
+
+class ChatResponse(BaseModel):
+    answer: str
+    sources: List[Dict[str, Any]]
+    timestamp: str
+
+
+class ReportResponse(BaseModel):
+    report: Dict[str, Any]
+    timestamp: str
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(WORDS, k=words))
+
+
+def chat_response(sources: int, seed: int) -> ChatResponse:
+    rng = random.Random(seed)
+    return ChatResponse(
+        answer=_sentence(rng, 120),
+        sources=[
+            {
+                'source': f"dokument_{i}.pdf",
+                'section': rng.choice(["Anamnese", "Befund", "Verlauf", "Labor"]),
+                'score': rng.random(),
+                'text': _sentence(rng, 110)
+            }
+            for i in range(sources)
+        ],
+        timestamp="2024-01-01T12:00:00"
+    )
+
+
+def report_response(seed: int) -> ReportResponse:
+    rng = random.Random(seed)
+    return ReportResponse(
+        report={
+            'patientInfo': {
+                'name': "Max Mustermann", 'age': 67, 'gender': "männlich",
+                'admissionDate': "2024-01-01", 'dischargeDate': "2024-01-09",
+                'lengthOfStay': 8, 'department': "Kardiologie"
+            },
+            'admissionReason': _sentence(rng, 60),
+            'diagnoses': {'primary': _sentence(rng, 8), 'secondary': [_sentence(rng, 6) for _ in range(6)]},
+            'clinicalCourse': _sentence(rng, 400),
+            'therapy': _sentence(rng, 150),
+            'medications': [
+                {'name': rng.choice(WORDS), 'dose': "5 mg", 'frequency': "1-0-0", 'note': _sentence(rng, 8)}
+                for _ in range(10)
+            ],
+            'labs': {
+                'summary': _sentence(rng, 80),
+                'notable': [{'parameter': rng.choice(WORDS), 'value': round(rng.uniform(0, 200), 1)} for _ in range(15)]
+            },
+            'recommendations': {
+                'followUp': [_sentence(rng, 12) for _ in range(4)],
+                'ambulatory': [_sentence(rng, 12) for _ in range(4)],
+                'lifestyle': [_sentence(rng, 12) for _ in range(3)]
+            }
+        },
+        timestamp="2024-01-01T12:00:00"
+    )
+
+
+def _fastapi_default(model: BaseModel) -> bytes:
+    # What JSONResponse rendered for response_model endpoints before
+    return json.dumps(
+        jsonable_encoder(model), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+ENCODERS: Dict[str, Callable[[BaseModel], bytes]] = {
+    'json': _fastapi_default,
+    'orjson': lambda model: encode(model, msgpack_format=False),
+    'msgpack': lambda model: encode(model, msgpack_format=True)
+}
+
+DECODERS: Dict[str, Callable[[bytes], Any]] = {
+    'json': json.loads,
+    'orjson': orjson.loads,
+    'msgpack': msgpack.unpackb
+}
+
+
+def _per_call_us(fn: Callable, arg: Any, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(arg)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def bench_codecs(payloads: Dict[str, BaseModel], iterations: int) -> List[Dict[str, Any]]:
+    rows = []
+    for name, model in payloads.items():
+        for fmt, encoder in ENCODERS.items():
+            body = encoder(model)
+            rows.append({
+                'payload': name,
+                'format': fmt,
+                'bytes': len(body),
+                'encode_us': round(_per_call_us(encoder, model, iterations), 1),
+                'decode_us': round(_per_call_us(DECODERS[fmt], body, iterations), 1)
+            })
+    return rows
+
+
+def _app(payloads: Dict[str, BaseModel]) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/default/{name}")
+    async def default(name: str):
+        return payloads[name]
+
+    @app.get("/negotiated/{name}")
+    async def negotiated(name: str, http_request: Request):
+        return negotiated_response(http_request, payloads[name])
+
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def bench_transport(payloads: Dict[str, BaseModel], count: int) -> List[Dict[str, Any]]:
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(_app(payloads), host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    base = f"http://127.0.0.1:{port}"
+    modes = [
+        ('json, new connection', "default", {'Connection': "close"}, json.loads, False),
+        ('orjson, keep-alive', "negotiated", {}, orjson.loads, True),
+        ('msgpack, keep-alive', "negotiated", {'Accept': MSGPACK_MEDIA_TYPE}, msgpack.unpackb, True)
+    ]
+
+    rows = []
+    try:
+        for name in payloads:
+            for label, route, headers, decode, keep_alive in modes:
+                session = requests.Session() if keep_alive else None
+                latencies = []
+                for _ in range(count):
+                    start = time.perf_counter()
+                    response = (session or requests).get(f"{base}/{route}/{name}", headers=headers)
+                    decode(response.content)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                if session:
+                    session.close()
+                latencies.sort()
+                rows.append({
+                    'payload': name,
+                    'mode': label,
+                    'bytes': len(response.content),
+                    'mean_ms': round(statistics.mean(latencies), 3),
+                    'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 3)
+                })
+    finally:
+        server.should_exit = True
+        thread.join()
+    return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark response serialization and transport")
+    parser.add_argument("--sources", type=int, default=10, help="sources in the chat response")
+    parser.add_argument("--iterations", type=int, default=2000, help="encode/decode calls per format")
+    parser.add_argument("--requests", type=int, default=500, help="HTTP requests per mode")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    payloads = {'chat': chat_response(args.sources, args.seed), 'report': report_response(args.seed)}
+
+    logger.info(f"Encoding and decoding each payload {args.iterations} times per format")
+    codecs = bench_codecs(payloads, args.iterations)
+    print(f"\n{'payload':8s} {'format':8s} {'bytes':>7s} {'encode µs':>10s} {'decode µs':>10s}")
+    for row in codecs:
+        print(f"{row['payload']:8s} {row['format']:8s} {row['bytes']:7d} {row['encode_us']:10.1f} {row['decode_us']:10.1f}")
+
+    logger.info(f"Sending {args.requests} requests per payload and mode")
+    transport = bench_transport(payloads, args.requests)
+    print(f"\n{'payload':8s} {'mode':22s} {'bytes':>7s} {'mean ms':>8s} {'p95 ms':>8s}")
+    for row in transport:
+        print(f"{row['payload']:8s} {row['mode']:22s} {row['bytes']:7d} {row['mean_ms']:8.3f} {row['p95_ms']:8.3f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({'sources': args.sources, 'codecs': codecs, 'transport': transport}, f, indent=2)
+        logger.info(f"Wrote results to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""Memory and throughput of the embedding sidecar vs. in-process models.
+
+Starts N worker processes that embed texts concurrently, once with the
+model loaded in every worker and once with all workers sharing one
+embedding sidecar, and reports the summed RSS of all processes together
+with the embedding throughput. Offline the hashing embedder stands in for
+the model, which keeps the RSS difference small; with sentence-transformers
+installed every in-process worker carries its own copy of torch and the model.
+
+Usage (from the ai-service directory):
+    python -m benchmarks.sidecar --workers 4 --threads 4 --texts 2000 --batch-size 1
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from benchmarks.stubs import HashingEmbedder
+
+logger = logging.getLogger("benchmarks")
+
+WORDS = (
+    "Patient Aufnahme Diagnose Therapie Verlauf Labor Troponin Kreatinin Hämoglobin Entlassung "
+    "Medikation Blutdruck Herzfrequenz Fieber Antibiose Koronarangiographie Stent Pneumonie "
+    "Niereninsuffizienz Diabetes Metformin Ramipril Bisoprolol Kontrolle Empfehlung"
+).split()
+
+
+def _texts(count: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(8, 40))) for _ in range(count)]
+
+
+def _rss_mb(pid: Optional[int] = None) -> float:
+    with open(f"/proc/{pid or 'self'}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _embedding_service(use_sidecar: bool):
+    logging.getLogger("services").setLevel(logging.WARNING)
+    from services.embedding_service import EmbeddingService
+    service = EmbeddingService(use_sidecar=use_sidecar)
+    if service.client is None:
+        service.client = HashingEmbedder(service.get_embedding_dimension())
+        service.embedding_model = "hashing"
+    return service
+
+
+def _sidecar_process(socket_path: str):
+    from services.embedding_sidecar import EmbeddingSidecarServer
+    EmbeddingSidecarServer(_embedding_service(use_sidecar=False), socket_path).serve_forever()
+
+
+def _worker_process(mode: str, socket_path: str, texts: List[str], batch_size: int, threads: int, barrier, results):
+    if mode == "sidecar":
+        os.environ["EMBEDDING_SIDECAR_SOCKET"] = socket_path
+    service = _embedding_service(use_sidecar=mode == "sidecar")
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+
+    barrier.wait()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(service.create_embeddings, batches))
+    results.put({'texts': len(texts), 'seconds': time.perf_counter() - start, 'rss_mb': _rss_mb()})
+
+
+def bench_mode(mode: str, args, texts: List[str], workdir: str) -> Dict[str, Any]:
+    """Run all workers in one mode and collect RSS and throughput"""
+    ctx = multiprocessing.get_context("spawn")
+    socket_path = os.path.join(workdir, "embedding.sock")
+    sidecar = None
+    if mode == "sidecar":
+        sidecar = ctx.Process(target=_sidecar_process, args=(socket_path,), daemon=True)
+        sidecar.start()
+
+    barrier = ctx.Barrier(args.workers + 1)
+    results = ctx.Queue()
+    per_worker = len(texts) // args.workers
+    workers = [
+        ctx.Process(
+            target=_worker_process,
+            args=(mode, socket_path, texts[i * per_worker:(i + 1) * per_worker], args.batch_size, args.threads, barrier, results)
+        )
+        for i in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    barrier.wait()
+    start = time.perf_counter()
+    rows = [results.get() for _ in workers]
+    wall = time.perf_counter() - start
+    sidecar_rss = _rss_mb(sidecar.pid) if sidecar else 0.0
+
+    for worker in workers:
+        worker.join()
+    if sidecar:
+        sidecar.terminate()
+        sidecar.join()
+
+    workers_rss = sum(row['rss_mb'] for row in rows)
+    total_texts = sum(row['texts'] for row in rows)
+    return {
+        'mode': mode,
+        'workers': args.workers,
+        'texts': total_texts,
+        'texts_per_sec': round(total_texts / wall, 1),
+        'workers_rss_mb': round(workers_rss, 1),
+        'sidecar_rss_mb': round(sidecar_rss, 1),
+        'total_rss_mb': round(workers_rss + sidecar_rss, 1)
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the embedding sidecar against in-process models")
+    parser.add_argument("--workers", type=int, default=4, help="API worker processes")
+    parser.add_argument("--threads", type=int, default=4, help="concurrent requests per worker")
+    parser.add_argument("--texts", type=int, default=2000, help="texts embedded in total")
+    parser.add_argument("--batch-size", type=int, default=1, help="texts per request (1 = chat queries)")
+    parser.add_argument("--modes", type=lambda v: v.split(","), default=["inprocess", "sidecar"])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    os.environ.pop("EMBEDDING_SIDECAR_SOCKET", None)
+    texts = _texts(args.texts, args.seed)
+    workdir = tempfile.mkdtemp(prefix="ai-bench-sidecar-")
+
+    rows = []
+    for mode in args.modes:
+        logger.info(f"Running {mode} with {args.workers} workers x {args.threads} threads")
+        rows.append(bench_mode(mode, args, texts, workdir))
+
+    print(f"\n{'mode':10s} {'texts/s':>9s} {'workers MB':>11s} {'sidecar MB':>11s} {'total MB':>9s}")
+    for row in rows:
+        print(
+            f"{row['mode']:10s} {row['texts_per_sec']:9.1f} {row['workers_rss_mb']:11.1f} "
+            f"{row['sidecar_rss_mb']:11.1f} {row['total_rss_mb']:9.1f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({'batch_size': args.batch_size, 'threads': args.threads, 'results': rows}, f, indent=2)
+        logger.info(f"Wrote results to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,297 @@
+"""Deterministic stand-in for Ollama and OpenAI used for load testing.
+
+Speaks the Ollama /api/chat, /api/embed and /api/embeddings protocols and the
+OpenAI /v1/chat/completions and /v1/embeddings protocols, including streaming.
+Latency and output are derived from a hash of the request body and the seed,
+so identical runs produce identical timings and responses.
+
+Usage (from the ai-service directory):
+    python -m benchmarks.standin_server --port 11434 --latency-dist lognormal \\
+        --latency-ms 300 --latency-spread-ms 150 --tokens-per-sec 40
+
+Point the AI service at it with OLLAMA_BASE_URL=http://localhost:11434 or
+OPENAI_BASE_URL=http://localhost:11434/v1 (with any OPENAI_API_KEY).
+"""
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from benchmarks.stubs import HashingEmbedder, STUB_REPORT
+
+# Known embedding dimensions, other models use --embedding-dim
+MODEL_DIMENSIONS = {
+    "nomic-embed-text": 768,
+    "all-minilm": 384,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+WORDS = (
+    "Der Patient zeigt einen stabilen Verlauf unter der laufenden Therapie mit "
+    "regelmäßiger Kontrolle der Vitalparameter und Laborwerte sowie guter Mobilisation "
+    "ohne neue Beschwerden bei unauffälligem Befund und geplanter Entlassung"
+).split()
+
+
+class StandInConfig:
+    """Latency, token rate and output settings of the stand-in"""
+
+    def __init__(
+        self,
+        latency_dist: str = "fixed",
+        latency_ms: float = 200.0,
+        latency_spread_ms: float = 50.0,
+        tokens_per_sec: float = 50.0,
+        completion_tokens: int = 120,
+        embed_ms_per_text: float = 2.0,
+        embedding_dim: int = 384,
+        seed: int = 0
+    ):
+        self.latency_dist = latency_dist
+        self.latency_ms = latency_ms
+        self.latency_spread_ms = latency_spread_ms
+        self.tokens_per_sec = tokens_per_sec
+        self.completion_tokens = completion_tokens
+        self.embed_ms_per_text = embed_ms_per_text
+        self.embedding_dim = embedding_dim
+        self.seed = seed
+
+    def rng_for(self, body: Any) -> random.Random:
+        """Seeded RNG derived from the request body"""
+        digest = hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()
+        return random.Random(f"{self.seed}:{digest}")
+
+    def first_token_latency(self, rng: random.Random) -> float:
+        """Sample the time to first token in seconds"""
+        mean, spread = self.latency_ms, self.latency_spread_ms
+        if self.latency_dist == "uniform":
+            value = rng.uniform(mean - spread, mean + spread)
+        elif self.latency_dist == "normal":
+            value = rng.gauss(mean, spread)
+        elif self.latency_dist == "lognormal":
+            # Parameterised so that the median equals latency_ms
+            sigma = spread / mean if mean > 0 else 0.0
+            value = mean * rng.lognormvariate(0.0, sigma)
+        else:
+            value = mean
+        return max(0.0, value) / 1000
+
+
+def _completion_text(rng: random.Random, tokens: int, json_mode: bool) -> List[str]:
+    """Deterministic completion split into token-sized pieces"""
+    if json_mode:
+        text = json.dumps(STUB_REPORT, ensure_ascii=False)
+        size = max(1, len(text) // max(1, tokens))
+        return [text[i:i + size] for i in range(0, len(text), size)]
+    return [(" " if i else "") + rng.choice(WORDS) for i in range(tokens)]
+
+
+def _prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Rough prompt token estimate (~4 characters per token)"""
+    return sum(len(str(m.get("content", ""))) for m in messages) // 4 + 1
+
+
+def create_app(config: StandInConfig) -> FastAPI:
+    app = FastAPI(title="LLM stand-in", description="Deterministic Ollama/OpenAI stand-in for load tests")
+    embedders: Dict[int, HashingEmbedder] = {}
+
+    def embed(model: str, texts: List[str], dimensions: Optional[int] = None) -> List[List[float]]:
+        dim = dimensions or MODEL_DIMENSIONS.get(model.split(":")[0], config.embedding_dim)
+        if dim not in embedders:
+            embedders[dim] = HashingEmbedder(dim)
+        return embedders[dim].encode(texts).tolist()
+
+    def generate(body: Dict[str, Any], json_mode: bool):
+        """Sample the first-token latency, token interval and completion pieces"""
+        rng = config.rng_for(body)
+        ttft = config.first_token_latency(rng)
+        pieces = _completion_text(rng, config.completion_tokens, json_mode)
+        token_interval = 1.0 / config.tokens_per_sec if config.tokens_per_sec > 0 else 0.0
+        return ttft, token_interval, pieces
+
+    # ---- Ollama ----
+
+    @app.get("/api/tags")
+    async def ollama_tags():
+        return {"models": [{"name": name} for name in MODEL_DIMENSIONS]}
+
+    @app.post("/api/embeddings")
+    async def ollama_embeddings(request: Request):
+        body = await request.json()
+        await asyncio.sleep(config.embed_ms_per_text / 1000)
+        return {"embedding": embed(body.get("model", ""), [body.get("prompt", "")])[0]}
+
+    @app.post("/api/embed")
+    async def ollama_embed(request: Request):
+        body = await request.json()
+        inputs = body.get("input", "")
+        texts = [inputs] if isinstance(inputs, str) else list(inputs)
+        await asyncio.sleep(config.embed_ms_per_text * len(texts) / 1000)
+        return {"model": body.get("model"), "embeddings": embed(body.get("model", ""), texts)}
+
+    @app.post("/api/chat")
+    async def ollama_chat(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        ttft, interval, pieces = generate(body, body.get("format") == "json")
+        prompt_tokens = _prompt_tokens(messages)
+
+        def final(total: float) -> Dict[str, Any]:
+            return {
+                "model": body.get("model"),
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "done": True,
+                "total_duration": int(total * 1e9),
+                "load_duration": 0,
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(ttft * 1e9),
+                "eval_count": len(pieces),
+                "eval_duration": int(interval * len(pieces) * 1e9),
+            }
+
+        if body.get("stream", True):
+            async def stream():
+                start = time.perf_counter()
+                await asyncio.sleep(ttft)
+                for piece in pieces:
+                    yield json.dumps({"model": body.get("model"), "message": {"role": "assistant", "content": piece}, "done": False}) + "\n"
+                    await asyncio.sleep(interval)
+                yield json.dumps({**final(time.perf_counter() - start), "message": {"role": "assistant", "content": ""}}) + "\n"
+
+            return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+        start = time.perf_counter()
+        await asyncio.sleep(ttft + interval * len(pieces))
+        return {**final(time.perf_counter() - start), "message": {"role": "assistant", "content": "".join(pieces)}}
+
+    # ---- OpenAI ----
+
+    @app.get("/v1/models")
+    async def openai_models():
+        return {"object": "list", "data": [{"id": name, "object": "model"} for name in MODEL_DIMENSIONS]}
+
+    @app.post("/v1/embeddings")
+    async def openai_embeddings(request: Request):
+        body = await request.json()
+        inputs = body.get("input", "")
+        texts = [inputs] if isinstance(inputs, str) else [str(item) for item in inputs]
+        await asyncio.sleep(config.embed_ms_per_text * len(texts) / 1000)
+        vectors = embed(body.get("model", ""), texts, body.get("dimensions"))
+        tokens = sum(len(text) // 4 + 1 for text in texts)
+        return JSONResponse(
+            {
+                "object": "list",
+                "model": body.get("model"),
+                "data": [{"object": "embedding", "index": i, "embedding": v} for i, v in enumerate(vectors)],
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            },
+            headers={
+                "x-ratelimit-remaining-tokens": "1000000",
+                "x-ratelimit-reset-tokens": "0s",
+            }
+        )
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        body = await request.json()
+        json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+        ttft, interval, pieces = generate(body, json_mode)
+        usage = {
+            "prompt_tokens": _prompt_tokens(body.get("messages", [])),
+            "completion_tokens": len(pieces),
+            "total_tokens": _prompt_tokens(body.get("messages", [])) + len(pieces),
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+        completion_id = f"chatcmpl-standin-{config.rng_for(body).getrandbits(32):08x}"
+        created = int(time.time())
+
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+            def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+                payload = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": body.get("model"),
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }
+                return f"data: {json.dumps(payload)}\n\n"
+
+            async def stream():
+                await asyncio.sleep(ttft)
+                yield chunk({"role": "assistant", "content": ""})
+                for piece in pieces:
+                    yield chunk({"content": piece})
+                    await asyncio.sleep(interval)
+                yield chunk({}, "stop")
+                if include_usage:
+                    payload = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": body.get("model"),
+                        "choices": [],
+                        "usage": usage,
+                    }
+                    yield f"data: {json.dumps(payload)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(stream(), media_type="text/event-stream")
+
+        await asyncio.sleep(ttft + interval * len(pieces))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": body.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(pieces)},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic Ollama/OpenAI stand-in server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "normal", "lognormal"], default="fixed")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="mean/median time to first token")
+    parser.add_argument("--latency-spread-ms", type=float, default=50.0, help="spread of the latency distribution")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0, help="generation rate after the first token")
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--embed-ms-per-text", type=float, default=2.0)
+    parser.add_argument("--embedding-dim", type=int, default=384, help="dimension for unknown embedding models")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = StandInConfig(
+        latency_dist=args.latency_dist,
+        latency_ms=args.latency_ms,
+        latency_spread_ms=args.latency_spread_ms,
+        tokens_per_sec=args.tokens_per_sec,
+        completion_tokens=args.completion_tokens,
+        embed_ms_per_text=args.embed_ms_per_text,
+        embedding_dim=args.embedding_dim,
+        seed=args.seed
+    )
+
+    import uvicorn
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import re
+import json
+import time
+import zlib
+from types import SimpleNamespace
+from typing import List, Union
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+class HashingEmbedder:
+    """Deterministic bag-of-words embedder with the SentenceTransformer encode() API"""
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in TOKEN_PATTERN.findall(text.lower()):
+            digest = zlib.crc32(token.encode("utf-8"))
+            sign = 1.0 if digest & 1 else -1.0
+            vector[(digest >> 1) % self.dimension] += sign
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0] = 1.0
+            return vector
+        return vector / norm
+
+    def encode(self, texts: Union[str, List[str]], convert_to_numpy: bool = True, show_progress_bar: bool = False):
+        if isinstance(texts, str):
+            return self._embed(texts)
+        return np.stack([self._embed(text) for text in texts])
+
+
+STUB_REPORT = {
+    "patientInfo": {
+        "name": "...",
+        "age": 0,
+        "gender": "...",
+        "admissionDate": "...",
+        "dischargeDate": "...",
+        "lengthOfStay": 0,
+        "department": "..."
+    },
+    "admissionReason": "Stub-Aufnahmegrund",
+    "diagnoses": {"primary": "Stub-Hauptdiagnose", "secondary": []},
+    "clinicalCourse": "Stub-Verlauf",
+    "therapy": "Stub-Therapie",
+    "medications": [],
+    "labs": {"summary": "Stub-Labor", "notable": []},
+    "recommendations": {"followUp": [], "ambulatory": [], "lifestyle": []}
+}
+
+
+class _StubCompletions:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.last_prompt_chars = 0
+
+    def create(self, model: str, messages: list, response_format: dict = None, **kwargs):
+        self.last_prompt_chars = sum(len(m.get("content", "")) for m in messages)
+        if self.latency:
+            time.sleep(self.latency)
+
+        if response_format and response_format.get("type") == "json_object":
+            content = json.dumps(STUB_REPORT, ensure_ascii=False)
+        else:
+            content = "Stub-Antwort basierend auf dem bereitgestellten Kontext."
+
+        prompt_tokens = self.last_prompt_chars // 4
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=len(content) // 4,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=0)
+        )
+
+        if kwargs.get("stream"):
+            words = content.split(" ")
+            chunks = [
+                SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=(" " if i else "") + word))], usage=None)
+                for i, word in enumerate(words)
+            ]
+            chunks.append(SimpleNamespace(choices=[], usage=usage))
+            return iter(chunks)
+
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=usage
+        )
+
+
+class StubLLMClient:
+    """In-process stand-in for the OpenAI client used by RAGService/ReportService"""
+
+    def __init__(self, latency: float = 0.0):
+        self.chat = SimpleNamespace(completions=_StubCompletions(latency))
@@ -0,0 +1,107 @@
+import re
+import json
+import random
+import shutil
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+# Repository sample data used as templates for synthetic patients
+DEFAULT_TEMPLATE_DIR = Path(__file__).resolve().parents[2] / "sample-data"
+
+FIRST_NAMES = ["Max", "Anna", "Peter", "Laura", "Thomas", "Sabine", "Lukas", "Monika", "Jonas", "Eva"]
+LAST_NAMES = ["Mustermann", "Schmidt", "Meier", "Keller", "Weber", "Huber", "Frei", "Brunner", "Baumann", "Graf"]
+
+NUMBER_PATTERN = re.compile(r"(?<![\w.])(\d+\.\d+)(?![\w.])")
+
+
+def generate_corpus(output_dir: str, num_patients: int, template_dir: str = None, seed: int = 42) -> List[str]:
+    """Scale the sample patients up to a synthetic corpus of num_patients patients"""
+    template_root = Path(template_dir) if template_dir else DEFAULT_TEMPLATE_DIR
+    templates = sorted(p for p in template_root.iterdir() if p.is_dir())
+    if not templates:
+        raise ValueError(f"No template patients found in {template_root}")
+
+    output = Path(output_dir)
+    if output.exists():
+        shutil.rmtree(output)
+    output.mkdir(parents=True)
+
+    rng = random.Random(seed)
+    patient_ids = []
+
+    for i in range(num_patients):
+        template = templates[i % len(templates)]
+        patient_id = f"synthetic{i:05d}"
+        patient_dir = output / patient_id
+        patient_dir.mkdir()
+
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        day_shift = rng.randint(-365, 0)
+
+        for source in template.iterdir():
+            target = patient_dir / source.name
+            if source.suffix == ".json":
+                data = json.loads(source.read_text(encoding="utf-8"))
+                target.write_text(
+                    json.dumps(_vary_patient_json(data, patient_id, name, day_shift, rng), ensure_ascii=False, indent=2),
+                    encoding="utf-8"
+                )
+            elif source.suffix == ".txt":
+                target.write_text(_vary_text(source.read_text(encoding="utf-8"), rng), encoding="utf-8")
+
+        patient_ids.append(patient_id)
+
+    logger.info(f"Generated {num_patients} synthetic patients in {output}")
+    return patient_ids
+
+
+def _vary_patient_json(data: dict, patient_id: str, name: str, day_shift: int, rng: random.Random) -> dict:
+    """Give a copied patient.json a new identity, age and shifted dates"""
+    data['patientId'] = patient_id
+    demographics = data.setdefault('demographics', {})
+    demographics['name'] = name
+    if isinstance(demographics.get('age'), int):
+        demographics['age'] = max(18, demographics['age'] + rng.randint(-15, 15))
+
+    admission = data.get('admission', {})
+    for key in ('admissionDate', 'dischargeDate'):
+        if admission.get(key):
+            admission[key] = _shift_date(admission[key], day_shift)
+
+    return data
+
+
+def _shift_date(value: str, days: int) -> str:
+    """Shift an ISO timestamp by a number of days"""
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        return (parsed + timedelta(days=days)).isoformat().replace('+00:00', 'Z')
+    except ValueError:
+        return value
+
+
+def _vary_text(text: str, rng: random.Random) -> str:
+    """Jitter decimal measurements so synthetic documents are not identical"""
+    def jitter(match):
+        value = float(match.group(1))
+        decimals = len(match.group(1).split('.')[1])
+        return f"{value * rng.uniform(0.9, 1.1):.{decimals}f}"
+
+    return NUMBER_PATTERN.sub(jitter, text)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic patient corpus")
+    parser.add_argument("output_dir")
+    parser.add_argument("--patients", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    generate_corpus(args.output_dir, args.patients, seed=args.seed)
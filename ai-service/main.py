@@ -1,8 +1,13 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, FileResponse
+from starlette.routing import Match
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 import logging
+import time
+import json
 from datetime import datetime
 import os
 
@@ -10,6 +15,17 @@ from services.embedding_service import EmbeddingService
 from services.rag_service import RAGService
 from services.report_service import ReportService
 from services.document_service import DocumentService
+from services.job_service import JobService
+from services.search_service import SearchService, InvalidCursorError
+from services.snapshot_service import SnapshotService
+from services.session_service import SessionService
+from services.profiling_service import ProfilingService
+from services.prefetch_service import PrefetchService
+from services.singleflight import SingleFlight, normalize_question, history_digest
+from services.llm_scheduler import LLMOverloadedError
+from services.metrics import render_metrics, collect_stages, REQUEST_DURATION, REQUESTS_IN_FLIGHT
+from services.tracing import setup_tracing, server_span
+from services.serialization import FastJSONResponse, negotiated_response
 
 # Configure logging
 logging.basicConfig(
@@ -18,11 +34,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Before any service is created, so their spans use the configured exporter
+setup_tracing()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Semantic Patient File AI Service",
     description="AI-powered patient file analysis with RAG",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # CORS middleware
@@ -34,11 +54,103 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+def _route_template(request: Request) -> str:
+    """Resolve the route path template to keep metric label cardinality low"""
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    """Track in-flight requests and request durations"""
+    endpoint = _route_template(request)
+    if endpoint == "/metrics":
+        return await call_next(request)
+
+    in_flight = REQUESTS_IN_FLIGHT.labels(endpoint)
+    in_flight.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        in_flight.dec()
+        REQUEST_DURATION.labels(endpoint, request.method, str(status)).observe(time.perf_counter() - start)
+
+
+profiling_service = ProfilingService()
+
+
+@app.middleware("http")
+async def profiling_middleware(request: Request, call_next):
+    """Profile requests that carry the admin header or are sampled"""
+    endpoint = _route_template(request)
+    if not profiling_service.wants_profile(endpoint, request.headers.get("x-profile")):
+        return await call_next(request)
+
+    try:
+        profiler = profiling_service.start()
+    except Exception as e:
+        # e.g. another sampler already runs in this thread; serve the request unprofiled
+        logger.error(f"Error starting profiler for {endpoint}: {str(e)}")
+        return await call_next(request)
+
+    start = time.perf_counter()
+    status = 500
+    with collect_stages() as stages, profiling_service.collect_threads() as thread_sessions:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+        finally:
+            profile_id = profiling_service.finish(
+                profiler, endpoint, request.method, status, time.perf_counter() - start, stages, thread_sessions
+            )
+    if profile_id:
+        response.headers["X-Profile-Id"] = profile_id
+    return response
+
+
+@app.middleware("http")
+async def tracing_middleware(request: Request, call_next):
+    """Root span per request, continuing the trace from the traceparent header"""
+    endpoint = _route_template(request)
+    if endpoint in ("/metrics", "/health"):
+        return await call_next(request)
+
+    with server_span(
+        f"{request.method} {endpoint}",
+        request.headers,
+        {'http.request.method': request.method, 'http.route': endpoint}
+    ) as current:
+        response = await call_next(request)
+        if current is not None:
+            current.set_attribute('http.response.status_code', response.status_code)
+        return response
+
+
 # Initialize services
 embedding_service = EmbeddingService()
 rag_service = RAGService(embedding_service)
 report_service = ReportService(embedding_service)
 document_service = DocumentService()
+job_service = JobService(document_service, rag_service)
+search_service = SearchService(embedding_service)
+snapshot_service = SnapshotService(embedding_service, rag_service.qdrant_service)
+session_service = SessionService()
+prefetch_service = PrefetchService(rag_service, report_service)
+single_flight = SingleFlight()
+
+# Upload limits
+UPLOAD_READ_SIZE = 1024 * 1024
+MAX_UPLOAD_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_MB", "250")) * 1024 * 1024
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_MB", "1000")) * 1024 * 1024
+SUPPORTED_EXTENSIONS = ('.json', '.pdf', '.txt')
 
 
 # Pydantic models
@@ -46,12 +158,14 @@ class ChatRequest(BaseModel):
     patient_id: str
     question: str
     conversation_history: Optional[List[Dict[str, str]]] = []
+    session_id: Optional[str] = None
 
 
 class ChatResponse(BaseModel):
     answer: str
     sources: List[Dict[str, Any]]
     timestamp: str
+    session_id: Optional[str] = None
 
 
 class ReportRequest(BaseModel):
@@ -63,6 +177,24 @@ class ReportResponse(BaseModel):
     timestamp: str
 
 
+class SearchRequest(BaseModel):
+    query: str
+    department: Optional[str] = None
+    sections: Optional[List[str]] = None
+    admitted_from: Optional[datetime] = None
+    admitted_to: Optional[datetime] = None
+    limit: int = 20
+    hits_per_patient: int = 3
+    score_threshold: float = 0.3
+    cursor: Optional[str] = None
+
+
+class PrefetchResponse(BaseModel):
+    patient_id: str
+    chunks: int
+    report: str
+
+
 class PatientInfo(BaseModel):
     patient_id: str
     name: str
@@ -74,12 +206,46 @@ class PatientInfo(BaseModel):
 
 
 class UploadResponse(BaseModel):
+    job_id: str
     patient_id: str
-    files_processed: int
-    chunks_created: int
+    status: str
+    files_queued: int
+    bytes_received: int
     message: str
 
 
+class JobFileStatus(BaseModel):
+    name: str
+    status: str
+    bytes: int
+    chunks: int
+    duplicates: int = 0
+    seconds: float
+    chunks_per_sec: float
+    bytes_per_sec: float
+    attempts: int
+    error: Optional[str]
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    patient_id: str
+    status: str
+    created_at: str
+    completed_at: Optional[str]
+    files_total: int
+    files_completed: int
+    chunks_created: int
+    chunks_deduplicated: int = 0
+    dedup_ratio: float = 0.0
+    embedding_tokens: int = 0
+    embedding_tokens_per_sec: float = 0.0
+    embedding_cost_usd: Optional[float] = None
+    bytes_total: int
+    process_peak_rss_mb: float
+    files: List[JobFileStatus]
+
+
 # Health check
 @app.get("/health")
 async def health_check():
@@ -91,9 +257,37 @@ async def health_check():
     }
 
 
+# Prometheus metrics
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics endpoint"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+# Recent request profiles
+@app.get("/profiles")
+async def list_profiles(http_request: Request, limit: int = 50):
+    """List recent request profiles with their stage timings"""
+    if not profiling_service.authorized(http_request.headers.get("x-profile")):
+        raise HTTPException(status_code=403, detail="Profiling requires the X-Profile admin header")
+    return profiling_service.list_profiles(limit)
+
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, http_request: Request):
+    """Download a request profile in speedscope format"""
+    if not profiling_service.authorized(http_request.headers.get("x-profile")):
+        raise HTTPException(status_code=403, detail="Profiling requires the X-Profile admin header")
+    path = profiling_service.profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+    return FileResponse(path, media_type="application/json", filename=f"{profile_id}.speedscope.json")
+
+
 # Get available patients
 @app.get("/patients", response_model=List[PatientInfo])
-async def get_patients():
+async def get_patients(http_request: Request):
     """Get list of all available patients"""
     try:
         logger.info("Fetching available patients")
@@ -112,118 +306,269 @@ async def get_patients():
             ))
 
         logger.info(f"Found {len(patient_list)} patients")
-        return patient_list
+        return negotiated_response(http_request, patient_list)
 
     except Exception as e:
         logger.error(f"Error fetching patients: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _spool_upload(file: UploadFile, spool_dir: str, index: int, request_budget: int) -> tuple:
+    """Copy an upload to the job directory in fixed-size blocks, enforcing size caps"""
+    path = os.path.join(spool_dir, f"{index:04d}-{os.path.basename(file.filename)}")
+    size = 0
+    with open(path, 'wb') as spool:
+        while True:
+            block = await file.read(UPLOAD_READ_SIZE)
+            if not block:
+                break
+            size += len(block)
+            if size > MAX_UPLOAD_FILE_BYTES:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"File {file.filename} exceeds the limit of {MAX_UPLOAD_FILE_BYTES // (1024 * 1024)} MB"
+                )
+            if size > request_budget:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Upload exceeds the request limit of {MAX_UPLOAD_REQUEST_BYTES // (1024 * 1024)} MB"
+                )
+            spool.write(block)
+        spool.flush()
+        os.fsync(spool.fileno())
+    return path, size
+
+
+# Warm caches when a patient is opened
+@app.post("/patients/{patient_id}/prefetch", response_model=PrefetchResponse)
+async def prefetch_patient(patient_id: str):
+    """Load a patient into the hot cache and start generating its report"""
+    try:
+        return PrefetchResponse(**await run_in_threadpool(prefetch_service.prefetch, patient_id))
+    except Exception as e:
+        logger.error(f"Error prefetching patient {patient_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # Upload patient documents
-@app.post("/upload", response_model=UploadResponse)
+@app.post("/upload", response_model=UploadResponse, status_code=202)
 async def upload_documents(
     patient_id: str,
     files: List[UploadFile] = File(...)
 ):
-    """Upload and process patient documents"""
+    """Queue patient documents for background ingestion"""
+    job_id, spool_dir = job_service.create_job_dir()
     try:
-        logger.info(f"Uploading documents for patient {patient_id}")
-
-        # Process uploaded files
-        processed_files = 0
-        total_chunks = 0
+        logger.info(f"Uploading documents for patient {patient_id} (job {job_id})")
 
-        for file in files:
-            content = await file.read()
+        # Spool uploads to disk without holding whole files in memory
+        bytes_received = 0
+        spooled = []
+        for index, file in enumerate(files):
             filename = file.filename
-
-            # Determine file type and process
-            if filename.endswith('.json'):
-                chunks = document_service.process_json(content, patient_id, filename)
-            elif filename.endswith('.pdf'):
-                chunks = document_service.process_pdf(content, patient_id, filename)
-            elif filename.endswith('.txt'):
-                chunks = document_service.process_text(content, patient_id, filename)
-            else:
+            if not filename.endswith(SUPPORTED_EXTENSIONS):
                 logger.warning(f"Unsupported file type: {filename}")
                 continue
+            path, size = await _spool_upload(file, spool_dir, index, MAX_UPLOAD_REQUEST_BYTES - bytes_received)
+            spooled.append({'name': filename, 'path': path, 'bytes': size})
+            bytes_received += size
 
-            # Store in vector database
-            if chunks:
-                rag_service.store_documents(patient_id, chunks)
-                processed_files += 1
-                total_chunks += len(chunks)
-                logger.info(f"Processed {filename}: {len(chunks)} chunks")
+        if not spooled:
+            raise HTTPException(status_code=400, detail="No supported files (JSON, PDF, TXT) in upload")
+
+        job = job_service.submit(job_id, patient_id, spooled)
 
         return UploadResponse(
+            job_id=job_id,
             patient_id=patient_id,
-            files_processed=processed_files,
-            chunks_created=total_chunks,
-            message=f"Successfully processed {processed_files} files with {total_chunks} chunks"
+            status=job['status'],
+            files_queued=len(spooled),
+            bytes_received=bytes_received,
+            message=f"Queued {len(spooled)} files for processing"
         )
 
+    except HTTPException:
+        job_service.discard_job_dir(job_id)
+        raise
     except Exception as e:
+        job_service.discard_job_dir(job_id)
         logger.error(f"Error uploading documents: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Ingestion job status
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str, http_request: Request):
+    """Get progress of a background ingestion job"""
+    job = job_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return negotiated_response(http_request, JobStatus.model_validate(job))
+
+
 # Chat endpoint
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    """Chat with patient file using RAG"""
+async def chat(request: ChatRequest, http_request: Request):
+    """Chat with patient file using RAG
+
+    Without a client-side conversation_history the conversation is kept in a
+    server-side session, so clients only send the new question and session_id.
+    """
+    session = None
+    if request.session_id or not request.conversation_history:
+        try:
+            session = session_service.get_or_create(request.session_id, request.patient_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
     try:
         logger.info(f"Chat request for patient {request.patient_id}: {request.question}")
 
-        # Get answer using RAG
-        result = rag_service.query(
+        if session:
+            history, summary, turns = session_service.history(session)
+        else:
+            history, summary = request.conversation_history, None
+
+        # Get answer using RAG, shared with identical questions already in flight
+        key = (
+            request.patient_id,
+            normalize_question(request.question),
+            rag_service.llm_model if rag_service.llm_client else "template",
+            history_digest(history, summary)
+        )
+        result = await single_flight.run(
+            "chat",
+            key,
+            profiling_service.profiled(rag_service.query),
             patient_id=request.patient_id,
             question=request.question,
-            conversation_history=request.conversation_history
+            conversation_history=history,
+            conversation_summary=summary
         )
 
-        return ChatResponse(
+        if session:
+            session_service.add_turn(session, request.question, result['answer'], turns=turns)
+
+        return negotiated_response(http_request, ChatResponse(
             answer=result['answer'],
             sources=result['sources'],
-            timestamp=datetime.now().isoformat()
-        )
+            timestamp=datetime.now().isoformat(),
+            session_id=session['session_id'] if session else None
+        ))
 
+    except LLMOverloadedError as e:
+        logger.warning(f"Chat for patient {request.patient_id} shed: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         logger.error(f"Error in chat: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# End a chat session
+@app.delete("/sessions/{session_id}", status_code=204)
+async def delete_session(session_id: str):
+    """Forget a server-side chat session"""
+    if not session_service.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
+    return Response(status_code=204)
+
+
+def _generate_report(patient_id: str) -> Tuple[Dict[str, Any], str]:
+    """The report prepared when the patient was opened, or a freshly generated one, with its creation time"""
+    prefetched = prefetch_service.take_report(patient_id)
+    if prefetched is not None:
+        report, created_at = prefetched
+        return report, datetime.fromtimestamp(created_at).isoformat()
+    return report_service.generate_report(patient_id), datetime.now().isoformat()
+
+
 # Generate report
 @app.post("/generate-report", response_model=ReportResponse)
-async def generate_report(request: ReportRequest):
+async def generate_report(request: ReportRequest, http_request: Request):
     """Generate discharge report for patient"""
     try:
         logger.info(f"Generating report for patient {request.patient_id}")
 
-        # Generate report
-        report = report_service.generate_report(request.patient_id)
+        # Double clicks and several users on one patient share a single generation
+        key = (
+            request.patient_id,
+            report_service.llm_model if report_service.llm_client else "template",
+            report_service.report_mode
+        )
+        report, timestamp = await single_flight.run(
+            "generate-report", key, profiling_service.profiled(_generate_report), request.patient_id
+        )
 
-        return ReportResponse(
+        # A prefetched report keeps the time it was generated at
+        return negotiated_response(http_request, ReportResponse(
             report=report,
-            timestamp=datetime.now().isoformat()
-        )
+            timestamp=timestamp
+        ))
 
+    except LLMOverloadedError as e:
+        logger.warning(f"Report for patient {request.patient_id} shed: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         logger.error(f"Error generating report: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Cohort search across all patients
+@app.post("/search")
+async def search(request: SearchRequest):
+    """Search all patients, streaming one NDJSON line per matching patient
+
+    The last line is a page summary with the cursor for the next page.
+    """
+    filters = {
+        'department': request.department,
+        'sections': request.sections,
+        'admitted_from': request.admitted_from,
+        'admitted_to': request.admitted_to
+    }
+    fingerprint = search_service.fingerprint(request.query, filters)
+    try:
+        seen = search_service.decode_cursor(request.cursor, fingerprint)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    logger.info(f"Cohort search: {request.query} (filters: {filters})")
+
+    def stream():
+        try:
+            for item in search_service.search(
+                request.query,
+                filters,
+                limit=request.limit,
+                hits_per_patient=request.hits_per_patient,
+                score_threshold=request.score_threshold,
+                seen=seen
+            ):
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        except Exception as e:
+            # Headers are already sent, report the failure in-band
+            logger.error(f"Error in cohort search: {str(e)}")
+            yield json.dumps({'type': 'error', 'detail': str(e)}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 # Initialize sample data on startup
 @app.on_event("startup")
 async def startup_event():
     """Load sample patient data on startup"""
     try:
         logger.info("Starting AI service...")
+
+        # Resume queued ingestion jobs from the journal
+        job_service.start()
+
         logger.info("Loading sample patient data...")
 
         # Check if data already loaded (prevent duplicates on reload)
         try:
             existing_count = rag_service.qdrant_service.client.count(
-                collection_name="patient_documents"
+                collection_name=rag_service.qdrant_service.collection_name
             )
             if existing_count.count > 0:
                 logger.info(f"Sample data already loaded ({existing_count.count} vectors in database)")
@@ -231,8 +576,19 @@ async def startup_event():
         except Exception as e:
             logger.info(f"No existing data found, loading sample data...")
 
+        # Bulk-load a pre-built snapshot instead of re-embedding the corpus
+        snapshot_path = os.getenv("SNAPSHOT_PATH")
+        if snapshot_path and os.path.exists(snapshot_path):
+            try:
+                if snapshot_service.restore(snapshot_path):
+                    return
+            except Exception as e:
+                # Points may already be partially loaded, do not add sample data on top
+                logger.error(f"Error restoring snapshot {snapshot_path}: {str(e)}")
+                return
+
         # Check if sample data exists
-        sample_data_dir = "/app/sample-data"
+        sample_data_dir = os.getenv("SAMPLE_DATA_DIR", "/app/sample-data")
         if os.path.exists(sample_data_dir):
             # Load sample patients
             for patient_dir in os.listdir(sample_data_dir):
@@ -0,0 +1,212 @@
+"""Maintenance commands for the AI service.
+
+Usage (from the ai-service directory):
+    python manage.py fit-pca --sample 20000
+    MODEL_TYPE=openai python manage.py migrate-embeddings --rate 50
+    python manage.py export-snapshot --output /app/data/snapshot.jsonl.gz
+    python manage.py compact-chunks --prune
+"""
+import os
+import sys
+import random
+import logging
+import argparse
+
+from services.embedding_service import EmbeddingService
+from services.qdrant_service import QdrantService
+from services.migration_service import EmbeddingMigration
+from services.snapshot_service import SnapshotService
+from services.chunk_store import ChunkStore
+
+logger = logging.getLogger("manage")
+
+
+def fit_pca(args) -> int:
+    """Fit the PCA projection for small vectors and backfill them on all points"""
+    embedding_service = EmbeddingService()
+    qdrant_service = QdrantService(
+        embedding_dimension=embedding_service.get_embedding_dimension(),
+        embedding_model=embedding_service.embedding_model
+    )
+    reducer = qdrant_service.reducer
+
+    if not reducer.dimension or reducer.method != "pca":
+        logger.error("Set SMALL_VECTOR_DIM and use a non-Matryoshka model (or SMALL_VECTOR_METHOD=pca)")
+        return 1
+    if not qdrant_service.named_vectors:
+        logger.error(f"Collection {qdrant_service.collection_name} has no small vector, recreate or migrate it first")
+        return 1
+
+    # Reservoir sample so the fit does not depend on insertion order
+    rng = random.Random(args.seed)
+    sample = []
+    seen = 0
+    for _, vectors in qdrant_service.iter_full_vectors():
+        for vector in vectors:
+            seen += 1
+            if len(sample) < args.sample:
+                sample.append(vector)
+            else:
+                j = rng.randrange(seen)
+                if j < args.sample:
+                    sample[j] = vector
+
+    explained = reducer.fit_pca(sample)
+    print(f"Fitted PCA on {len(sample)} of {seen} vectors, {explained:.1%} variance kept -> {reducer.pca_path}")
+
+    updated = 0
+    for ids, vectors in qdrant_service.iter_full_vectors(batch_size=args.batch_size):
+        qdrant_service.update_small_vectors(ids, vectors)
+        updated += len(ids)
+    print(f"Updated small vectors of {updated} points; restart the service to use them")
+    return 0
+
+
+def migrate_embeddings(args) -> int:
+    """Re-embed the collection behind the alias with the configured model and swap the alias"""
+    embedding_service = EmbeddingService()
+    if embedding_service.client is None:
+        logger.error("No embedding backend available for the target model")
+        return 1
+    # The alias still serves the previous model until the migration moves it
+    qdrant_service = QdrantService(
+        embedding_dimension=embedding_service.get_embedding_dimension(),
+        embedding_model=embedding_service.embedding_model,
+        allow_unmigrated=True
+    )
+    migration = EmbeddingMigration(embedding_service, qdrant_service, rate=args.rate, batch_size=args.batch_size)
+
+    try:
+        if args.catch_up_only:
+            source = args.source or migration.source_collection()
+            if source is None or source == migration.target:
+                logger.error("Pass --source with the collection of the previous model")
+                return 1
+            copied = migration.catch_up(source, args.since)
+            print(f"Caught up {copied} chunks from {source} into {migration.target}")
+            return 0
+
+        result = migration.run(catch_up_rounds=args.catch_up_rounds, swap=not args.no_swap, drop_legacy=args.drop_legacy)
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+
+    print(f"Copied {result['copied']} chunks from {result['source']} to {result['target']} in {result['seconds']}s")
+    if result['swapped']:
+        print(f"{migration.alias} now points to {result['target']}; {result['source']} is kept until you drop it")
+    print(
+        "Writes of instances still on the old model: "
+        f"manage.py migrate-embeddings --catch-up-only --source {result['source']} --since {result['catch_up_since']:.0f}"
+    )
+    return 0
+
+
+def export_snapshot(args) -> int:
+    """Write the collection with its embedding-model fingerprint to a snapshot file"""
+    embedding_service = EmbeddingService()
+    qdrant_service = QdrantService(
+        embedding_dimension=embedding_service.get_embedding_dimension(),
+        embedding_model=embedding_service.embedding_model
+    )
+    result = SnapshotService(embedding_service, qdrant_service).export(args.output)
+    print(
+        f"Exported {result['points']} points of {result['patients']} patients to {result['path']} "
+        f"({result['bytes'] / 1e6:.1f} MB, {result['seconds']}s)"
+    )
+    return 0
+
+
+def restore_snapshot(args) -> int:
+    """Bulk-load a snapshot file into the collection of the configured model"""
+    embedding_service = EmbeddingService()
+    qdrant_service = QdrantService(
+        embedding_dimension=embedding_service.get_embedding_dimension(),
+        embedding_model=embedding_service.embedding_model
+    )
+    existing = qdrant_service.client.count(collection_name=qdrant_service.collection_name).count
+    if existing and not args.force:
+        logger.error(f"Collection {qdrant_service.collection_name} already holds {existing} points, use --force to load anyway")
+        return 1
+
+    result = SnapshotService(embedding_service, qdrant_service).restore(args.input)
+    if result is None:
+        return 1
+    print(f"Restored {result['points']} points of {result['patients']} patients in {result['seconds']}s")
+    return 0
+
+
+def compact_chunks(args) -> int:
+    """Rewrite the chunk store with only the texts of live points"""
+    directory = os.getenv("CHUNK_STORE_DIR", "/app/data/chunks")
+    if not directory or not os.path.isdir(directory):
+        logger.error(f"No chunk store at {directory!r}")
+        return 1
+
+    keep = None
+    if args.prune:
+        embedding_service = EmbeddingService()
+        qdrant_service = QdrantService(
+            embedding_dimension=embedding_service.get_embedding_dimension(),
+            embedding_model=embedding_service.embedding_model
+        )
+        keep = {point_id for batch in qdrant_service.iter_point_ids() for point_id in batch}
+
+    result = ChunkStore.shared(directory).compact(keep)
+    print(
+        f"Kept {result['chunks']} chunks, dropped {result['dropped']} "
+        f"({result['bytes_before'] / 1e6:.1f} MB -> {result['bytes_after'] / 1e6:.1f} MB)"
+    )
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="AI service maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pca_parser = subparsers.add_parser("fit-pca", help="fit the small-vector PCA projection on the stored corpus")
+    pca_parser.add_argument("--sample", type=int, default=20000, help="number of vectors to fit on")
+    pca_parser.add_argument("--batch-size", type=int, default=256)
+    pca_parser.add_argument("--seed", type=int, default=0)
+    pca_parser.set_defaults(func=fit_pca)
+
+    migrate_parser = subparsers.add_parser(
+        "migrate-embeddings",
+        help="re-embed all chunks with the configured model into a new collection and move the alias"
+    )
+    migrate_parser.add_argument("--rate", type=float, default=50.0, help="chunks embedded per second")
+    migrate_parser.add_argument("--batch-size", type=int, default=64)
+    migrate_parser.add_argument("--catch-up-rounds", type=int, default=3)
+    migrate_parser.add_argument("--no-swap", action="store_true", help="build the collection but leave the alias")
+    migrate_parser.add_argument("--drop-legacy", action="store_true", help="delete an unversioned collection to free its name")
+    migrate_parser.add_argument("--catch-up-only", action="store_true", help="only copy patients changed since --since")
+    migrate_parser.add_argument("--source", help="collection to catch up from")
+    migrate_parser.add_argument("--since", type=float, default=0.0, help="epoch seconds")
+    migrate_parser.set_defaults(func=migrate_embeddings)
+
+    snapshot_path = os.getenv("SNAPSHOT_PATH", "/app/data/snapshot.jsonl.gz")
+    export_parser = subparsers.add_parser("export-snapshot", help="write the collection to a compressed snapshot file")
+    export_parser.add_argument("--output", default=snapshot_path)
+    export_parser.set_defaults(func=export_snapshot)
+
+    restore_parser = subparsers.add_parser("restore-snapshot", help="bulk-load a snapshot file")
+    restore_parser.add_argument("--input", default=snapshot_path)
+    restore_parser.add_argument("--force", action="store_true", help="load into a collection that is not empty")
+    restore_parser.set_defaults(func=restore_snapshot)
+
+    compact_parser = subparsers.add_parser(
+        "compact-chunks",
+        help="rewrite the chunk store without superseded and deleted texts; stop the service first"
+    )
+    compact_parser.add_argument(
+        "--prune", action="store_true",
+        help="also drop texts whose point is not in the collection behind the alias"
+    )
+    compact_parser.set_defaults(func=compact_chunks)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
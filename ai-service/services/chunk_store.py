@@ -0,0 +1,265 @@
+import os
+import mmap
+import uuid
+import zlib
+import fcntl
+import struct
+import logging
+import threading
+from typing import List, Dict, Any, Tuple, Optional, Iterable, Set
+
+logger = logging.getLogger(__name__)
+
+# Index record: point id (UUID bytes), segment number, offset, compressed length
+INDEX_RECORD = struct.Struct("<16sIQI")
+# Compressed texts are never empty, so a zero length marks a deleted id
+TOMBSTONE_LENGTH = 0
+
+# Stores are shared per directory so all services of a process see the same index
+_stores: Dict[str, "ChunkStore"] = {}
+_stores_lock = threading.Lock()
+
+
+def _key(point_id: Any) -> bytes:
+    if isinstance(point_id, int):
+        return uuid.UUID(int=point_id).bytes
+    return uuid.UUID(str(point_id)).bytes
+
+
+class ChunkStore:
+    """Compressed, memory-mapped store for chunk texts keyed by Qdrant point id
+
+    Texts are zlib-compressed one by one and appended to segment files, which
+    are read through mmap. A fixed-width binary index maps point ids to their
+    record and is loaded into memory on start. Appends take an exclusive lock
+    on the index file, so several uvicorn workers can share one directory;
+    readers pick up index entries written by other processes when the index
+    file has grown. Re-storing an id appends a record that supersedes the
+    old one, deleting an id appends a tombstone record. The superseded and
+    deleted texts stay in the segments until compact() rewrites them.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.segment_bytes = int(os.getenv("CHUNK_STORE_SEGMENT_MB", "256")) * 1024 * 1024
+        self.compression_level = int(os.getenv("CHUNK_STORE_COMPRESSION_LEVEL", "6"))
+        self.index_path = os.path.join(directory, "index.bin")
+
+        self._index: Dict[bytes, Tuple[int, int, int]] = {}
+        self._index_read = 0
+        self._segment = 0
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._refresh()
+        logger.info(f"Chunk store at {directory}: {len(self._index)} chunks")
+
+    @classmethod
+    def shared(cls, directory: str) -> "ChunkStore":
+        """The store for a directory, opened once per process"""
+        with _stores_lock:
+            if directory not in _stores:
+                _stores[directory] = cls(directory)
+            return _stores[directory]
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def put_many(self, ids: List[Any], texts: List[str]):
+        """Store the texts of a batch of points"""
+        blobs = [zlib.compress(text.encode("utf-8"), self.compression_level) for text in texts]
+
+        with self._lock, open(self.index_path, "ab") as index_file:
+            fcntl.flock(index_file, fcntl.LOCK_EX)
+            try:
+                # Another process may have appended since our last read
+                self._refresh()
+
+                segment = self._segment
+                path = self._segment_path(segment)
+                if os.path.exists(path) and os.path.getsize(path) >= self.segment_bytes:
+                    segment += 1
+                    path = self._segment_path(segment)
+
+                with open(path, "ab") as f:
+                    offset = f.tell()
+                    f.write(b"".join(blobs))
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                records = []
+                entries = []
+                for point_id, blob in zip(ids, blobs):
+                    key = _key(point_id)
+                    records.append(INDEX_RECORD.pack(key, segment, offset, len(blob)))
+                    entries.append((key, (segment, offset, len(blob))))
+                    offset += len(blob)
+
+                # Drop a record torn by a crash so later records stay aligned
+                size = os.fstat(index_file.fileno()).st_size
+                if size % INDEX_RECORD.size:
+                    index_file.truncate(size - size % INDEX_RECORD.size)
+                index_file.write(b"".join(records))
+                index_file.flush()
+                os.fsync(index_file.fileno())
+
+                self._index.update(entries)
+                self._segment = segment
+                self._index_read = os.fstat(index_file.fileno()).st_size
+            finally:
+                fcntl.flock(index_file, fcntl.LOCK_UN)
+
+    def delete_many(self, ids: Iterable[Any]) -> int:
+        """Remove the texts of points, returns how many were stored"""
+        keys = [_key(point_id) for point_id in ids]
+        if not keys:
+            return 0
+
+        with self._lock, open(self.index_path, "ab") as index_file:
+            fcntl.flock(index_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                keys = [key for key in keys if key in self._index]
+                size = os.fstat(index_file.fileno()).st_size
+                if size % INDEX_RECORD.size:
+                    index_file.truncate(size - size % INDEX_RECORD.size)
+                index_file.write(b"".join(INDEX_RECORD.pack(key, 0, 0, TOMBSTONE_LENGTH) for key in keys))
+                index_file.flush()
+                os.fsync(index_file.fileno())
+
+                for key in keys:
+                    del self._index[key]
+                self._index_read = os.fstat(index_file.fileno()).st_size
+            finally:
+                fcntl.flock(index_file, fcntl.LOCK_UN)
+        return len(keys)
+
+    def compact(self, keep: Optional[Set[Any]] = None) -> Dict[str, Any]:
+        """Rewrite the segments with only the live texts
+
+        Superseded and deleted records are dropped; with `keep`, so are the
+        texts of ids not in it. Other processes must not use the directory
+        meanwhile, they would keep reading the old index.
+        """
+        keep_keys = {_key(point_id) for point_id in keep} if keep is not None else None
+
+        with self._lock, open(self.index_path, "ab") as index_file:
+            fcntl.flock(index_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                old_segments = sorted(
+                    int(name[len("segment-"):-len(".dat")])
+                    for name in os.listdir(self.directory) if name.startswith("segment-")
+                )
+                bytes_before = sum(os.path.getsize(self._segment_path(n)) for n in old_segments)
+
+                # New segments are numbered after the old ones, which are removed last
+                segment = (old_segments[-1] if old_segments else self._segment) + 1
+                index: Dict[bytes, Tuple[int, int, int]] = {}
+                records = []
+                out = open(self._segment_path(segment), "wb")
+                try:
+                    for key, (old_segment, offset, length) in self._index.items():
+                        if keep_keys is not None and key not in keep_keys:
+                            continue
+                        if out.tell() + length > self.segment_bytes and out.tell():
+                            out.flush()
+                            os.fsync(out.fileno())
+                            out.close()
+                            segment += 1
+                            out = open(self._segment_path(segment), "wb")
+                        position = out.tell()
+                        out.write(self._map(old_segment, offset + length)[offset:offset + length])
+                        index[key] = (segment, position, length)
+                        records.append(INDEX_RECORD.pack(key, segment, position, length))
+                    out.flush()
+                    os.fsync(out.fileno())
+                finally:
+                    out.close()
+
+                tmp_path = f"{self.index_path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(b"".join(records))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.index_path)
+                directory_fd = os.open(self.directory, os.O_RDONLY)
+                try:
+                    os.fsync(directory_fd)
+                finally:
+                    os.close(directory_fd)
+
+                for mapped in self._maps.values():
+                    mapped.close()
+                self._maps.clear()
+                for number in old_segments:
+                    os.remove(self._segment_path(number))
+
+                dropped = len(self._index) - len(index)
+                self._index = index
+                self._segment = segment
+                self._index_read = len(records) * INDEX_RECORD.size
+            finally:
+                fcntl.flock(index_file, fcntl.LOCK_UN)
+
+        bytes_after = self.stats()['bytes']
+        logger.info(f"Compacted chunk store at {self.directory}: {len(index)} chunks kept, {dropped} dropped")
+        return {'chunks': len(index), 'dropped': dropped, 'bytes_before': bytes_before, 'bytes_after': bytes_after}
+
+    def get_many(self, ids: List[Any]) -> Dict[Any, str]:
+        """Texts of the given point ids, ids without a stored text are left out"""
+        with self._lock:
+            # Pick up records another worker appended since we last read the index
+            if os.path.exists(self.index_path) and os.path.getsize(self.index_path) != self._index_read:
+                self._refresh()
+            locations = {point_id: self._index.get(_key(point_id)) for point_id in ids}
+
+            blobs = {}
+            for point_id, location in locations.items():
+                if location is None:
+                    continue
+                segment, offset, length = location
+                blobs[point_id] = self._map(segment, offset + length)[offset:offset + length]
+
+        return {point_id: zlib.decompress(blob).decode("utf-8") for point_id, blob in blobs.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        segments = [name for name in os.listdir(self.directory) if name.startswith("segment-")]
+        return {
+            'chunks': len(self._index),
+            'segments': len(segments),
+            'bytes': sum(os.path.getsize(os.path.join(self.directory, name)) for name in segments)
+        }
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"segment-{segment:05d}.dat")
+
+    def _map(self, segment: int, end: int) -> mmap.mmap:
+        """Memory map of a segment covering at least `end` bytes (caller holds the lock)"""
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < end:
+            # The active segment grows, map it again to see the appended records
+            if mapped is not None:
+                mapped.close()
+            with open(self._segment_path(segment), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = mapped
+        return mapped
+
+    def _refresh(self):
+        """Read index records appended since the last read (caller holds the lock)"""
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_read)
+            data = f.read()
+        usable = len(data) - len(data) % INDEX_RECORD.size
+        for key, segment, offset, length in INDEX_RECORD.iter_unpack(data[:usable]):
+            if length == TOMBSTONE_LENGTH:
+                self._index.pop(key, None)
+                continue
+            self._index[key] = (segment, offset, length)
+            self._segment = max(self._segment, segment)
+        self._index_read += usable
@@ -0,0 +1,239 @@
+"""Near-duplicate chunk detection at ingest time.
+
+Chunks are broken into word shingles and summarised by a MinHash signature.
+Signatures are banded into a per-patient LSH index, so a new chunk is only
+compared with the few stored chunks that share a band with it. A chunk whose
+estimated Jaccard similarity to a stored chunk reaches the threshold is not
+embedded; its source is added to the `sources` list of the stored chunk
+instead. Chunks only count as duplicates if they also contain the same
+numbers in the same order, so lab panels or medication lists that differ
+in a single value are always stored.
+"""
+import os
+import re
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from services.metrics import INGEST_CHUNKS
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)*")
+
+# Mersenne prime for the permutation hashes, small enough that a * hash fits into uint64
+MERSENNE_PRIME = (1 << 31) - 1
+HASH_MASK = np.uint64((1 << 32) - 1)
+SHINGLE_MULTIPLIER = np.uint64(1000003)
+
+
+class MinHasher:
+    """MinHash signatures over word shingles"""
+
+    def __init__(self, num_perm: int, shingle_size: int, seed: int = 1):
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        tokens = TOKEN_PATTERN.findall(text.lower()) or [""]
+        # Token hashes only need to be stable within the process, indexes are rebuilt on start
+        token_hashes = np.fromiter(map(hash, tokens), dtype=np.int64, count=len(tokens)).view(np.uint64) & HASH_MASK
+
+        # Rolling combination of shingle_size consecutive token hashes
+        count = max(1, len(tokens) - self.shingle_size + 1)
+        shingles = token_hashes[:count].copy()
+        for offset in range(1, min(self.shingle_size, len(tokens))):
+            shingles = (shingles * SHINGLE_MULTIPLIER + token_hashes[offset:offset + count]) & HASH_MASK
+        shingles = np.unique(shingles)
+
+        permuted = (np.outer(shingles, self.a) + self.b) % MERSENNE_PRIME
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+def numbers_of(text: str) -> Tuple[str, ...]:
+    """Numbers of a chunk (lab values, doses, dates), which must match exactly"""
+    return tuple(NUMBER_PATTERN.findall(text))
+
+
+class _PatientIndex:
+    """LSH buckets and signatures of the chunks stored for one patient"""
+
+    def __init__(self, bands: int):
+        self.bands = bands
+        self.buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+        self.ids: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.signatures: List[np.ndarray] = []
+        self.numbers: List[Tuple[str, ...]] = []
+        self.sources: List[List[str]] = []
+        self.lock = threading.Lock()
+
+    def band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [band.tobytes() for band in signature.reshape(self.bands, -1)]
+
+    def query(
+        self,
+        signature: np.ndarray,
+        keys: List[bytes],
+        numbers: Tuple[str, ...],
+        threshold: float
+    ) -> Optional[int]:
+        """Position of the most similar chunk at or above the threshold with the same numbers"""
+        candidates = set()
+        for band, key in enumerate(keys):
+            candidates.update(self.buckets[band].get(key, ()))
+
+        best, best_similarity = None, threshold
+        for candidate in candidates:
+            if self.numbers[candidate] != numbers:
+                continue
+            similarity = float(np.mean(self.signatures[candidate] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        return best
+
+    def add(self, point_id: str, signature: np.ndarray, keys: List[bytes], numbers: Tuple[str, ...], sources: List[str]):
+        if point_id in self.positions:
+            # Re-stored under its own id, the signature is already indexed
+            self.sources[self.positions[point_id]] = sources
+            return
+        position = len(self.ids)
+        self.ids.append(point_id)
+        self.positions[point_id] = position
+        self.signatures.append(signature)
+        self.numbers.append(numbers)
+        self.sources.append(sources)
+        for band, key in enumerate(keys):
+            self.buckets[band].setdefault(key, []).append(position)
+
+
+class ChunkDeduplicator:
+    """Skips near-duplicate chunks of a patient before they are embedded
+
+    The index of a patient is built from its stored chunks on first use and
+    kept in an LRU of DEDUP_MAX_PATIENTS patients. Each process keeps its own
+    indexes, so chunks stored by another process after the index was built
+    are not seen; at worst such a duplicate is stored twice.
+    """
+
+    def __init__(self, qdrant_service):
+        self.qdrant_service = qdrant_service
+        self.threshold = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+        self.bands = int(os.getenv("DEDUP_BANDS", "16"))
+        self.max_patients = int(os.getenv("DEDUP_MAX_PATIENTS", "256"))
+        num_perm = int(os.getenv("DEDUP_NUM_PERM", "64"))
+        if num_perm % self.bands:
+            raise ValueError(f"DEDUP_NUM_PERM ({num_perm}) must be a multiple of DEDUP_BANDS ({self.bands})")
+        self.hasher = MinHasher(num_perm=num_perm, shingle_size=int(os.getenv("DEDUP_SHINGLE_SIZE", "5")))
+        self._indexes: "OrderedDict[str, _PatientIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(
+        self,
+        patient_id: str,
+        chunks: List[Dict[str, Any]],
+        ids: List[str]
+    ) -> Tuple[List[Dict[str, Any]], List[str], int, _PatientIndex]:
+        """Chunks and ids that still need to be stored, the number of duplicates dropped and the pending batch
+
+        Re-storing a chunk under its own id (a re-processed file) is not a
+        duplicate. Chunks of the same batch are deduplicated against each
+        other as well. The kept chunks only become visible to later calls
+        once commit() is called with the returned batch after they were
+        stored, so a failed write does not hide later copies.
+        """
+        index = self._index(patient_id)
+        # Kept chunks of this call, positions match kept_chunks
+        batch = _PatientIndex(self.bands)
+        kept_chunks, kept_ids = [], []
+        merged: Dict[str, List[str]] = {}
+        duplicates = 0
+
+        with index.lock:
+            for chunk, point_id in zip(chunks, ids):
+                source = chunk.get('source', 'unknown')
+                signature = self.hasher.signature(chunk['text'])
+                keys = index.band_keys(signature)
+                numbers = numbers_of(chunk['text'])
+
+                match = batch.query(signature, keys, numbers, self.threshold)
+                if match is not None:
+                    duplicates += 1
+                    if source not in batch.sources[match]:
+                        batch.sources[match].append(source)
+                        kept_chunks[match]['sources'] = list(batch.sources[match])
+                    continue
+
+                match = index.query(signature, keys, numbers, self.threshold)
+                if match is not None and index.ids[match] != point_id:
+                    duplicates += 1
+                    sources = index.sources[match]
+                    if source not in sources:
+                        sources.append(source)
+                        merged[index.ids[match]] = list(sources)
+                    continue
+
+                sources = list(index.sources[match]) if match is not None else [source]
+                if len(sources) > 1:
+                    # Re-stored under its own id, keep the sources merged so far
+                    chunk['sources'] = list(sources)
+                batch.add(point_id, signature, keys, numbers, sources)
+                kept_chunks.append(chunk)
+                kept_ids.append(point_id)
+
+        for point_id, sources in merged.items():
+            self.qdrant_service.set_points_payload(patient_id, [point_id], {'sources': sources})
+
+        INGEST_CHUNKS.labels("stored").inc(len(kept_chunks))
+        INGEST_CHUNKS.labels("duplicate").inc(duplicates)
+        if duplicates:
+            logger.info(f"Skipped {duplicates} of {len(chunks)} near-duplicate chunks for patient {patient_id}")
+        return kept_chunks, kept_ids, duplicates, batch
+
+    def commit(self, patient_id: str, batch: _PatientIndex):
+        """Add the chunks of a filtered batch to the patient's index once they are stored"""
+        with self._lock:
+            index = self._indexes.get(patient_id)
+        if index is None:
+            # Evicted meanwhile, the next build reads the stored chunks
+            return
+        with index.lock:
+            for position, point_id in enumerate(batch.ids):
+                signature = batch.signatures[position]
+                index.add(point_id, signature, index.band_keys(signature), batch.numbers[position], batch.sources[position])
+
+    def _index(self, patient_id: str) -> _PatientIndex:
+        with self._lock:
+            index = self._indexes.get(patient_id)
+            if index is not None:
+                self._indexes.move_to_end(patient_id)
+                return index
+            index = self._indexes[patient_id] = _PatientIndex(self.bands)
+            while len(self._indexes) > self.max_patients:
+                self._indexes.popitem(last=False)
+            # Held until built, so concurrent callers wait for the stored chunks
+            index.lock.acquire()
+
+        # Chunks stored earlier (other jobs, previous runs) take part in the comparison
+        try:
+            for point in self.qdrant_service.scroll_patient(patient_id):
+                payload = point['payload']
+                signature = self.hasher.signature(payload.get('text', ""))
+                index.add(
+                    str(point['id']),
+                    signature,
+                    index.band_keys(signature),
+                    numbers_of(payload.get('text', "")),
+                    list(payload.get('sources') or [payload.get('source', 'unknown')])
+                )
+        finally:
+            index.lock.release()
+        if index.ids:
+            logger.info(f"Built dedup index for patient {patient_id} from {len(index.ids)} stored chunks")
+        return index
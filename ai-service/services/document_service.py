@@ -1,10 +1,12 @@
 import json
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator
 from pypdf import PdfReader
 import io
 import os
 
+from services.fhir import is_fhir_bundle, iter_resources, BundleChunker
+
 logger = logging.getLogger(__name__)
 
 
@@ -14,148 +16,237 @@ class DocumentService:
     def __init__(self):
         self.chunk_size = 1000
         self.chunk_overlap = 200
+        # Characters read per block when streaming text files from disk
+        self.read_block_size = 64 * 1024
+
+    def process_file(self, path: str, patient_id: str, filename: str) -> Iterator[Dict[str, Any]]:
+        """Process a document stored on disk, yielding chunks incrementally"""
+        if filename.endswith('.json'):
+            count = 0
+            if is_fhir_bundle(path):
+                chunks = self.process_fhir_bundle(path, patient_id, filename)
+            else:
+                with open(path, 'rb') as f:
+                    chunks = self._json_chunks(f.read(), patient_id, filename)
+            for chunk in chunks:
+                count += 1
+                yield chunk
+            # Neither a Bundle nor our patient schema, so the job must not report it as ingested
+            if not count:
+                raise ValueError(f"No patient data recognised in {filename}")
+        elif filename.endswith('.pdf'):
+            yield from self.process_pdf_file(path, patient_id, filename)
+        elif filename.endswith('.txt'):
+            yield from self.process_text_file(path, patient_id, filename)
+        else:
+            logger.warning(f"Unsupported file type: {filename}")
+
+    def process_text_file(self, path: str, patient_id: str, filename: str) -> Iterator[Dict[str, Any]]:
+        """Process a text file block by block without loading it into memory"""
+        def blocks():
+            with open(path, 'r', encoding='utf-8') as f:
+                while True:
+                    block = f.read(self.read_block_size)
+                    if not block:
+                        break
+                    yield block
+
+        count = 0
+        try:
+            for chunk in self._split_stream(blocks(), patient_id, filename):
+                count += 1
+                yield chunk
+            logger.info(f"Processed text file {filename}: {count} chunks")
+        except Exception as e:
+            # Re-raised so the ingest job records the file as failed instead of completed
+            logger.error(f"Error processing text file {filename} after {count} chunks: {str(e)}")
+            raise
+
+    def process_fhir_bundle(self, path: str, patient_id: str, filename: str) -> Iterator[Dict[str, Any]]:
+        """Process a FHIR Bundle resource by resource without loading it into memory"""
+        chunker = BundleChunker(patient_id, filename, self.chunk_size)
+        count = 0
+        with open(path, 'rb') as f:
+            for resource in iter_resources(f):
+                for chunk in chunker.add(resource):
+                    count += 1
+                    yield chunk
+        for chunk in chunker.flush():
+            count += 1
+            yield chunk
+
+        if chunker.counts.get('Patient', 0) > 1:
+            logger.warning(f"FHIR bundle {filename} contains {chunker.counts['Patient']} patients, all stored for {patient_id}")
+        logger.info(f"Processed FHIR bundle {filename}: {count} chunks from {sum(chunker.counts.values())} resources")
+
+    def process_pdf_file(self, path: str, patient_id: str, filename: str) -> Iterator[Dict[str, Any]]:
+        """Process a PDF file page by page"""
+        def pages():
+            reader = PdfReader(path)
+            for page in reader.pages:
+                yield page.extract_text() + "\n"
+
+        count = 0
+        try:
+            for chunk in self._split_stream(pages(), patient_id, filename):
+                count += 1
+                yield chunk
+            logger.info(f"Processed PDF file {filename}: {count} chunks")
+        except Exception as e:
+            logger.error(f"Error processing PDF file {filename} after {count} chunks: {str(e)}")
+            raise
 
     def process_json(self, content: bytes, patient_id: str, filename: str) -> List[Dict[str, Any]]:
         """Process JSON patient data"""
         try:
-            data = json.loads(content.decode('utf-8'))
-            chunks = []
-
-            # Create chunks from different sections
-            # Patient demographics
-            if 'demographics' in data:
-                demo = data['demographics']
-                text = "PATIENTENDATEN / DEMOGRAPHIE:\n\n"
-                text += f"Der Patient heißt {demo.get('name', 'Unknown')}.\n"
-                text += f"Der Patient ist {demo.get('age', 'Unknown')} Jahre alt.\n"
-                text += f"Geburtsdatum: {demo.get('dateOfBirth', 'Unknown')}\n"
-                text += f"Geschlecht: {demo.get('gender', 'Unknown')}\n"
-
-                chunks.append({
-                    'text': text,
-                    'patient_id': patient_id,
-                    'source': filename,
-                    'section': 'demographics'
-                })
-
-            # Admission info
-            if 'admission' in data:
-                adm = data['admission']
-                text = "AUFNAHME-INFORMATIONEN:\n"
-                text += f"Aufnahmedatum: {adm.get('admissionDate', 'Unknown')}\n"
-                text += f"Abteilung: {adm.get('department', 'Unknown')}\n"
-                text += f"Station: {adm.get('ward', 'Unknown')}\n"
-                text += f"Aufnahmegrund: {adm.get('admissionReason', 'Unknown')}\n"
-
-                if 'dischargeDate' in adm and adm['dischargeDate']:
-                    text += f"Entlassungsdatum: {adm['dischargeDate']}\n"
-                    text += f"Aufenthaltsdauer: {adm.get('lengthOfStay', 'Unknown')} Tage\n"
-
-                chunks.append({
-                    'text': text,
-                    'patient_id': patient_id,
-                    'source': filename,
-                    'section': 'admission'
-                })
-
-            # Diagnoses
-            if 'diagnoses' in data:
-                text = "DIAGNOSEN:\n"
-                for diag in data['diagnoses']:
-                    text += f"\n- {diag.get('description', 'Unknown')} ({diag.get('code', 'N/A')})\n"
-                    text += f"  Typ: {diag.get('type', 'Unknown')}\n"
-                    text += f"  Diagnosedatum: {diag.get('diagnosedDate', 'Unknown')}\n"
-
-                chunks.append({
-                    'text': text,
-                    'patient_id': patient_id,
-                    'source': filename,
-                    'section': 'diagnoses'
-                })
-
-            # Medications
-            if 'medications' in data:
-                text = "MEDIKATION:\n"
-                for med in data['medications']:
-                    text += f"\n- {med.get('name', 'Unknown')} {med.get('dose', '')}\n"
-                    text += f"  Frequenz: {med.get('frequency', 'Unknown')}\n"
-                    text += f"  Verabreichung: {med.get('route', 'Unknown')}\n"
-                    text += f"  Indikation: {med.get('indication', 'Unknown')}\n"
-                    text += f"  Start: {med.get('startDate', 'Unknown')}\n"
-
-                chunks.append({
-                    'text': text,
-                    'patient_id': patient_id,
-                    'source': filename,
-                    'section': 'medications'
-                })
-
-            # Allergies
-            if 'allergies' in data and data['allergies']:
-                text = "ALLERGIEN:\n"
-                for allergy in data['allergies']:
-                    text += f"- {allergy.get('substance', 'Unknown')}: {allergy.get('reaction', 'Unknown')} "
-                    text += f"(Schwere: {allergy.get('severity', 'Unknown')})\n"
-
-                chunks.append({
-                    'text': text,
-                    'patient_id': patient_id,
-                    'source': filename,
-                    'section': 'allergies'
-                })
-
-            # Procedures
-            if 'procedures' in data:
-                text = "DURCHGEFÜHRTE PROZEDUREN:\n"
-                for proc in data['procedures']:
-                    text += f"\n- {proc.get('name', 'Unknown')}\n"
-                    text += f"  Datum: {proc.get('date', 'Unknown')}\n"
-                    text += f"  Beschreibung: {proc.get('description', 'N/A')}\n"
-
-                chunks.append({
-                    'text': text,
-                    'patient_id': patient_id,
-                    'source': filename,
-                    'section': 'procedures'
-                })
-
-            # Vital signs
-            if 'vitalSigns' in data:
-                text = "VITALPARAMETER:\n"
-                for vital in data['vitalSigns'][:5]:  # Last 5 measurements
-                    text += f"\n{vital.get('timestamp', 'Unknown')}:\n"
-                    text += f"  RR: {vital.get('bloodPressure', 'N/A')} mmHg\n"
-                    text += f"  HF: {vital.get('heartRate', 'N/A')}/min\n"
-                    text += f"  Temp: {vital.get('temperature', 'N/A')}°C\n"
-                    text += f"  SpO2: {vital.get('oxygenSaturation', 'N/A')}%\n"
-                    text += f"  AF: {vital.get('respiratoryRate', 'N/A')}/min\n"
-
-                chunks.append({
-                    'text': text,
-                    'patient_id': patient_id,
-                    'source': filename,
-                    'section': 'vital_signs'
-                })
-
-            logger.info(f"Processed JSON file {filename}: {len(chunks)} chunks")
-            return chunks
-
+            return self._json_chunks(content, patient_id, filename)
         except Exception as e:
             logger.error(f"Error processing JSON: {str(e)}")
             return []
 
+    def _json_chunks(self, content: bytes, patient_id: str, filename: str) -> List[Dict[str, Any]]:
+        """Create chunks from JSON patient data, raising on malformed input"""
+        data = json.loads(content.decode('utf-8'))
+        chunks = []
+
+        # Create chunks from different sections
+        # Patient demographics
+        if 'demographics' in data:
+            demo = data['demographics']
+            text = "PATIENTENDATEN / DEMOGRAPHIE:\n\n"
+            text += f"Der Patient heißt {demo.get('name', 'Unknown')}.\n"
+            text += f"Der Patient ist {demo.get('age', 'Unknown')} Jahre alt.\n"
+            text += f"Geburtsdatum: {demo.get('dateOfBirth', 'Unknown')}\n"
+            text += f"Geschlecht: {demo.get('gender', 'Unknown')}\n"
+
+            chunks.append({
+                'text': text,
+                'patient_id': patient_id,
+                'source': filename,
+                'section': 'demographics'
+            })
+
+        # Admission info
+        if 'admission' in data:
+            adm = data['admission']
+            text = "AUFNAHME-INFORMATIONEN:\n"
+            text += f"Aufnahmedatum: {adm.get('admissionDate', 'Unknown')}\n"
+            text += f"Abteilung: {adm.get('department', 'Unknown')}\n"
+            text += f"Station: {adm.get('ward', 'Unknown')}\n"
+            text += f"Aufnahmegrund: {adm.get('admissionReason', 'Unknown')}\n"
+
+            if 'dischargeDate' in adm and adm['dischargeDate']:
+                text += f"Entlassungsdatum: {adm['dischargeDate']}\n"
+                text += f"Aufenthaltsdauer: {adm.get('lengthOfStay', 'Unknown')} Tage\n"
+
+            chunks.append({
+                'text': text,
+                'patient_id': patient_id,
+                'source': filename,
+                'section': 'admission'
+            })
+
+        # Diagnoses
+        if 'diagnoses' in data:
+            text = "DIAGNOSEN:\n"
+            for diag in data['diagnoses']:
+                text += f"\n- {diag.get('description', 'Unknown')} ({diag.get('code', 'N/A')})\n"
+                text += f"  Typ: {diag.get('type', 'Unknown')}\n"
+                text += f"  Diagnosedatum: {diag.get('diagnosedDate', 'Unknown')}\n"
+
+            chunks.append({
+                'text': text,
+                'patient_id': patient_id,
+                'source': filename,
+                'section': 'diagnoses'
+            })
+
+        # Medications
+        if 'medications' in data:
+            text = "MEDIKATION:\n"
+            for med in data['medications']:
+                text += f"\n- {med.get('name', 'Unknown')} {med.get('dose', '')}\n"
+                text += f"  Frequenz: {med.get('frequency', 'Unknown')}\n"
+                text += f"  Verabreichung: {med.get('route', 'Unknown')}\n"
+                text += f"  Indikation: {med.get('indication', 'Unknown')}\n"
+                text += f"  Start: {med.get('startDate', 'Unknown')}\n"
+
+            chunks.append({
+                'text': text,
+                'patient_id': patient_id,
+                'source': filename,
+                'section': 'medications'
+            })
+
+        # Allergies
+        if 'allergies' in data and data['allergies']:
+            text = "ALLERGIEN:\n"
+            for allergy in data['allergies']:
+                text += f"- {allergy.get('substance', 'Unknown')}: {allergy.get('reaction', 'Unknown')} "
+                text += f"(Schwere: {allergy.get('severity', 'Unknown')})\n"
+
+            chunks.append({
+                'text': text,
+                'patient_id': patient_id,
+                'source': filename,
+                'section': 'allergies'
+            })
+
+        # Procedures
+        if 'procedures' in data:
+            text = "DURCHGEFÜHRTE PROZEDUREN:\n"
+            for proc in data['procedures']:
+                text += f"\n- {proc.get('name', 'Unknown')}\n"
+                text += f"  Datum: {proc.get('date', 'Unknown')}\n"
+                text += f"  Beschreibung: {proc.get('description', 'N/A')}\n"
+
+            chunks.append({
+                'text': text,
+                'patient_id': patient_id,
+                'source': filename,
+                'section': 'procedures'
+            })
+
+        # Vital signs
+        if 'vitalSigns' in data:
+            text = "VITALPARAMETER:\n"
+            for vital in data['vitalSigns'][:5]:  # Last 5 measurements
+                text += f"\n{vital.get('timestamp', 'Unknown')}:\n"
+                text += f"  RR: {vital.get('bloodPressure', 'N/A')} mmHg\n"
+                text += f"  HF: {vital.get('heartRate', 'N/A')}/min\n"
+                text += f"  Temp: {vital.get('temperature', 'N/A')}°C\n"
+                text += f"  SpO2: {vital.get('oxygenSaturation', 'N/A')}%\n"
+                text += f"  AF: {vital.get('respiratoryRate', 'N/A')}/min\n"
+
+            chunks.append({
+                'text': text,
+                'patient_id': patient_id,
+                'source': filename,
+                'section': 'vital_signs'
+            })
+
+        # Cohort search filters on admission metadata, so every chunk carries it
+        adm = data.get('admission', {})
+        metadata = {}
+        if adm.get('department'):
+            metadata['department'] = adm['department']
+        if adm.get('admissionDate'):
+            metadata['admission_date'] = adm['admissionDate']
+        for chunk in chunks:
+            chunk.update(metadata)
+
+        logger.info(f"Processed JSON file {filename}: {len(chunks)} chunks")
+        return chunks
+
     def process_pdf(self, content: bytes, patient_id: str, filename: str) -> List[Dict[str, Any]]:
         """Process PDF document"""
         try:
             pdf_file = io.BytesIO(content)
             reader = PdfReader(pdf_file)
 
-            full_text = ""
-            for page in reader.pages:
-                full_text += page.extract_text() + "\n"
-
-            # Split into chunks
-            chunks = self._split_text(full_text, patient_id, filename)
+            # Split into chunks page by page
+            pages = (page.extract_text() + "\n" for page in reader.pages)
+            chunks = list(self._split_stream(pages, patient_id, filename))
 
             logger.info(f"Processed PDF file {filename}: {len(chunks)} chunks")
             return chunks
@@ -181,42 +272,66 @@ class DocumentService:
 
     def _split_text(self, text: str, patient_id: str, filename: str) -> List[Dict[str, Any]]:
         """Split text into chunks with overlap"""
-        chunks = []
+        return list(self._split_stream([text], patient_id, filename))
+
+    def _split_stream(self, pieces: Iterable[str], patient_id: str, filename: str) -> Iterator[Dict[str, Any]]:
+        """Split a stream of text pieces into overlapping chunks
+
+        Only the text that can still be part of a future chunk is buffered, so
+        memory stays bounded regardless of the document size.
+        """
+        buffer = ""
         start = 0
+        pieces = iter(pieces)
+        exhausted = False
+
+        while True:
+            # Read until a full chunk is available or the input ends
+            while not exhausted and len(buffer) <= start + self.chunk_size:
+                piece = next(pieces, None)
+                if piece is None:
+                    exhausted = True
+                else:
+                    buffer += piece
+
+            if start >= len(buffer):
+                break
 
-        while start < len(text):
             end = start + self.chunk_size
 
             # Try to break at a newline or space
-            if end < len(text):
+            if end < len(buffer):
                 # Look for newline
-                newline_pos = text.rfind('\n', start, end)
+                newline_pos = buffer.rfind('\n', start, end)
                 if newline_pos > start + self.chunk_size // 2:
                     end = newline_pos
                 else:
                     # Look for space
-                    space_pos = text.rfind(' ', start, end)
+                    space_pos = buffer.rfind(' ', start, end)
                     if space_pos > start + self.chunk_size // 2:
                         end = space_pos
 
-            chunk_text = text[start:end].strip()
+            chunk_text = buffer[start:end].strip()
 
             if chunk_text:
-                chunks.append({
+                yield {
                     'text': chunk_text,
                     'patient_id': patient_id,
                     'source': filename,
                     'section': 'document'
-                })
+                }
 
             start = end - self.chunk_overlap
 
-        return chunks
+            # Drop text that no later chunk can reach
+            if start > self.read_block_size:
+                buffer = buffer[start:]
+                start = 0
 
     def get_available_patients(self) -> List[Dict[str, Any]]:
         """Get list of available patients from sample data"""
         patients = []
-        sample_data_dir = "/app/sample-data"
+        sample_data_dir = os.getenv("SAMPLE_DATA_DIR", "/app/sample-data")
 
         try:
             if not os.path.exists(sample_data_dir):
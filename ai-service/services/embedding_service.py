@@ -1,17 +1,88 @@
 import os
+import time
+import random
 import logging
-from typing import List
-from openai import OpenAI
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+from openai import OpenAI, RateLimitError, APIStatusError
 import requests
 
+from services.metrics import observe_stage, record_cache, EMBEDDING_TEXTS, EMBEDDING_TOKENS
+from services.tracing import set_attributes
+from services.embedding_sidecar import EmbeddingSidecarClient
+
 logger = logging.getLogger(__name__)
 
+# Per-request limits of the OpenAI embeddings endpoint
+OPENAI_MAX_INPUTS_PER_REQUEST = 2048
+OPENAI_MAX_TOKENS_PER_INPUT = 8191
+
+# USD per 1M input tokens, used for ingest cost reporting
+OPENAI_EMBEDDING_PRICES = {
+    "text-embedding-3-small": 0.02,
+    "text-embedding-3-large": 0.13,
+    "text-embedding-ada-002": 0.10,
+}
+
+# OpenAI embedding usage of the current ingest, set while collect_ingest_stats() is active
+_ingest_stats: ContextVar[Optional[Dict[str, Any]]] = ContextVar("embedding_ingest_stats", default=None)
+
+
+@contextmanager
+def collect_ingest_stats():
+    """Add up the OpenAI embedding usage of all create_embeddings calls made in this context"""
+    stats = {'texts': 0, 'requests': 0, 'failed_requests': 0, 'tokens': 0, 'seconds': 0.0, 'cost_usd': None}
+    token = _ingest_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _ingest_stats.reset(token)
+
+
+def _add_ingest_stats(stats: Dict[str, Any]):
+    total = _ingest_stats.get()
+    if total is None:
+        return
+    for key in ('texts', 'requests', 'failed_requests', 'tokens', 'seconds'):
+        total[key] += stats[key]
+    if stats['cost_usd'] is not None:
+        total['cost_usd'] = (total['cost_usd'] or 0.0) + stats['cost_usd']
+
 
 class EmbeddingService:
     """Service for creating embeddings from text"""
 
-    def __init__(self):
+    def __init__(self, use_sidecar: bool = True):
         self.model_type = os.getenv("MODEL_TYPE", "local")
+        self._dimension: Optional[int] = None
+        self.sidecar: Optional[EmbeddingSidecarClient] = None
+
+        # LRU cache for query embeddings (chat questions, report queries)
+        self.query_cache_size = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "512"))
+        self._query_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+
+        # Shared embedding process, so uvicorn workers do not each load the model
+        sidecar_socket = os.getenv("EMBEDDING_SIDECAR_SOCKET") if use_sidecar else None
+        if sidecar_socket:
+            try:
+                self.sidecar = EmbeddingSidecarClient(
+                    sidecar_socket,
+                    connect_timeout=float(os.getenv("EMBEDDING_SIDECAR_CONNECT_TIMEOUT", "30"))
+                )
+                self.client = self.sidecar
+                self.model_type = self.sidecar.info['model_type']
+                self.embedding_model = self.sidecar.info['embedding_model']
+                self._dimension = self.sidecar.dimension
+                logger.info(f"Using embedding sidecar at {sidecar_socket} with model: {self.embedding_model}")
+                return
+            except Exception as e:
+                logger.error(f"Embedding sidecar at {sidecar_socket} unavailable, loading the model in-process: {str(e)}")
 
         if self.model_type == "openai":
             self.embedding_model = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
@@ -21,6 +92,16 @@ class EmbeddingService:
                 self.model_type = "local"
             else:
                 self.client = OpenAI(api_key=api_key)
+                self.batch_max_tokens = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+                self.batch_max_inputs = min(
+                    int(os.getenv("EMBEDDING_BATCH_MAX_INPUTS", str(OPENAI_MAX_INPUTS_PER_REQUEST))),
+                    OPENAI_MAX_INPUTS_PER_REQUEST
+                )
+                self.max_concurrency = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+                self.max_retries = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+                self._encoding = None
+                self._throttle_lock = threading.Lock()
+                self._throttle_until = 0.0
                 logger.info(f"Initialized OpenAI embeddings with model: {self.embedding_model}")
                 return
         elif self.model_type == "ollama":
@@ -44,45 +125,78 @@ class EmbeddingService:
                 self.client = None
                 self.embedding_model = "dummy"
 
+    @property
+    def metrics_backend(self) -> str:
+        """Backend label used for metrics"""
+        return self.model_type if self.client else "dummy"
+
     def create_embedding(self, text: str) -> List[float]:
         """Create embedding for a single text"""
+        with self._query_cache_lock:
+            cached = self._query_cache.get(text)
+            if cached is not None:
+                self._query_cache.move_to_end(text)
+        record_cache("query_embedding", cached is not None)
+        if cached is not None:
+            return cached
+
         try:
             if not self.client:
                 # Return dummy embedding if no client
                 logger.warning("Using dummy embedding (no client configured)")
                 return [0.0] * self.get_embedding_dimension()
 
-            if self.model_type == "local":
-                # Local sentence-transformers
-                embedding = self.client.encode(text, convert_to_numpy=True)
-                return embedding.tolist()
-
-            elif self.client == "ollama":
-                # Ollama embedding
-                response = requests.post(
-                    f"{self.ollama_base_url}/api/embeddings",
-                    json={
-                        "model": self.embedding_model,
-                        "prompt": text
-                    },
-                    timeout=30
-                )
-                response.raise_for_status()
-                return response.json()["embedding"]
+            with observe_stage("embedding", "embed_single", self.metrics_backend):
+                embedding = self._embed_single(text)
+            EMBEDDING_TEXTS.labels(self.metrics_backend).inc()
 
-            else:
-                # OpenAI embedding
-                response = self.client.embeddings.create(
-                    model=self.embedding_model,
-                    input=text
-                )
-                return response.data[0].embedding
+            # Only successful embeddings are cached, never dummy fallbacks
+            if self.query_cache_size > 0:
+                with self._query_cache_lock:
+                    self._query_cache[text] = embedding
+                    if len(self._query_cache) > self.query_cache_size:
+                        self._query_cache.popitem(last=False)
+
+            return embedding
 
         except Exception as e:
             logger.error(f"Error creating embedding: {str(e)}")
             # Return dummy embedding on error
             return [0.0] * self.get_embedding_dimension()
 
+    def _embed_single(self, text: str) -> List[float]:
+        """Call the configured backend for a single text"""
+        if self.sidecar:
+            return self.sidecar.embed([text])[0].tolist()
+
+        elif self.model_type == "local":
+            # Local sentence-transformers
+            embedding = self.client.encode(text, convert_to_numpy=True)
+            return embedding.tolist()
+
+        elif self.client == "ollama":
+            # Ollama embedding
+            response = requests.post(
+                f"{self.ollama_base_url}/api/embeddings",
+                json={
+                    "model": self.embedding_model,
+                    "prompt": text
+                },
+                timeout=30
+            )
+            response.raise_for_status()
+            return response.json()["embedding"]
+
+        else:
+            # OpenAI embedding
+            response = self.client.embeddings.create(
+                model=self.embedding_model,
+                input=text
+            )
+            if response.usage:
+                EMBEDDING_TOKENS.labels(self.metrics_backend).inc(response.usage.prompt_tokens)
+            return response.data[0].embedding
+
     def create_embeddings(self, texts: List[str]) -> List[List[float]]:
         """Create embeddings for multiple texts"""
         try:
@@ -90,33 +204,240 @@ class EmbeddingService:
                 logger.warning("Using dummy embeddings (no client configured)")
                 return [[0.0] * self.get_embedding_dimension() for _ in texts]
 
-            if self.model_type == "local":
-                # Local sentence-transformers (batch encoding)
-                embeddings = self.client.encode(texts, convert_to_numpy=True, show_progress_bar=False)
-                return [emb.tolist() for emb in embeddings]
+            EMBEDDING_TEXTS.labels(self.metrics_backend).inc(len(texts))
 
-            elif self.client == "ollama":
-                # Ollama doesn't support batch embeddings, so we do them one by one
-                embeddings = []
-                for text in texts:
-                    embedding = self.create_embedding(text)
-                    embeddings.append(embedding)
-                return embeddings
+            with observe_stage("embedding", "embed_batch", self.metrics_backend):
+                set_attributes({'embedding.texts': len(texts), 'embedding.model': self.embedding_model})
+                if self.sidecar:
+                    return self.sidecar.embed(texts).tolist()
 
-            else:
-                # OpenAI batch embeddings
-                response = self.client.embeddings.create(
-                    model=self.embedding_model,
-                    input=texts
-                )
-                return [item.embedding for item in response.data]
+                elif self.model_type == "local":
+                    # Local sentence-transformers (batch encoding)
+                    embeddings = self.client.encode(texts, convert_to_numpy=True, show_progress_bar=False)
+                    return [emb.tolist() for emb in embeddings]
+
+                elif self.client == "ollama":
+                    # Ollama doesn't support batch embeddings, so we do them one by one
+                    embeddings = []
+                    for text in texts:
+                        try:
+                            embeddings.append(self._embed_single(text))
+                        except Exception as e:
+                            logger.error(f"Error creating embedding: {str(e)}")
+                            embeddings.append([0.0] * self.get_embedding_dimension())
+                    return embeddings
+
+                else:
+                    # OpenAI: token-bounded sub-batches sent in parallel
+                    embeddings, stats = self._create_openai_embeddings(texts)
+                    _add_ingest_stats(stats)
+                    return embeddings
 
         except Exception as e:
             logger.error(f"Error creating embeddings: {str(e)}")
             return [[0.0] * self.get_embedding_dimension() for _ in texts]
 
+    def _create_openai_embeddings(self, texts: List[str]) -> Tuple[List[List[float]], Dict[str, Any]]:
+        """Embed texts with OpenAI using token-bounded batches and bounded parallelism
+
+        Returns the embeddings and the usage of this call (tokens, requests,
+        tokens/s and estimated cost).
+        """
+        if not texts:
+            return [], {'texts': 0, 'requests': 0, 'failed_requests': 0, 'tokens': 0, 'seconds': 0.0, 'cost_usd': None}
+
+        start_time = time.perf_counter()
+        inputs, token_counts = self._prepare_openai_inputs(texts)
+        batches = self._plan_openai_batches(token_counts)
+
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        failed_batches = 0
+
+        def run_batch(indices: List[int]):
+            return indices, self._embed_openai_batch([inputs[i] for i in indices])
+
+        workers = max(1, min(self.max_concurrency, len(batches)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Sub-batch requests stay part of the caller's trace
+            futures = [executor.submit(contextvars.copy_context().run, run_batch, indices) for indices in batches]
+            for future in futures:
+                try:
+                    indices, vectors = future.result()
+                    for i, vector in zip(indices, vectors):
+                        embeddings[i] = vector
+                except Exception as e:
+                    # Only the failed sub-batch falls back to dummy vectors
+                    failed_batches += 1
+                    logger.error(f"Error creating embeddings for sub-batch: {str(e)}")
+
+        dimension = self.get_embedding_dimension()
+        result = [vector if vector is not None else [0.0] * dimension for vector in embeddings]
+
+        elapsed = time.perf_counter() - start_time
+        total_tokens = sum(token_counts)
+        EMBEDDING_TOKENS.labels(self.metrics_backend).inc(total_tokens)
+        set_attributes({'embedding.tokens': total_tokens, 'embedding.requests': len(batches)})
+        price = OPENAI_EMBEDDING_PRICES.get(self.embedding_model)
+        stats = {
+            'texts': len(texts),
+            'requests': len(batches),
+            'failed_requests': failed_batches,
+            'tokens': total_tokens,
+            'seconds': round(elapsed, 3),
+            'tokens_per_sec': round(total_tokens / elapsed, 1) if elapsed > 0 else 0.0,
+            # Not rounded, small batches are added up per ingest
+            'cost_usd': total_tokens * price / 1_000_000 if price is not None else None
+        }
+        logger.info(
+            f"Embedded {len(texts)} texts in {len(batches)} requests: {total_tokens} tokens, "
+            f"{stats['tokens_per_sec']} tokens/s, "
+            f"estimated cost ${stats['cost_usd'] or 0.0:.6f}"
+        )
+        return result, stats
+
+    def _get_encoding(self):
+        """Lazily load the tiktoken encoding for the embedding model"""
+        if self._encoding is None:
+            try:
+                import tiktoken
+                try:
+                    self._encoding = tiktoken.encoding_for_model(self.embedding_model)
+                except KeyError:
+                    self._encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                logger.warning(f"tiktoken unavailable, estimating token counts: {str(e)}")
+                self._encoding = False
+        return self._encoding
+
+    def _prepare_openai_inputs(self, texts: List[str]):
+        """Count tokens per text and truncate inputs above the per-input limit"""
+        encoding = self._get_encoding()
+        inputs = []
+        token_counts = []
+
+        for text in texts:
+            if encoding:
+                tokens = encoding.encode(text, disallowed_special=())
+                if len(tokens) > OPENAI_MAX_TOKENS_PER_INPUT:
+                    logger.warning(f"Truncating embedding input from {len(tokens)} tokens")
+                    tokens = tokens[:OPENAI_MAX_TOKENS_PER_INPUT]
+                    text = encoding.decode(tokens)
+                token_counts.append(len(tokens))
+            else:
+                # Rough estimate of ~4 characters per token
+                max_chars = OPENAI_MAX_TOKENS_PER_INPUT * 3
+                if len(text) > max_chars:
+                    text = text[:max_chars]
+                token_counts.append(len(text) // 4 + 1)
+            # The API rejects empty inputs
+            inputs.append(text if text else " ")
+
+        return inputs, token_counts
+
+    def _plan_openai_batches(self, token_counts: List[int]) -> List[List[int]]:
+        """Group input indices into batches bounded by token and input count"""
+        batches = []
+        current: List[int] = []
+        current_tokens = 0
+
+        for i, count in enumerate(token_counts):
+            if current and (
+                current_tokens + count > self.batch_max_tokens
+                or len(current) >= self.batch_max_inputs
+            ):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(i)
+            current_tokens += count
+
+        if current:
+            batches.append(current)
+        return batches
+
+    def _embed_openai_batch(self, batch: List[str]) -> List[List[float]]:
+        """Send one sub-batch, honoring rate-limit headers with adaptive backoff"""
+        attempt = 0
+        while True:
+            self._wait_for_throttle()
+            try:
+                raw = self.client.with_options(max_retries=0).embeddings.with_raw_response.create(
+                    model=self.embedding_model,
+                    input=batch
+                )
+                self._update_throttle(raw.headers)
+                response = raw.parse()
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+            except (RateLimitError, APIStatusError) as e:
+                retryable = isinstance(e, RateLimitError) or e.status_code >= 500
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(e.response.headers, attempt)
+                logger.warning(
+                    f"Embedding request failed with status {e.status_code}, "
+                    f"retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries})"
+                )
+                self._throttle_for(delay)
+                attempt += 1
+
+    def _wait_for_throttle(self):
+        """Block while a shared rate-limit backoff is active"""
+        with self._throttle_lock:
+            delay = self._throttle_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _throttle_for(self, delay: float):
+        """Pause all sub-batches for the given number of seconds"""
+        with self._throttle_lock:
+            self._throttle_until = max(self._throttle_until, time.monotonic() + delay)
+
+    def _update_throttle(self, headers):
+        """Slow down proactively when the remaining token budget is nearly used up"""
+        try:
+            remaining = headers.get("x-ratelimit-remaining-tokens")
+            if remaining is not None and int(remaining) < self.batch_max_tokens:
+                reset = _parse_reset_duration(headers.get("x-ratelimit-reset-tokens"))
+                if reset:
+                    self._throttle_for(reset)
+        except ValueError:
+            pass
+
+    def _retry_delay(self, headers, attempt: int) -> float:
+        """Backoff delay from Retry-After headers, or exponential with jitter"""
+        for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+            value = headers.get(name) if headers else None
+            if value:
+                try:
+                    return float(value) * scale
+                except ValueError:
+                    pass
+        if headers:
+            reset = _parse_reset_duration(headers.get("x-ratelimit-reset-tokens"))
+            if reset:
+                return reset
+        return min(60.0, 0.5 * (2 ** attempt)) * (1 + random.random() * 0.25)
+
     def get_embedding_dimension(self) -> int:
-        """Get the dimension of embeddings"""
+        """Get the dimension of embeddings, detected from the model on first use"""
+        if self._dimension is None:
+            self._dimension = self._detect_dimension()
+        return self._dimension
+
+    def _detect_dimension(self) -> int:
+        """Embed a probe text to learn the model's dimension"""
+        if self.client:
+            try:
+                dimension = len(self._embed_single("dimension probe"))
+                logger.info(f"Detected embedding dimension {dimension} for {self.embedding_model}")
+                return dimension
+            except Exception as e:
+                logger.warning(f"Could not detect embedding dimension, using default: {str(e)}")
+        return self._default_dimension()
+
+    def _default_dimension(self) -> int:
+        """Known dimensions of the default models"""
         if self.model_type == "local":
             # all-MiniLM-L6-v2 has 384 dimensions
             return 384
@@ -129,3 +450,30 @@ class EmbeddingService:
             return 3072
         else:
             return 384  # Default for local models
+
+
+def _parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parse OpenAI reset durations such as '1s', '6m0s' or '250ms' into seconds"""
+    if not value:
+        return None
+
+    total = 0.0
+    number = ""
+    i = 0
+    while i < len(value):
+        char = value[i]
+        if char.isdigit() or char == ".":
+            number += char
+        else:
+            unit = "ms" if value.startswith("ms", i) else char
+            i += len(unit) - 1
+            scale = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}.get(unit)
+            if scale is None or not number:
+                return None
+            total += float(number) * scale
+            number = ""
+        i += 1
+
+    if number:
+        total += float(number)
+    return total
@@ -0,0 +1,299 @@
+"""Shared embedding process for multi-worker deployments.
+
+One process holds the embedding model and serves every uvicorn worker over a
+Unix socket. Requests of all workers are collected into micro-batches, and
+the vectors are written straight into a shared-memory buffer owned by the
+calling worker thread, so only texts and a small header cross the socket.
+
+Usage (from the ai-service directory):
+    python -m services.embedding_sidecar --socket /tmp/embedding.sock
+    EMBEDDING_SIDECAR_SOCKET=/tmp/embedding.sock uvicorn main:app --workers 4
+"""
+import os
+import sys
+import mmap
+import json
+import time
+import queue
+import atexit
+import socket
+import struct
+import logging
+import argparse
+import threading
+import socketserver
+from multiprocessing import shared_memory
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Every message is a JSON object prefixed with its length
+HEADER = struct.Struct("!I")
+
+# Rows allocated for a fresh result buffer, grown on demand
+MIN_BUFFER_ROWS = 64
+
+
+def _send(conn: socket.socket, message: Dict[str, Any]):
+    data = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    conn.sendall(HEADER.pack(len(data)) + data)
+
+
+def _recv(conn: socket.socket) -> Optional[Dict[str, Any]]:
+    """Read one message, None if the peer closed the connection"""
+    header = _recv_exact(conn, HEADER.size)
+    if header is None:
+        return None
+    body = _recv_exact(conn, HEADER.unpack(header)[0])
+    if body is None:
+        return None
+    return json.loads(body)
+
+
+def _attach(name: str) -> mmap.mmap:
+    """Map a worker's result buffer
+
+    Opened directly rather than via SharedMemory(name=...), which would hand
+    the segment to this process's resource tracker and unlink it on exit.
+    """
+    fd = os.open(f"/dev/shm/{name}", os.O_RDWR)
+    try:
+        return mmap.mmap(fd, 0)
+    finally:
+        os.close(fd)
+
+
+def _recv_exact(conn: socket.socket, size: int) -> Optional[bytes]:
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = conn.recv(size - len(buf))
+        if not chunk:
+            return None
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+class _EmbedRequest:
+    __slots__ = ("texts", "out", "error", "done")
+
+    def __init__(self, texts: List[str], out: np.ndarray):
+        self.texts = texts
+        self.out = out
+        self.error: Optional[str] = None
+        self.done = threading.Event()
+
+
+class EmbeddingSidecarServer:
+    """Serves one embedding model to all API workers with cross-worker batching"""
+
+    def __init__(self, embedding_service, socket_path: str):
+        self.embedding_service = embedding_service
+        self.socket_path = socket_path
+        self.max_batch = int(os.getenv("EMBEDDING_SIDECAR_MAX_BATCH", "64"))
+        self.batch_wait = float(os.getenv("EMBEDDING_SIDECAR_BATCH_WAIT_MS", "2")) / 1000
+        self.info = {
+            'model_type': embedding_service.metrics_backend,
+            'embedding_model': embedding_service.embedding_model,
+            'dimension': embedding_service.get_embedding_dimension()
+        }
+        self._queue: "queue.Queue[_EmbedRequest]" = queue.Queue()
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        sidecar = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                sidecar._handle(self.request)
+
+        server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        server.daemon_threads = True
+        threading.Thread(target=self._batch_loop, name="embedding-batcher", daemon=True).start()
+        logger.info(
+            f"Embedding sidecar for {self.info['embedding_model']} ({self.info['dimension']} dims) "
+            f"listening on {self.socket_path}"
+        )
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            os.unlink(self.socket_path)
+
+    def _handle(self, conn: socket.socket):
+        """Serve the requests of one worker connection"""
+        buffer: Optional[mmap.mmap] = None
+        buffer_name = None
+        try:
+            while True:
+                message = _recv(conn)
+                if message is None:
+                    break
+
+                if message['op'] == 'info':
+                    _send(conn, self.info)
+                    continue
+
+                if buffer_name != message['shm']:
+                    if buffer is not None:
+                        buffer.close()
+                    buffer = _attach(message['shm'])
+                    buffer_name = message['shm']
+
+                texts = message['texts']
+                out = np.ndarray((len(texts), self.info['dimension']), dtype=np.float32, buffer=buffer)
+                request = _EmbedRequest(texts, out)
+                self._queue.put(request)
+                request.done.wait()
+                # Views must be released before the buffer can be closed
+                del out
+                request.out = None
+
+                if request.error:
+                    _send(conn, {'error': request.error})
+                else:
+                    _send(conn, {'rows': len(texts)})
+
+        except Exception as e:
+            logger.error(f"Error serving embedding sidecar connection: {str(e)}")
+        finally:
+            if buffer is not None:
+                buffer.close()
+
+    def _batch_loop(self):
+        """Embed queued requests in batches of up to max_batch texts"""
+        while True:
+            batch = [self._queue.get()]
+            count = len(batch[0].texts)
+            deadline = time.monotonic() + self.batch_wait
+            while count < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                count += len(request.texts)
+
+            try:
+                texts = [text for request in batch for text in request.texts]
+                vectors = np.asarray(self.embedding_service.create_embeddings(texts), dtype=np.float32)
+                row = 0
+                for request in batch:
+                    request.out[:] = vectors[row:row + len(request.texts)]
+                    row += len(request.texts)
+            except Exception as e:
+                logger.error(f"Error embedding sidecar batch: {str(e)}")
+                for request in batch:
+                    request.error = str(e)
+            finally:
+                for request in batch:
+                    request.done.set()
+
+
+class EmbeddingSidecarClient:
+    """Worker side of the sidecar, one connection and result buffer per thread"""
+
+    def __init__(self, socket_path: str, connect_timeout: float = 30.0):
+        self.socket_path = socket_path
+        self.connect_timeout = connect_timeout
+        self._local = threading.local()
+        self._buffers: List[shared_memory.SharedMemory] = []
+        self._buffers_lock = threading.Lock()
+        atexit.register(self.close)
+
+        # Also waits for a sidecar that is still loading its model
+        self.info = self._request({'op': 'info'})
+        self.dimension = self.info['dimension']
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts in the sidecar, returns a (len(texts), dimension) float32 array"""
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        buffer = self._buffer(len(texts))
+        reply = self._request({'op': 'embed', 'texts': texts, 'shm': buffer.name})
+        if 'error' in reply:
+            raise RuntimeError(f"Embedding sidecar error: {reply['error']}")
+        return np.ndarray((len(texts), self.dimension), dtype=np.float32, buffer=buffer.buf).copy()
+
+    def _request(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        # A sidecar restart drops the connection, so reconnect once
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                _send(conn, message)
+                reply = _recv(conn)
+                if reply is not None:
+                    return reply
+            except OSError:
+                if attempt:
+                    raise
+            conn.close()
+            self._local.conn = None
+        raise ConnectionError(f"Embedding sidecar at {self.socket_path} closed the connection")
+
+    def _connection(self) -> socket.socket:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                conn.connect(self.socket_path)
+                break
+            except OSError:
+                conn.close()
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.2)
+        self._local.conn = conn
+        return conn
+
+    def _buffer(self, rows: int) -> shared_memory.SharedMemory:
+        """Result buffer of this thread with room for at least `rows` vectors"""
+        buffer = getattr(self._local, "buffer", None)
+        needed = rows * self.dimension * 4
+        if buffer is not None and buffer.size >= needed:
+            return buffer
+
+        buffer = shared_memory.SharedMemory(create=True, size=max(rows, MIN_BUFFER_ROWS) * self.dimension * 4)
+        with self._buffers_lock:
+            old = getattr(self._local, "buffer", None)
+            if old is not None:
+                self._buffers.remove(old)
+                old.close()
+                old.unlink()
+            self._buffers.append(buffer)
+        self._local.buffer = buffer
+        return buffer
+
+    def close(self):
+        """Remove the shared-memory buffers of all threads"""
+        with self._buffers_lock:
+            for buffer in self._buffers:
+                buffer.close()
+                buffer.unlink()
+            self._buffers = []
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Shared embedding process for uvicorn workers")
+    parser.add_argument("--socket", default=os.getenv("EMBEDDING_SIDECAR_SOCKET", "/tmp/embedding.sock"))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    from services.embedding_service import EmbeddingService
+    EmbeddingSidecarServer(EmbeddingService(use_sidecar=False), args.socket).serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
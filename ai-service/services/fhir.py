@@ -0,0 +1,271 @@
+"""Streaming ingestion of FHIR R4 Bundles.
+
+Bundles are parsed incrementally with ijson, one `entry[].resource` at a
+time, so a multi-hundred-MB export never has to fit into memory. Patient,
+Encounter, Condition, MedicationStatement, AllergyIntolerance, Procedure and
+Observation resources are rendered into the same sections as our own
+patient.json schema. Lines of a section are collected until a chunk is
+full, which keeps memory bounded by the number of sections times the chunk
+size.
+"""
+import logging
+from datetime import date
+from typing import List, Dict, Any, Iterator, Optional, BinaryIO
+
+import ijson
+
+logger = logging.getLogger(__name__)
+
+# Heading of each section's chunks, matching DocumentService.process_json
+SECTION_TITLES = {
+    'demographics': "PATIENTENDATEN / DEMOGRAPHIE:",
+    'admission': "AUFNAHME-INFORMATIONEN:",
+    'diagnoses': "DIAGNOSEN:",
+    'medications': "MEDIKATION:",
+    'allergies': "ALLERGIEN:",
+    'procedures': "DURCHGEFÜHRTE PROZEDUREN:",
+    'vital_signs': "VITALPARAMETER:",
+    'labs': "LABORWERTE UND BEFUNDE:"
+}
+
+
+def is_fhir_bundle(path: str) -> bool:
+    """Whether a JSON file is a FHIR Bundle, judged from its top-level resourceType"""
+    # FHIR does not fix the key order, so id/meta/text may come first; the
+    # parse stops at the top-level key and never builds the document
+    with open(path, 'rb') as f:
+        try:
+            for prefix, event, value in ijson.parse(f):
+                if prefix == 'resourceType' and event == 'string':
+                    return value == 'Bundle'
+        except ijson.JSONError:
+            return False
+    return False
+
+
+def iter_resources(f: BinaryIO) -> Iterator[Dict[str, Any]]:
+    """Resources of a Bundle, parsed one entry at a time"""
+    yield from ijson.items(f, 'entry.item.resource', use_float=True)
+
+
+class BundleChunker:
+    """Turns a stream of FHIR resources into section chunks for one patient"""
+
+    def __init__(self, patient_id: str, filename: str, chunk_size: int):
+        self.patient_id = patient_id
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.metadata: Dict[str, Any] = {}
+        self.counts: Dict[str, int] = {}
+        self._lines: Dict[str, List[str]] = {}
+        self._chars: Dict[str, int] = {}
+
+    def add(self, resource: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Chunks completed by this resource"""
+        resource_type = resource.get('resourceType')
+        self.counts[resource_type] = self.counts.get(resource_type, 0) + 1
+
+        if resource_type == 'Patient':
+            yield self._chunk('demographics', [self._patient(resource)])
+        elif resource_type == 'Encounter':
+            yield self._chunk('admission', [self._encounter(resource)])
+        elif resource_type == 'Condition':
+            yield from self._append('diagnoses', self._condition(resource))
+        elif resource_type == 'MedicationStatement':
+            yield from self._append('medications', self._medication(resource))
+        elif resource_type == 'AllergyIntolerance':
+            yield from self._append('allergies', self._allergy(resource))
+        elif resource_type == 'Procedure':
+            yield from self._append('procedures', self._procedure(resource))
+        elif resource_type == 'Observation':
+            section = 'vital_signs' if _has_category(resource, 'vital-signs') else 'labs'
+            yield from self._append(section, self._observation(resource))
+
+    def flush(self) -> Iterator[Dict[str, Any]]:
+        """Chunks of the sections that are still collecting lines"""
+        for section in SECTION_TITLES:
+            if self._lines.get(section):
+                yield self._chunk(section, self._lines.pop(section))
+                self._chars[section] = 0
+
+    def _append(self, section: str, line: str) -> Iterator[Dict[str, Any]]:
+        lines = self._lines.setdefault(section, [])
+        if lines and self._chars.get(section, 0) + len(line) > self.chunk_size:
+            yield self._chunk(section, lines)
+            lines = self._lines[section] = []
+            self._chars[section] = 0
+        lines.append(line)
+        self._chars[section] = self._chars.get(section, 0) + len(line)
+
+    def _chunk(self, section: str, lines: List[str]) -> Dict[str, Any]:
+        separator = "\n\n" if section == 'demographics' else "\n"
+        return {
+            'text': SECTION_TITLES[section] + separator + "\n".join(lines),
+            'patient_id': self.patient_id,
+            'source': self.filename,
+            'section': section,
+            # Cohort search filters on admission metadata, so every chunk carries it
+            **self.metadata
+        }
+
+    def _patient(self, resource: Dict[str, Any]) -> str:
+        birth_date = resource.get('birthDate', 'Unknown')
+        text = f"Der Patient heißt {_human_name(resource.get('name'))}.\n"
+        age = _age(birth_date)
+        if age is not None:
+            text += f"Der Patient ist {age} Jahre alt.\n"
+        text += f"Geburtsdatum: {birth_date}\n"
+        text += f"Geschlecht: {resource.get('gender', 'Unknown')}\n"
+        return text
+
+    def _encounter(self, resource: Dict[str, Any]) -> str:
+        period = resource.get('period', {})
+        department = (
+            _concept(resource.get('serviceType'), None)
+            or _display(resource.get('serviceProvider'))
+            or _concept((resource.get('type') or [None])[0], None)
+        )
+        ward = next((_display(loc.get('location')) for loc in resource.get('location', []) if loc.get('location')), None)
+        reasons = [_concept(reason) for reason in resource.get('reasonCode', [])]
+
+        if not self.metadata:
+            if department:
+                self.metadata['department'] = department
+            if period.get('start'):
+                self.metadata['admission_date'] = period['start']
+
+        text = f"Aufnahmedatum: {period.get('start', 'Unknown')}\n"
+        text += f"Abteilung: {department or 'Unknown'}\n"
+        text += f"Station: {ward or 'Unknown'}\n"
+        text += f"Aufnahmegrund: {', '.join(reasons) or 'Unknown'}\n"
+        if period.get('end'):
+            text += f"Entlassungsdatum: {period['end']}\n"
+            stay = _days_between(period.get('start'), period['end'])
+            if stay is not None:
+                text += f"Aufenthaltsdauer: {stay} Tage\n"
+        return text
+
+    def _condition(self, resource: Dict[str, Any]) -> str:
+        code = _coding(resource.get('code'))
+        category = _concept((resource.get('category') or [None])[0])
+        onset = resource.get('onsetDateTime') or resource.get('recordedDate', 'Unknown')
+        return (
+            f"\n- {_concept(resource.get('code'))} ({code.get('code', 'N/A')})\n"
+            f"  Typ: {category}\n"
+            f"  Diagnosedatum: {onset}"
+        )
+
+    def _medication(self, resource: Dict[str, Any]) -> str:
+        name = _concept(resource.get('medicationCodeableConcept'), None) or _display(resource.get('medicationReference')) or 'Unknown'
+        dosage = (resource.get('dosage') or [{}])[0]
+        dose = ""
+        dose_and_rate = (dosage.get('doseAndRate') or [{}])[0]
+        if dose_and_rate.get('doseQuantity'):
+            dose = _quantity(dose_and_rate['doseQuantity'])
+        frequency = _concept(dosage.get('timing', {}).get('code'), None) or dosage.get('text', 'Unknown')
+        start = resource.get('effectiveDateTime') or resource.get('effectivePeriod', {}).get('start', 'Unknown')
+        reasons = [_concept(reason) for reason in resource.get('reasonCode', [])]
+        return (
+            f"\n- {name} {dose}\n"
+            f"  Frequenz: {frequency}\n"
+            f"  Verabreichung: {_concept(dosage.get('route'))}\n"
+            f"  Indikation: {', '.join(reasons) or 'Unknown'}\n"
+            f"  Start: {start}"
+        )
+
+    def _allergy(self, resource: Dict[str, Any]) -> str:
+        reaction = (resource.get('reaction') or [{}])[0]
+        manifestations = [_concept(m) for m in reaction.get('manifestation', [])]
+        severity = reaction.get('severity') or resource.get('criticality', 'Unknown')
+        return f"- {_concept(resource.get('code'))}: {', '.join(manifestations) or 'Unknown'} (Schwere: {severity})"
+
+    def _procedure(self, resource: Dict[str, Any]) -> str:
+        performed = resource.get('performedDateTime') or resource.get('performedPeriod', {}).get('start', 'Unknown')
+        notes = [note.get('text', '') for note in resource.get('note', []) if note.get('text')]
+        return (
+            f"\n- {_concept(resource.get('code'))}\n"
+            f"  Datum: {performed}\n"
+            f"  Beschreibung: {' '.join(notes) or 'N/A'}"
+        )
+
+    def _observation(self, resource: Dict[str, Any]) -> str:
+        when = resource.get('effectiveDateTime') or resource.get('issued', 'Unknown')
+        parts = [f"{when}: {_concept(resource.get('code'))}: {_value(resource)}"]
+        # Blood pressure and similar panels carry their values in components
+        for component in resource.get('component', []):
+            parts.append(f"{_concept(component.get('code'))} {_value(component)}")
+        interpretation = _concept((resource.get('interpretation') or [None])[0], None)
+        if interpretation:
+            parts.append(f"({interpretation})")
+        return " ".join(parts)
+
+
+def _coding(concept: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not concept:
+        return {}
+    return (concept.get('coding') or [{}])[0]
+
+
+def _concept(concept: Optional[Dict[str, Any]], default: Optional[str] = 'Unknown') -> Optional[str]:
+    """Readable text of a CodeableConcept"""
+    if not concept:
+        return default
+    coding = _coding(concept)
+    return concept.get('text') or coding.get('display') or coding.get('code') or default
+
+
+def _display(reference: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not reference:
+        return None
+    return reference.get('display')
+
+
+def _quantity(quantity: Dict[str, Any]) -> str:
+    value = quantity.get('value')
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return f"{value} {quantity.get('unit') or quantity.get('code') or ''}".strip()
+
+
+def _value(resource: Dict[str, Any]) -> str:
+    if 'valueQuantity' in resource:
+        return _quantity(resource['valueQuantity'])
+    if 'valueCodeableConcept' in resource:
+        return _concept(resource['valueCodeableConcept'])
+    for key in ('valueString', 'valueBoolean', 'valueInteger'):
+        if key in resource:
+            return str(resource[key])
+    return ""
+
+
+def _has_category(resource: Dict[str, Any], code: str) -> bool:
+    return any(
+        coding.get('code') == code
+        for category in resource.get('category', [])
+        for coding in category.get('coding', [])
+    )
+
+
+def _human_name(names: Optional[List[Dict[str, Any]]]) -> str:
+    if not names:
+        return 'Unknown'
+    name = next((n for n in names if n.get('use') == 'official'), names[0])
+    if name.get('text'):
+        return name['text']
+    return " ".join([*name.get('given', []), name.get('family', '')]).strip() or 'Unknown'
+
+
+def _age(birth_date: str) -> Optional[int]:
+    try:
+        born = date.fromisoformat(birth_date[:10])
+    except (TypeError, ValueError):
+        return None
+    today = date.today()
+    return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+
+
+def _days_between(start: Optional[str], end: Optional[str]) -> Optional[int]:
+    try:
+        return (date.fromisoformat(end[:10]) - date.fromisoformat(start[:10])).days
+    except (TypeError, ValueError):
+        return None
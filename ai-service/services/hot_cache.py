@@ -0,0 +1,142 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from services.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+_shared: Optional["PatientHotCache"] = None
+_shared_lock = threading.Lock()
+
+
+class PatientHotCache:
+    """In-process copy of the chunks and vectors of recently opened patients
+
+    Searches of a resident patient are answered by an exact cosine search
+    over its vectors instead of a Qdrant query. Residency is bounded by
+    HOT_CACHE_MAX_PATIENTS and HOT_CACHE_MAX_MB (least recently used first)
+    and entries expire after HOT_CACHE_TTL. Writes through QdrantService drop
+    the patient's entry and bump its version; writes by other processes are
+    only picked up once the entry expires.
+    """
+
+    def __init__(self):
+        self.max_patients = int(os.getenv("HOT_CACHE_MAX_PATIENTS", "32"))
+        self.max_bytes = int(float(os.getenv("HOT_CACHE_MAX_MB", "256")) * 1024 * 1024)
+        self.ttl = float(os.getenv("HOT_CACHE_TTL", "900"))
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> "PatientHotCache":
+        """The cache of this process, shared by all QdrantService instances"""
+        global _shared
+        with _shared_lock:
+            if _shared is None:
+                _shared = cls()
+            return _shared
+
+    def version(self, patient_id: str) -> int:
+        """Counter bumped whenever the patient's chunks change"""
+        with self._lock:
+            return self._versions.get(patient_id, 0)
+
+    def put(self, collection_name: str, patient_id: str, points: List[Dict[str, Any]], version: int) -> bool:
+        """Make the scrolled points of a patient resident, False if they changed meanwhile or do not fit"""
+        points = [p for p in points if p.get('vector') is not None]
+        if not points:
+            return False
+
+        vectors = np.asarray([p['vector'] for p in points], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+        size = vectors.nbytes + sum(len(p['payload'].get('text', "")) for p in points)
+        if size > self.max_bytes:
+            logger.warning(f"Patient {patient_id} ({size / 1e6:.1f} MB) exceeds the hot cache size")
+            return False
+
+        entry = {
+            'ids': [p['id'] for p in points],
+            'payloads': [p['payload'] for p in points],
+            'vectors': vectors,
+            'bytes': size,
+            'loaded_at': time.time()
+        }
+        key = (collection_name, patient_id)
+        with self._lock:
+            if self._versions.get(patient_id, 0) != version:
+                return False
+            self._discard(key)
+            self._entries[key] = entry
+            self._bytes += size
+            while len(self._entries) > self.max_patients or self._bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+        return True
+
+    def chunk_count(self, collection_name: str, patient_id: str) -> Optional[int]:
+        """Number of resident chunks of a patient, None if it is not resident"""
+        entry = self._entry(collection_name, patient_id, record=False)
+        return len(entry['ids']) if entry is not None else None
+
+    def search(
+        self,
+        collection_name: str,
+        patient_id: str,
+        query_vector: List[float],
+        limit: int,
+        score_threshold: float,
+        with_vectors: bool = False
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Hits in the format of QdrantService.search, None if the patient is not resident"""
+        entry = self._entry(collection_name, patient_id)
+        if entry is None:
+            return None
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        scores = entry['vectors'] @ (query / norm if norm else query)
+        order = np.argsort(-scores)[:limit]
+
+        results = []
+        for i in order:
+            if scores[i] < score_threshold:
+                break
+            # Callers fill in or trim payload fields, so they get their own copy
+            result = {'id': entry['ids'][i], 'score': float(scores[i]), 'payload': dict(entry['payloads'][i])}
+            if with_vectors:
+                result['vector'] = entry['vectors'][i].tolist()
+            results.append(result)
+        return results
+
+    def invalidate(self, patient_id: str):
+        """Drop a patient from the cache after its chunks changed"""
+        with self._lock:
+            self._versions[patient_id] = self._versions.get(patient_id, 0) + 1
+            for key in [key for key in self._entries if key[1] == patient_id]:
+                self._discard(key)
+
+    def _entry(self, collection_name: str, patient_id: str, record: bool = True) -> Optional[Dict[str, Any]]:
+        key = (collection_name, patient_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry['loaded_at'] > self.ttl:
+                self._discard(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if record:
+            record_cache("patient_hot", entry is not None)
+        return entry
+
+    def _discard(self, key: Tuple[str, str]):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry['bytes']
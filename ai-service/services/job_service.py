@@ -0,0 +1,417 @@
+import os
+import json
+import time
+import uuid
+import queue
+import shutil
+import logging
+import resource
+import itertools
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+
+from services.document_service import DocumentService
+from services.rag_service import RAGService
+from services.embedding_service import collect_ingest_stats
+from services.metrics import observe_stage, UPLOAD_CHUNKS
+from services.tracing import span, set_attributes
+
+logger = logging.getLogger(__name__)
+
+# Namespace for deterministic chunk point ids
+CHUNK_ID_NAMESPACE = uuid.UUID("5b0c6f1e-3c1e-4a52-9a0e-6f1d2b7c8e41")
+
+
+class JobService:
+    """Durable background ingestion jobs backed by an append-only journal
+
+    Every state change is appended to journal.jsonl and fsynced before it is
+    acted upon. On start the journal is replayed, jobs finished longer than
+    JOB_RETENTION seconds ago are dropped, the journal is rewritten with one
+    snapshot event per remaining job and every file that has not completed
+    is queued again. A failed file is retried up to INGEST_MAX_ATTEMPTS times
+    with exponential backoff, so an unavailable Qdrant or embedding backend
+    does not fail it for good. Chunk point ids are derived from job, file and
+    chunk position, so re-processing a file after a crash overwrites the
+    points it had already written instead of duplicating them.
+
+    The journal is owned by a single process; run uvicorn with one worker or
+    point each process at its own JOBS_DIR.
+    """
+
+    def __init__(self, document_service: DocumentService, rag_service: RAGService):
+        self.document_service = document_service
+        self.rag_service = rag_service
+        self.jobs_dir = os.getenv("JOBS_DIR", "/app/data/jobs")
+        self.num_workers = int(os.getenv("INGEST_WORKERS", "2"))
+        self.batch_chunks = int(os.getenv("INGEST_BATCH_CHUNKS", "256"))
+        self.max_attempts = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+        self.retry_delay = float(os.getenv("INGEST_RETRY_DELAY", "30"))
+        self.retention = float(os.getenv("JOB_RETENTION", "604800"))
+        self.journal_path = os.path.join(self.jobs_dir, "journal.jsonl")
+
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Tuple[str, int]]" = queue.Queue()
+        self._workers: List[threading.Thread] = []
+
+    def start(self):
+        """Replay the journal, re-queue unfinished work and start the workers"""
+        if self._workers:
+            return
+
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self._replay_journal()
+        self._expire_jobs()
+        self._compact_journal()
+
+        resumed = 0
+        for job_id, job in self.jobs.items():
+            for index, file in enumerate(job['files']):
+                if file['status'] in ('queued', 'running'):
+                    file['status'] = 'queued'
+                    self._queue.put((job_id, index))
+                    resumed += 1
+        if resumed:
+            logger.info(f"Resuming {resumed} unfinished files from the job journal")
+
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker, name=f"ingest-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"Started {self.num_workers} ingestion workers (jobs dir: {self.jobs_dir})")
+
+    def create_job_dir(self) -> Tuple[str, str]:
+        """Reserve a job id and the directory its uploaded files are spooled to"""
+        job_id = uuid.uuid4().hex
+        files_dir = os.path.join(self.jobs_dir, job_id, "files")
+        os.makedirs(files_dir, exist_ok=True)
+        return job_id, files_dir
+
+    def discard_job_dir(self, job_id: str):
+        """Remove the directory of a job that was never submitted"""
+        shutil.rmtree(os.path.join(self.jobs_dir, job_id), ignore_errors=True)
+
+    def submit(self, job_id: str, patient_id: str, files: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Record a new job in the journal and queue its files"""
+        self._append({
+            'event': 'created',
+            'job_id': job_id,
+            'patient_id': patient_id,
+            'files': [{'name': f['name'], 'path': f['path'], 'bytes': f['bytes']} for f in files]
+        })
+        for index in range(len(files)):
+            self._queue.put((job_id, index))
+        self._expire_jobs()
+
+        logger.info(f"Queued job {job_id} for patient {patient_id} with {len(files)} files")
+        return self.get_job(job_id)
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Current status of a job with per-file progress"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+
+            files = []
+            for file in job['files']:
+                seconds = file['seconds']
+                if file['status'] == 'running' and file['started_at']:
+                    seconds = time.time() - file['started_at']
+                files.append({
+                    'name': file['name'],
+                    'status': file['status'],
+                    'bytes': file['bytes'],
+                    'chunks': file['chunks'],
+                    'duplicates': file['duplicates'],
+                    'seconds': round(seconds, 3),
+                    'chunks_per_sec': round(file['chunks'] / seconds, 1) if seconds > 0 else 0.0,
+                    'bytes_per_sec': round(file['bytes'] / seconds, 1) if seconds > 0 and file['status'] == 'completed' else 0.0,
+                    'attempts': file['attempts'],
+                    'error': file['error']
+                })
+
+            return {
+                'job_id': job_id,
+                'patient_id': job['patient_id'],
+                'status': self._job_status(job),
+                'created_at': job['created_at'],
+                'completed_at': job['completed_at'],
+                'files_total': len(files),
+                'files_completed': sum(1 for f in files if f['status'] == 'completed'),
+                'chunks_created': sum(f['chunks'] for f in files),
+                'chunks_deduplicated': sum(f['duplicates'] for f in files),
+                'dedup_ratio': round(sum(f['duplicates'] for f in files) / max(1, sum(f['chunks'] for f in files)), 4),
+                **self._embedding_totals(job),
+                'bytes_total': sum(f['bytes'] for f in files),
+                'process_peak_rss_mb': job['process_peak_rss_mb'],
+                'files': files
+            }
+
+    def _embedding_totals(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """OpenAI embedding usage of the completed files of a job (caller holds the lock)"""
+        tokens = sum(f['embedding_tokens'] for f in job['files'])
+        seconds = sum(f['embedding_seconds'] for f in job['files'])
+        costs = [f['embedding_cost_usd'] for f in job['files'] if f['embedding_cost_usd'] is not None]
+        return {
+            'embedding_tokens': tokens,
+            'embedding_tokens_per_sec': round(tokens / seconds, 1) if seconds > 0 else 0.0,
+            'embedding_cost_usd': round(sum(costs), 6) if costs else None
+        }
+
+    def _job_status(self, job: Dict[str, Any]) -> str:
+        statuses = {f['status'] for f in job['files']}
+        if statuses <= {'queued'}:
+            return 'queued'
+        if statuses & {'queued', 'running'}:
+            return 'running'
+        if statuses == {'failed'}:
+            return 'failed'
+        if 'failed' in statuses:
+            return 'partial'
+        return 'completed'
+
+    def _worker(self):
+        while True:
+            job_id, index = self._queue.get()
+            try:
+                self._process_file(job_id, index)
+            except Exception as e:
+                logger.error(f"Unexpected error in ingestion worker: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _process_file(self, job_id: str, index: int):
+        """Parse, embed and store one file of a job"""
+        with self._lock:
+            job = self.jobs[job_id]
+            file = job['files'][index]
+            if file['status'] == 'completed':
+                return
+            patient_id = job['patient_id']
+
+        self._append({'event': 'file_started', 'job_id': job_id, 'file': index})
+        start = time.time()
+        chunk_index = 0
+        duplicates = 0
+        batch: List[Dict[str, Any]] = []
+
+        def flush():
+            nonlocal duplicates
+            ids = [
+                str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{job_id}/{index}/{chunk_index - len(batch) + i}"))
+                for i in range(len(batch))
+            ]
+            result = self.rag_service.store_documents(patient_id, batch, ids=ids)
+            duplicates += result['duplicates']
+            self._append({
+                'event': 'file_progress',
+                'job_id': job_id,
+                'file': index,
+                'chunks': chunk_index,
+                'duplicates': duplicates
+            })
+
+        try:
+            with collect_ingest_stats() as embedding_stats, \
+                    span("ingest.file", {'job_id': job_id, 'file.name': file['name'], 'file.bytes': file['bytes']}):
+                chunks = self.document_service.process_file(file['path'], patient_id, file['name'])
+                while True:
+                    # Parsing is lazy, so chunking time is measured per batch
+                    with observe_stage("ingest", "chunk", "local"):
+                        batch = list(itertools.islice(chunks, self.batch_chunks))
+                    if not batch:
+                        break
+                    chunk_index += len(batch)
+                    flush()
+                set_attributes({'ingest.chunks': chunk_index, 'ingest.duplicates': duplicates})
+
+            if chunk_index:
+                UPLOAD_CHUNKS.observe(chunk_index)
+            self._append({
+                'event': 'file_completed',
+                'job_id': job_id,
+                'file': index,
+                'chunks': chunk_index,
+                'duplicates': duplicates,
+                'seconds': round(time.time() - start, 3),
+                'embedding_tokens': embedding_stats['tokens'],
+                'embedding_seconds': round(embedding_stats['seconds'], 3),
+                'embedding_cost_usd': embedding_stats['cost_usd'],
+                # High-water RSS of the whole process, not of this file: models, other jobs and
+                # the other ingest workers share it
+                'process_peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+            })
+            logger.info(f"Job {job_id}: processed {file['name']} ({chunk_index} chunks, {duplicates} near-duplicates skipped)")
+
+        except Exception as e:
+            logger.error(f"Job {job_id}: error processing {file['name']}: {str(e)}")
+            with self._lock:
+                attempts = file['attempts']
+            if attempts < self.max_attempts:
+                delay = self.retry_delay * 2 ** (attempts - 1)
+                self._append({
+                    'event': 'file_retrying',
+                    'job_id': job_id,
+                    'file': index,
+                    'error': str(e),
+                    'seconds': round(time.time() - start, 3)
+                })
+                logger.info(f"Job {job_id}: retrying {file['name']} in {delay:.0f}s (attempt {attempts + 1}/{self.max_attempts})")
+                timer = threading.Timer(delay, self._queue.put, args=((job_id, index),))
+                timer.daemon = True
+                timer.start()
+                return
+            self._append({
+                'event': 'file_failed',
+                'job_id': job_id,
+                'file': index,
+                'error': str(e),
+                'seconds': round(time.time() - start, 3)
+            })
+
+        self._cleanup_if_finished(job_id)
+
+    def _cleanup_if_finished(self, job_id: str):
+        """Delete the spooled files once every file of the job is done"""
+        with self._lock:
+            job = self.jobs[job_id]
+            if any(f['status'] in ('queued', 'running') for f in job['files']) or job['completed_at']:
+                return
+        self._append({'event': 'job_completed', 'job_id': job_id})
+        shutil.rmtree(os.path.join(self.jobs_dir, job_id), ignore_errors=True)
+
+    def _append(self, event: Dict[str, Any]):
+        """Durably append an event to the journal and apply it to the in-memory state"""
+        event['ts'] = time.time()
+        line = json.dumps(event, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._apply(event)
+
+    def _expire_jobs(self):
+        """Forget jobs that finished more than JOB_RETENTION seconds ago"""
+        cutoff = time.time() - self.retention
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self.jobs.items()
+                if job['completed_at'] and datetime.fromisoformat(job['completed_at']).timestamp() < cutoff
+            ]
+            for job_id in expired:
+                del self.jobs[job_id]
+        if expired:
+            logger.info(f"Expired {len(expired)} finished jobs")
+
+    def _compact_journal(self):
+        """Rewrite the journal with one snapshot event per job"""
+        path = self.journal_path + ".tmp"
+        with self._lock:
+            with open(path, 'w', encoding='utf-8') as f:
+                for job_id, job in self.jobs.items():
+                    event = {'event': 'snapshot', 'job_id': job_id, 'job': job, 'ts': time.time()}
+                    f.write(json.dumps(event, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path, self.journal_path)
+            # Make the rename itself durable
+            directory = os.open(self.jobs_dir, os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+
+    def _replay_journal(self):
+        """Rebuild job state from the journal"""
+        if not os.path.exists(self.journal_path):
+            return
+
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-write
+                    logger.warning("Skipping corrupt job journal entry")
+                    continue
+                self._apply(event)
+        logger.info(f"Replayed job journal: {len(self.jobs)} jobs")
+
+    def _apply(self, event: Dict[str, Any]):
+        """Apply a journal event to the in-memory job state (caller holds the lock)"""
+        kind = event['event']
+        if kind == 'snapshot':
+            job = event['job']
+            # Snapshots written before the field was renamed
+            job.setdefault('process_peak_rss_mb', job.pop('peak_memory_mb', 0.0))
+            self.jobs[event['job_id']] = job
+            return
+        if kind == 'created':
+            self.jobs[event['job_id']] = {
+                'patient_id': event['patient_id'],
+                'created_at': datetime.fromtimestamp(event['ts']).isoformat(),
+                'completed_at': None,
+                'process_peak_rss_mb': 0.0,
+                'files': [
+                    {
+                        'name': f['name'],
+                        'path': f['path'],
+                        'bytes': f['bytes'],
+                        'status': 'queued',
+                        'chunks': 0,
+                        'duplicates': 0,
+                        'seconds': 0.0,
+                        'started_at': None,
+                        'attempts': 0,
+                        'error': None,
+                        'embedding_tokens': 0,
+                        'embedding_seconds': 0.0,
+                        'embedding_cost_usd': None
+                    }
+                    for f in event['files']
+                ]
+            }
+            return
+
+        job = self.jobs.get(event['job_id'])
+        if job is None:
+            return
+
+        if kind == 'job_completed':
+            job['completed_at'] = datetime.fromtimestamp(event['ts']).isoformat()
+            return
+
+        file = job['files'][event['file']]
+        if kind == 'file_started':
+            file['status'] = 'running'
+            file['started_at'] = event['ts']
+            file['chunks'] = 0
+            file['duplicates'] = 0
+            file['attempts'] += 1
+            file['error'] = None
+        elif kind == 'file_progress':
+            file['chunks'] = event['chunks']
+            file['duplicates'] = event.get('duplicates', 0)
+        elif kind == 'file_completed':
+            file['status'] = 'completed'
+            file['chunks'] = event['chunks']
+            file['duplicates'] = event.get('duplicates', 0)
+            file['seconds'] = event['seconds']
+            file['embedding_tokens'] = event.get('embedding_tokens', 0)
+            file['embedding_seconds'] = event.get('embedding_seconds', 0.0)
+            file['embedding_cost_usd'] = event.get('embedding_cost_usd')
+            job['process_peak_rss_mb'] = max(
+                job['process_peak_rss_mb'], event.get('process_peak_rss_mb', event.get('peak_memory_mb', 0.0))
+            )
+        elif kind == 'file_retrying':
+            file['status'] = 'queued'
+            file['seconds'] = event['seconds']
+            file['error'] = event['error']
+        elif kind == 'file_failed':
+            file['status'] = 'failed'
+            file['seconds'] = event['seconds']
+            file['error'] = event['error']
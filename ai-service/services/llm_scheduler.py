@@ -0,0 +1,169 @@
+import os
+import math
+import time
+import heapq
+import logging
+import itertools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from services.metrics import LLM_QUEUE_DEPTH, LLM_ACTIVE_CALLS, LLM_QUEUE_WAIT, LLM_REJECTED
+
+logger = logging.getLogger(__name__)
+
+# Highest priority first
+PRIORITIES = ("interactive", "batch", "background")
+
+# Default concurrent calls per backend; a local Ollama serves few requests in parallel
+DEFAULT_CONCURRENCY = {'ollama': 2, 'openai': 16}
+
+DEFAULT_QUEUE_TIMEOUTS = {'interactive': 15, 'batch': 60, 'background': 300}
+DEFAULT_QUEUE_LIMITS = {'interactive': 32, 'batch': 8, 'background': 2}
+
+_priority: ContextVar[Optional[str]] = ContextVar("llm_priority", default=None)
+
+_shared: Optional["LLMScheduler"] = None
+_shared_lock = threading.Lock()
+
+
+class LLMOverloadedError(Exception):
+    """An LLM call was shed because its backend is saturated"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@contextmanager
+def use_priority(priority: str):
+    """Run the LLM calls of this context (e.g. a prefetched report) in another priority class"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class _BackendQueue:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.waiting: List[Tuple[int, int]] = []
+        self.condition = threading.Condition()
+        # Moving average of call durations, used for the Retry-After estimate
+        self.average_seconds = 5.0
+
+
+class LLMScheduler:
+    """Admission control and priority queuing in front of the LLM backends
+
+    Every backend runs at most LLM_MAX_CONCURRENCY_<BACKEND> calls at once.
+    Further calls wait in a priority queue, so interactive chat overtakes
+    queued batch reports. A call is shed with LLMOverloadedError when more
+    than LLM_QUEUE_LIMIT_<PRIORITY> calls of its class or higher are already
+    waiting, or when it waited longer than LLM_QUEUE_TIMEOUT_<PRIORITY>
+    seconds. Limits apply per process.
+    """
+
+    def __init__(self):
+        self.timeouts = {
+            p: float(os.getenv(f"LLM_QUEUE_TIMEOUT_{p.upper()}", str(DEFAULT_QUEUE_TIMEOUTS[p]))) for p in PRIORITIES
+        }
+        self.queue_limits = {
+            p: int(os.getenv(f"LLM_QUEUE_LIMIT_{p.upper()}", str(DEFAULT_QUEUE_LIMITS[p]))) for p in PRIORITIES
+        }
+        self._backends: Dict[str, _BackendQueue] = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> "LLMScheduler":
+        """The scheduler of this process, shared by chat and report generation"""
+        global _shared
+        with _shared_lock:
+            if _shared is None:
+                _shared = cls()
+            return _shared
+
+    def concurrency(self, backend: str) -> int:
+        """Number of calls the backend runs at once"""
+        return self._queue(backend).limit
+
+    @contextmanager
+    def slot(self, backend: str, priority: str = "batch"):
+        """Hold one of the backend's call slots for the duration of an LLM call"""
+        priority = _priority.get() or priority
+        queue = self._queue(backend)
+        waited = self._acquire(queue, backend, priority)
+        LLM_QUEUE_WAIT.labels(backend, priority).observe(waited)
+        LLM_ACTIVE_CALLS.labels(backend).inc()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            LLM_ACTIVE_CALLS.labels(backend).dec()
+            with queue.condition:
+                queue.active -= 1
+                queue.average_seconds = 0.8 * queue.average_seconds + 0.2 * duration
+                queue.condition.notify_all()
+
+    def _acquire(self, queue: _BackendQueue, backend: str, priority: str) -> float:
+        """Wait for a slot, returns the seconds spent queued"""
+        rank = PRIORITIES.index(priority)
+        start = time.monotonic()
+        deadline = start + self.timeouts[priority]
+
+        with queue.condition:
+            if queue.active < queue.limit and not queue.waiting:
+                queue.active += 1
+                return 0.0
+
+            ahead = sum(1 for entry_rank, _ in queue.waiting if entry_rank <= rank)
+            if ahead >= self.queue_limits[priority]:
+                LLM_REJECTED.labels(backend, priority, "queue_full").inc()
+                raise LLMOverloadedError(
+                    f"LLM backend {backend} is saturated ({ahead} {priority} requests queued)",
+                    self._retry_after(queue)
+                )
+
+            entry = (rank, next(self._sequence))
+            heapq.heappush(queue.waiting, entry)
+            depth = LLM_QUEUE_DEPTH.labels(backend, priority)
+            depth.inc()
+            try:
+                while not (queue.active < queue.limit and queue.waiting[0] == entry):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        queue.waiting.remove(entry)
+                        heapq.heapify(queue.waiting)
+                        queue.condition.notify_all()
+                        LLM_REJECTED.labels(backend, priority, "deadline").inc()
+                        raise LLMOverloadedError(
+                            f"LLM backend {backend} did not accept the request within {self.timeouts[priority]:g}s",
+                            self._retry_after(queue)
+                        )
+                    queue.condition.wait(remaining)
+
+                heapq.heappop(queue.waiting)
+                queue.active += 1
+                # The next waiter may fit into a slot that is still free
+                queue.condition.notify_all()
+            finally:
+                depth.dec()
+
+        return time.monotonic() - start
+
+    def _queue(self, backend: str) -> _BackendQueue:
+        with self._lock:
+            if backend not in self._backends:
+                limit = int(os.getenv(f"LLM_MAX_CONCURRENCY_{backend.upper()}", str(DEFAULT_CONCURRENCY.get(backend, 8))))
+                self._backends[backend] = _BackendQueue(limit)
+                logger.info(f"LLM scheduler: up to {limit} concurrent {backend} calls")
+            return self._backends[backend]
+
+    def _retry_after(self, queue: _BackendQueue) -> int:
+        # Caller holds the queue's condition
+        return max(1, math.ceil(queue.average_seconds * (len(queue.waiting) + 1) / queue.limit))
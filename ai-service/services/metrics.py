@@ -0,0 +1,220 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Dict, Any, Optional
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+)
+
+from services.tracing import span, set_attributes
+
+# Latency buckets from 1ms up to the 180s report timeout
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 180)
+
+STAGE_DURATION = Histogram(
+    "ai_stage_duration_seconds",
+    "Duration of individual processing stages",
+    ["component", "stage", "backend"],
+    buckets=STAGE_BUCKETS
+)
+
+REQUEST_DURATION = Histogram(
+    "ai_request_duration_seconds",
+    "Duration of HTTP requests",
+    ["endpoint", "method", "status"],
+    buckets=STAGE_BUCKETS
+)
+
+REQUESTS_IN_FLIGHT = Gauge(
+    "ai_requests_in_flight",
+    "HTTP requests currently being processed",
+    ["endpoint"],
+    multiprocess_mode="livesum"
+)
+
+LLM_TOKENS = Counter(
+    "ai_llm_tokens_total",
+    "Tokens consumed by LLM calls",
+    ["component", "backend", "kind"]
+)
+
+LLM_CACHED_TOKENS = Counter(
+    "ai_llm_cached_prompt_tokens_total",
+    "Prompt tokens served from the LLM prompt cache, as reported by the backend (OpenAI only)",
+    ["component", "backend"]
+)
+
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "ai_llm_time_to_first_token_seconds",
+    "Time until the LLM produced its first token",
+    ["component", "backend"],
+    buckets=STAGE_BUCKETS
+)
+
+EMBEDDING_TEXTS = Counter(
+    "ai_embedding_texts_total",
+    "Texts sent to the embedding backend",
+    ["backend"]
+)
+
+EMBEDDING_TOKENS = Counter(
+    "ai_embedding_tokens_total",
+    "Tokens sent to the embedding backend",
+    ["backend"]
+)
+
+PROMPT_CONTEXT_CHARS = Histogram(
+    "ai_prompt_context_chars",
+    "Characters of retrieved context, before (candidates) and after (selected) selection",
+    ["component", "selection"],
+    buckets=(500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+)
+
+INGEST_CHUNKS = Counter(
+    "ai_ingest_chunks_total",
+    "Chunks seen by the ingest dedup stage, by outcome (stored, duplicate)",
+    ["outcome"]
+)
+
+UPLOAD_CHUNKS = Histogram(
+    "ai_upload_chunks",
+    "Chunks created per uploaded file",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 10000)
+)
+
+LLM_QUEUE_DEPTH = Gauge(
+    "ai_llm_queue_depth",
+    "LLM calls waiting for a backend slot",
+    ["backend", "priority"],
+    multiprocess_mode="livesum"
+)
+
+LLM_ACTIVE_CALLS = Gauge(
+    "ai_llm_active_calls",
+    "LLM calls currently holding a backend slot",
+    ["backend"],
+    multiprocess_mode="livesum"
+)
+
+LLM_QUEUE_WAIT = Histogram(
+    "ai_llm_queue_wait_seconds",
+    "Time LLM calls waited for a backend slot",
+    ["backend", "priority"],
+    buckets=STAGE_BUCKETS
+)
+
+LLM_REJECTED = Counter(
+    "ai_llm_rejected_total",
+    "LLM calls shed by admission control, by reason (queue_full, deadline)",
+    ["backend", "priority", "reason"]
+)
+
+COALESCED_REQUESTS = Counter(
+    "ai_coalesced_requests_total",
+    "Requests answered by joining an identical computation already in flight",
+    ["endpoint"]
+)
+
+LLM_CALLS_SAVED = Counter(
+    "ai_llm_calls_saved_total",
+    "LLM calls avoided because identical requests shared one computation",
+    ["endpoint"]
+)
+
+CACHE_REQUESTS = Counter(
+    "ai_cache_requests_total",
+    "Cache lookups by result",
+    ["cache", "result"]
+)
+
+
+# Stage timings of the current request, collected only while it is being profiled
+_request_stages: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("request_stages", default=None)
+
+# LLM calls made by the current computation, collected only while counting
+_llm_calls: ContextVar[Optional[List[str]]] = ContextVar("llm_calls", default=None)
+
+
+@contextmanager
+def observe_stage(component: str, stage: str, backend: str = "none"):
+    """Record the duration of a processing stage, traced as a span when tracing is enabled"""
+    start = time.perf_counter()
+    try:
+        with span(f"{component}.{stage}", {'backend': backend}):
+            yield
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_DURATION.labels(component, stage, backend).observe(duration)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages.append({'component': component, 'stage': stage, 'backend': backend, 'seconds': round(duration, 6)})
+
+
+@contextmanager
+def collect_stages():
+    """Collect the stage timings observed in this context into a list"""
+    stages: List[Dict[str, Any]] = []
+    token = _request_stages.set(stages)
+    try:
+        yield stages
+    finally:
+        _request_stages.reset(token)
+
+
+@contextmanager
+def count_llm_calls():
+    """Collect the LLM calls made in this context (and threads started with a copy of it)"""
+    calls: List[str] = []
+    token = _llm_calls.set(calls)
+    try:
+        yield calls
+    finally:
+        _llm_calls.reset(token)
+
+
+def record_llm_usage(component: str, backend: str, prompt_tokens, completion_tokens):
+    """Record prompt and completion token counts of an LLM call"""
+    calls = _llm_calls.get()
+    if calls is not None:
+        calls.append(component)
+    if prompt_tokens:
+        LLM_TOKENS.labels(component, backend, "prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(component, backend, "completion").inc(completion_tokens)
+    set_attributes({
+        'gen_ai.system': backend,
+        'gen_ai.usage.input_tokens': prompt_tokens,
+        'gen_ai.usage.output_tokens': completion_tokens
+    })
+
+
+def record_prompt_cache(component: str, backend: str, cached_tokens, time_to_first_token):
+    """Record cached prompt tokens and time to first token of an LLM call"""
+    if cached_tokens:
+        LLM_CACHED_TOKENS.labels(component, backend).inc(cached_tokens)
+    if time_to_first_token is not None:
+        LLM_TIME_TO_FIRST_TOKEN.labels(component, backend).observe(time_to_first_token)
+
+
+def record_cache(cache: str, hit: bool):
+    """Record a cache hit or miss"""
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def render_metrics():
+    """Render all metrics in the Prometheus text format"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Aggregate metrics across uvicorn worker processes
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,185 @@
+import time
+import logging
+from typing import List, Dict, Any, Optional
+
+from qdrant_client.models import (
+    Filter, FieldCondition, MatchAny, Range, CreateAlias, CreateAliasOperation, DeleteAlias, DeleteAliasOperation
+)
+
+from services.embedding_service import EmbeddingService
+from services.qdrant_service import QdrantService, versioned_collection_name
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingMigration:
+    """Re-embeds the collection behind the alias with the configured embedding model
+
+    The new versioned collection is built next to the live one from the stored
+    chunk texts, at a throttled rate so the embedding backend
+    keeps serving queries. Readers use the alias until it is moved to the new
+    collection in one atomic operation. Points keep their ids and payloads
+    (including `ingested_at`), so every pass is idempotent and writes made
+    during the copy are picked up by catch-up passes over `ingested_at`.
+    """
+
+    def __init__(
+        self,
+        embedding_service: EmbeddingService,
+        qdrant_service: QdrantService,
+        rate: float = 50.0,
+        batch_size: int = 64
+    ):
+        self.embedding_service = embedding_service
+        self.qdrant_service = qdrant_service
+        self.client = qdrant_service.client
+        self.alias = qdrant_service.alias
+        self.rate = rate
+        self.batch_size = batch_size
+        self.target = versioned_collection_name(
+            self.alias,
+            embedding_service.embedding_model,
+            qdrant_service.embedding_dimension
+        )
+
+    def source_collection(self) -> Optional[str]:
+        """Collection the alias currently serves, or the legacy unversioned one"""
+        current = self.qdrant_service.get_aliases().get(self.alias)
+        if current:
+            return current
+        collection_names = [col.name for col in self.client.get_collections().collections]
+        return self.alias if self.alias in collection_names else None
+
+    def prepare_target(self):
+        """Create the target collection if needed and direct all writes to it"""
+        collection_names = [col.name for col in self.client.get_collections().collections]
+        if self.target not in collection_names:
+            self.qdrant_service.create_collection(self.target)
+        self.qdrant_service.use_collection(self.target)
+
+    def run(self, catch_up_rounds: int = 3, swap: bool = True, drop_legacy: bool = False) -> Dict[str, Any]:
+        """Copy everything, catch up with concurrent writes and move the alias"""
+        source = self.source_collection()
+        if source is None:
+            raise ValueError(f"Nothing to migrate, {self.alias} does not exist")
+        if source == self.target:
+            raise ValueError(f"{self.alias} already points to {self.target}")
+        if swap and source == self.alias and not drop_legacy:
+            raise ValueError(f"{self.alias} is a collection, not an alias; rerun with --no-swap or --drop-legacy")
+
+        self.prepare_target()
+        logger.info(f"Migrating {source} -> {self.target} at {self.rate} chunks/s")
+
+        started = time.time()
+        copied = self.copy(source)
+        since = started
+        for round_number in range(catch_up_rounds):
+            pass_started = time.time()
+            patient_ids = self.changed_patients(source, since)
+            if not patient_ids:
+                break
+            logger.info(f"Catch-up pass {round_number + 1}: {len(patient_ids)} patients changed during the copy")
+            copied += self.copy(source, patient_ids)
+            since = pass_started
+
+        if swap:
+            self.swap_alias(source, drop_legacy)
+
+        return {
+            'source': source,
+            'target': self.target,
+            'copied': copied,
+            'seconds': round(time.time() - started, 1),
+            # Writes of instances still on the old model after this need --catch-up-only
+            'catch_up_since': since,
+            'swapped': swap
+        }
+
+    def catch_up(self, source: str, since: float) -> int:
+        """Copy the patients written to the source collection since a timestamp"""
+        self.prepare_target()
+        patient_ids = self.changed_patients(source, since)
+        if not patient_ids:
+            return 0
+        logger.info(f"Catching up {len(patient_ids)} patients changed since {since}")
+        return self.copy(source, patient_ids)
+
+    def copy(self, source: str, patient_ids: Optional[List[str]] = None) -> int:
+        """Re-embed the points of the source collection into the target collection"""
+        scroll_filter = None
+        if patient_ids:
+            scroll_filter = Filter(must=[FieldCondition(key="patient_id", match=MatchAny(any=patient_ids))])
+
+        copied = 0
+        started = time.time()
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=source,
+                scroll_filter=scroll_filter,
+                limit=self.batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False
+            )
+            # Texts come from the chunk store, or the payload for points stored before it
+            records = self.qdrant_service.attach_texts([{'id': p.id, 'payload': dict(p.payload)} for p in points])
+            texts = {r['id']: r['payload']['text'] for r in records if r['payload']['text']}
+            points = [p for p in points if p.id in texts]
+            if points:
+                vectors = self.embedding_service.create_embeddings([texts[p.id] for p in points])
+                # create_embeddings falls back to zero vectors when the backend fails
+                if any(not any(vector) for vector in vectors):
+                    raise RuntimeError("Embedding backend returned empty vectors, aborting migration")
+                # Both collections share the chunk store, so only legacy payload texts are moved
+                self.qdrant_service.store_vectors(vectors, [p.payload for p in points], ids=[p.id for p in points])
+                copied += len(points)
+
+                # Throttle to the configured rate so live queries keep their latency
+                ahead = copied / self.rate - (time.time() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+                if copied % (self.batch_size * 20) < len(points):
+                    logger.info(f"Copied {copied} chunks to {self.target}")
+
+            if offset is None:
+                break
+
+        return copied
+
+    def changed_patients(self, source: str, since: float) -> List[str]:
+        """Patients with points written to the source collection since a timestamp"""
+        patient_ids = set()
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=source,
+                scroll_filter=Filter(must=[FieldCondition(key="ingested_at", range=Range(gte=since))]),
+                limit=256,
+                offset=offset,
+                with_payload=["patient_id"],
+                with_vectors=False
+            )
+            patient_ids.update(p.payload['patient_id'] for p in points if 'patient_id' in p.payload)
+            if offset is None:
+                break
+        return sorted(patient_ids)
+
+    def swap_alias(self, source: str, drop_legacy: bool = False):
+        """Atomically point the alias at the target collection"""
+        operations = []
+        if source == self.alias:
+            # A legacy collection carries the alias name and has to go first
+            if not drop_legacy:
+                raise ValueError(f"{self.alias} is a collection, not an alias; rerun with --drop-legacy to replace it")
+            logger.warning(f"Deleting legacy collection {self.alias}, reads fail until the alias exists")
+            self.client.delete_collection(self.alias)
+        else:
+            operations.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=self.alias)))
+
+        operations.append(CreateAliasOperation(create_alias=CreateAlias(
+            collection_name=self.target,
+            alias_name=self.alias
+        )))
+        self.client.update_collection_aliases(change_aliases_operations=operations)
+        logger.info(f"Alias {self.alias} -> {self.target}")
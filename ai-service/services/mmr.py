@@ -0,0 +1,52 @@
+import logging
+from typing import List, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def mmr_select(
+    query_vector: Sequence[float],
+    candidate_vectors: Sequence[Sequence[float]],
+    k: int,
+    lambda_mult: float = 0.7
+) -> List[int]:
+    """Select k diverse candidates by maximal marginal relevance
+
+    Each step picks the candidate maximising
+    lambda_mult * sim(query, c) - (1 - lambda_mult) * max sim(c, selected),
+    so lambda_mult=1 is plain similarity ranking and lower values favour
+    diversity. Returns candidate indices in selection order.
+    """
+    if k <= 0 or len(candidate_vectors) == 0:
+        return []
+
+    candidates = np.asarray(candidate_vectors, dtype=np.float32)
+    query = np.asarray(query_vector, dtype=np.float32)
+
+    # Cosine similarities via normalised dot products
+    candidate_norms = np.linalg.norm(candidates, axis=1, keepdims=True)
+    candidates = candidates / np.where(candidate_norms == 0, 1.0, candidate_norms)
+    query_norm = np.linalg.norm(query)
+    query = query / (query_norm if query_norm else 1.0)
+
+    relevance = candidates @ query
+    pairwise = candidates @ candidates.T
+
+    k = min(k, len(candidates))
+    selected = [int(np.argmax(relevance))]
+    # Highest similarity of every candidate to anything already selected
+    max_similarity = pairwise[selected[0]].copy()
+    available = np.ones(len(candidates), dtype=bool)
+    available[selected[0]] = False
+
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, pairwise[best], out=max_similarity)
+
+    return selected
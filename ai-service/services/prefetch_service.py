@@ -0,0 +1,119 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, Optional, Tuple
+
+from services.rag_service import RAGService
+from services.report_service import ReportService
+from services.metrics import record_cache
+from services.llm_scheduler import use_priority
+
+logger = logging.getLogger(__name__)
+
+
+class PrefetchService:
+    """Prepares a patient as soon as it is opened in the UI
+
+    Prefetching loads the patient's chunks and vectors into the hot cache,
+    builds the pinned summary context used by the stable prompt layout and,
+    with PREFETCH_REPORT enabled, starts generating the standard discharge
+    report in the background. The next /generate-report is answered from
+    that report (or waits for it) as long as no documents of the patient
+    were written in the meantime. A prefetched report is handed out once,
+    so asking again generates a new one.
+    """
+
+    def __init__(self, rag_service: RAGService, report_service: ReportService):
+        self.rag_service = rag_service
+        self.report_service = report_service
+        self.hot_cache = rag_service.qdrant_service.hot_cache
+        self.report_enabled = os.getenv("PREFETCH_REPORT", "false").lower() == "true"
+        self.report_ttl = float(os.getenv("PREFETCH_REPORT_TTL", "900"))
+        self.report_wait = float(os.getenv("PREFETCH_REPORT_WAIT", "180"))
+        self.max_reports = int(os.getenv("HOT_CACHE_MAX_PATIENTS", "32"))
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("PREFETCH_WORKERS", "2")),
+            thread_name_prefix="prefetch"
+        )
+        self._reports: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def prefetch(self, patient_id: str) -> Dict[str, Any]:
+        """Warm the caches of a patient, returns what was prepared"""
+        chunks = self.rag_service.prewarm(patient_id)
+        if not chunks:
+            return {'patient_id': patient_id, 'chunks': 0, 'report': 'skipped'}
+
+        report = 'disabled'
+        if self.report_enabled:
+            with self._lock:
+                if self._fresh_report(patient_id) is not None:
+                    report = 'ready'
+                elif patient_id in self._pending:
+                    report = 'generating'
+                else:
+                    version = self.hot_cache.version(patient_id)
+                    self._pending[patient_id] = self._executor.submit(self._generate, patient_id, version)
+                    report = 'generating'
+
+        logger.info(f"Prefetched patient {patient_id}: {chunks} chunks, report {report}")
+        return {'patient_id': patient_id, 'chunks': chunks, 'report': report}
+
+    def take_report(self, patient_id: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Remove and return the prefetched report of a patient with its creation time
+
+        Waits for a report that is still being generated.
+        """
+        with self._lock:
+            entry = self._take_fresh(patient_id)
+            future = self._pending.get(patient_id) if entry is None else None
+
+        if entry is None and future is not None:
+            try:
+                future.result(timeout=self.report_wait)
+            except FutureTimeoutError:
+                logger.warning(f"Prefetched report for patient {patient_id} not ready after {self.report_wait}s")
+            with self._lock:
+                entry = self._take_fresh(patient_id)
+
+        record_cache("prefetched_report", entry is not None)
+        return (entry['report'], entry['created_at']) if entry is not None else None
+
+    def _generate(self, patient_id: str, version: int):
+        try:
+            # Speculative work, shed first when the LLM backend is busy
+            with use_priority("background"):
+                report = self.report_service.generate_report(patient_id)
+            if 'error' in report:
+                return
+            with self._lock:
+                self._reports[patient_id] = {'report': report, 'version': version, 'created_at': time.time()}
+                self._reports.move_to_end(patient_id)
+                while len(self._reports) > self.max_reports:
+                    self._reports.popitem(last=False)
+        except Exception as e:
+            logger.error(f"Error prefetching report for patient {patient_id}: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending.pop(patient_id, None)
+
+    def _fresh_report(self, patient_id: str) -> Optional[Dict[str, Any]]:
+        # Caller holds the lock
+        entry = self._reports.get(patient_id)
+        if entry is None:
+            return None
+        if entry['version'] != self.hot_cache.version(patient_id) or time.time() - entry['created_at'] > self.report_ttl:
+            self._reports.pop(patient_id, None)
+            return None
+        return entry
+
+    def _take_fresh(self, patient_id: str) -> Optional[Dict[str, Any]]:
+        # Caller holds the lock
+        entry = self._fresh_report(patient_id)
+        if entry is not None:
+            self._reports.pop(patient_id, None)
+        return entry
@@ -0,0 +1,175 @@
+import os
+import re
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Profile ids end up in file names
+PROFILE_ID_PATTERN = re.compile(r"^[a-f0-9]{32}$")
+
+# Profiles of threadpool work done for the current request, set while it is profiled
+_thread_sessions: ContextVar[Optional[list]] = ContextVar("thread_sessions", default=None)
+
+
+class ProfilingService:
+    """Opt-in sampling profiles of single requests
+
+    A request is profiled when it carries the admin header (X-Profile set to
+    PROFILE_TOKEN) or is picked by PROFILE_SAMPLE_RATE. pyinstrument samples
+    the call stack every PROFILE_INTERVAL_MS; the profile is written as a
+    speedscope file next to a metadata file with the stage timings of the
+    request. Only the newest PROFILE_MAX_FILES profiles are kept.
+    """
+
+    def __init__(self):
+        self.token = os.getenv("PROFILE_TOKEN")
+        self.sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+        self.interval = float(os.getenv("PROFILE_INTERVAL_MS", "1")) / 1000
+        self.max_files = int(os.getenv("PROFILE_MAX_FILES", "100"))
+        self.directory = os.getenv("PROFILE_DIR", "/app/data/profiles")
+        self.endpoints = set(os.getenv("PROFILE_ENDPOINTS", "/chat,/generate-report,/upload").split(","))
+        self._lock = threading.Lock()
+
+        self.enabled = bool(self.token) or self.sample_rate > 0
+        if self.enabled:
+            try:
+                import pyinstrument  # noqa: F401
+                os.makedirs(self.directory, exist_ok=True)
+                logger.info(f"Request profiling enabled (sample rate {self.sample_rate}), writing to {self.directory}")
+            except Exception as e:
+                logger.error(f"Request profiling disabled: {str(e)}")
+                self.enabled = False
+
+    def authorized(self, header: Optional[str]) -> bool:
+        return bool(self.token) and header == self.token
+
+    def wants_profile(self, endpoint: str, header: Optional[str]) -> bool:
+        if not self.enabled or endpoint not in self.endpoints:
+            return False
+        return self.authorized(header) or random.random() < self.sample_rate
+
+    def start(self):
+        from pyinstrument import Profiler
+        profiler = Profiler(interval=self.interval, async_mode="enabled")
+        profiler.start()
+        return profiler
+
+    @contextmanager
+    def collect_threads(self):
+        """Collect the profiles of functions wrapped with profiled() that run in this context"""
+        sessions: list = []
+        token = _thread_sessions.set(sessions)
+        try:
+            yield sessions
+        finally:
+            _thread_sessions.reset(token)
+
+    def profiled(self, func: Callable[..., Any]) -> Callable[..., Any]:
+        """Wrap a function handed to a worker thread, which the request profiler does not sample"""
+        def wrapper(*args, **kwargs):
+            sessions = _thread_sessions.get()
+            if sessions is None:
+                return func(*args, **kwargs)
+            from pyinstrument import Profiler
+            profiler = Profiler(interval=self.interval, async_mode="disabled")
+            profiler.start()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                sessions.append(profiler.stop())
+        return wrapper
+
+    def finish(
+        self,
+        profiler,
+        endpoint: str,
+        method: str,
+        status: int,
+        duration: float,
+        stages: List[Dict[str, Any]],
+        thread_sessions: Optional[list] = None
+    ) -> Optional[str]:
+        """Stop the profiler and store its output, returns the profile id"""
+        from pyinstrument.session import Session
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        profile_id = uuid.uuid4().hex
+        try:
+            session = profiler.stop()
+            for thread_session in thread_sessions or []:
+                session = Session.combine(session, thread_session)
+            with open(self._path(profile_id, "speedscope.json"), "w", encoding="utf-8") as f:
+                f.write(SpeedscopeRenderer().render(session))
+
+            metadata = {
+                'profile_id': profile_id,
+                'endpoint': endpoint,
+                'method': method,
+                'status': status,
+                'duration_seconds': round(duration, 6),
+                'created_at': time.time(),
+                'samples': session.sample_count,
+                'stages': stages
+            }
+            with open(self._path(profile_id, "json"), "w", encoding="utf-8") as f:
+                json.dump(metadata, f)
+        except Exception as e:
+            logger.error(f"Error storing profile for {endpoint}: {str(e)}")
+            return None
+
+        self._prune()
+        return profile_id
+
+    def list_profiles(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Metadata of the most recent profiles, newest first"""
+        profiles = []
+        for path in self._metadata_files()[:limit]:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    profiles.append(json.load(f))
+            except Exception as e:
+                logger.error(f"Error reading profile {path}: {str(e)}")
+        return profiles
+
+    def profile_path(self, profile_id: str) -> Optional[str]:
+        """Path of a stored speedscope profile"""
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        path = self._path(profile_id, "speedscope.json")
+        return path if os.path.exists(path) else None
+
+    def _metadata_files(self) -> List[str]:
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(".json") and not name.endswith(".speedscope.json")]
+        except FileNotFoundError:
+            return []
+        paths = [os.path.join(self.directory, name) for name in names]
+        return sorted(paths, key=_mtime, reverse=True)
+
+    def _prune(self):
+        with self._lock:
+            for path in self._metadata_files()[self.max_files:]:
+                for stale in (path, path[:-len(".json")] + ".speedscope.json"):
+                    try:
+                        os.remove(stale)
+                    except FileNotFoundError:
+                        pass
+
+    def _path(self, profile_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}.{suffix}")
+
+
+def _mtime(path: str) -> float:
+    # Files may be pruned by another request while listing
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return 0.0
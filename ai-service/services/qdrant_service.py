@@ -1,95 +1,311 @@
 import os
+import re
+import time
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue, MatchAny, MatchExcept,
+    DatetimeRange, IsEmptyCondition, PayloadField, PayloadSchemaType, KeywordIndexParams, Prefetch, PointVectors,
+    CreateAlias, CreateAliasOperation
+)
 import uuid
+from datetime import datetime
+
+from services.metrics import observe_stage
+from services.vector_reduction import VectorReducer
+from services.chunk_store import ChunkStore
+from services.hot_cache import PatientHotCache
 
 logger = logging.getLogger(__name__)
 
+# Embedded (local mode) clients are shared so all services see the same data
+_local_clients: Dict[str, QdrantClient] = {}
+
+# Per-patient payload fields copied onto every chunk for cohort filters
+PATIENT_METADATA_KEYS = ("department", "admission_date")
+
+# Payload fields returned with hits; "text" only exists on points stored before the chunk store
+RESULT_PAYLOAD_KEYS = ["patient_id", "source", "sources", "section", "chars", "text", *PATIENT_METADATA_KEYS]
+
+
+def versioned_collection_name(alias: str, embedding_model: Optional[str], dimension: int) -> str:
+    """Name of the collection holding the vectors of one embedding model"""
+    slug = re.sub(r"[^a-z0-9]+", "-", (embedding_model or "unknown").lower()).strip("-")
+    return f"{alias}__{slug}_{dimension}"
+
 
 class QdrantService:
     """Service for interacting with Qdrant vector database"""
 
-    def __init__(self, embedding_dimension: int = 1536):
+    def __init__(
+        self,
+        embedding_dimension: int = 1536,
+        embedding_model: Optional[str] = None,
+        allow_unmigrated: bool = False
+    ):
         self.host = os.getenv("QDRANT_HOST", "qdrant")
         self.port = int(os.getenv("QDRANT_PORT", "6333"))
-        self.collection_name = "patient_documents"
+        # Every embedding model gets its own collection, which is read and written
+        # directly. The alias names the collection of the current model; the
+        # service only starts once the alias points at it (manage.py migrate-embeddings
+        # moves it), unless allow_unmigrated is set for the migration itself.
+        self.alias = os.getenv("QDRANT_COLLECTION", "patient_documents")
+        self.allow_unmigrated = allow_unmigrated
+        self.collection_name = versioned_collection_name(self.alias, embedding_model, embedding_dimension)
         self.embedding_dimension = embedding_dimension
 
-        # Initialize client
-        self.client = QdrantClient(host=self.host, port=self.port)
-        logger.info(f"Connected to Qdrant at {self.host}:{self.port}")
+        # Optional small first-stage vector, candidates are rescored with the full one
+        self.reducer = VectorReducer(embedding_model, embedding_dimension)
+        self.rescore_factor = int(os.getenv("RESCORE_CANDIDATES_FACTOR", "4"))
+        self.full_vectors_on_disk = os.getenv("FULL_VECTORS_ON_DISK", "true").lower() == "true"
+        self.named_vectors = False
+
+        # Chunk texts live in a local compressed store, payloads keep the filter fields
+        self.chunk_store: Optional[ChunkStore] = None
+        chunk_store_dir = os.getenv("CHUNK_STORE_DIR", "/app/data/chunks")
+        if chunk_store_dir:
+            try:
+                self.chunk_store = ChunkStore.shared(chunk_store_dir)
+            except Exception as e:
+                logger.error(f"Error opening chunk store at {chunk_store_dir}, keeping texts in payloads: {str(e)}")
+
+        # Chunks and vectors of recently opened patients, searched in-process
+        self.hot_cache = PatientHotCache.shared()
+
+        # Initialize client (QDRANT_LOCATION=":memory:" or a path selects embedded local mode)
+        self.location = os.getenv("QDRANT_LOCATION")
+        if self.location:
+            if self.location not in _local_clients:
+                if self.location == ":memory:":
+                    _local_clients[self.location] = QdrantClient(location=self.location)
+                else:
+                    _local_clients[self.location] = QdrantClient(path=self.location)
+            self.client = _local_clients[self.location]
+            logger.info(f"Using local Qdrant at {self.location}")
+        else:
+            self.client = QdrantClient(host=self.host, port=self.port)
+            logger.info(f"Connected to Qdrant at {self.host}:{self.port}")
 
         # Create collection if it doesn't exist
         self._ensure_collection()
 
     def _ensure_collection(self):
-        """Ensure the collection exists"""
+        """Resolve the collection of the embedding model, creating it on a fresh install
+
+        Raises RuntimeError if the alias still serves the vectors of another
+        embedding model, so the service never answers from an empty collection.
+        """
         try:
-            collections = self.client.get_collections().collections
-            collection_names = [col.name for col in collections]
+            collection_names = [col.name for col in self.client.get_collections().collections]
+            aliases = self.get_aliases()
+            current = aliases.get(self.alias)
+            legacy = self.alias in collection_names
 
-            if self.collection_name not in collection_names:
-                logger.info(f"Creating collection: {self.collection_name}")
-                self.client.create_collection(
-                    collection_name=self.collection_name,
-                    vectors_config=VectorParams(
-                        size=self.embedding_dimension,
-                        distance=Distance.COSINE
-                    )
-                )
-                logger.info("Collection created successfully")
-            else:
+            if current == self.collection_name:
                 logger.info(f"Collection {self.collection_name} already exists")
+            elif current is None and legacy and self._vector_size(self.alias) == self.embedding_dimension:
+                # Unversioned collection from before aliases were introduced
+                logger.info(f"Using legacy collection {self.alias}")
+                self.collection_name = self.alias
+            elif current is None and not legacy:
+                if self.collection_name not in collection_names:
+                    self.create_collection(self.collection_name)
+                self.client.update_collection_aliases(change_aliases_operations=[
+                    CreateAliasOperation(create_alias=CreateAlias(
+                        collection_name=self.collection_name,
+                        alias_name=self.alias
+                    ))
+                ])
+                logger.info(f"Alias {self.alias} -> {self.collection_name}")
+            elif self.allow_unmigrated:
+                if self.collection_name not in collection_names:
+                    self.create_collection(self.collection_name)
+                logger.info(f"{self.alias} still serves {current or self.alias}, preparing {self.collection_name}")
+            else:
+                raise RuntimeError(
+                    f"{self.alias} serves {current or self.alias}, which holds vectors of another embedding model "
+                    f"than the configured one ({self.collection_name}); run `manage.py migrate-embeddings` "
+                    "before starting the service with this model"
+                )
+
+            self.use_collection(self.collection_name)
 
         except Exception as e:
             logger.error(f"Error ensuring collection: {str(e)}")
             raise
 
+    def use_collection(self, collection_name: str):
+        """Read and write an existing collection from now on"""
+        self.collection_name = collection_name
+        vectors = self.client.get_collection(collection_name).config.params.vectors
+        self.named_vectors = isinstance(vectors, dict) and "small" in vectors
+        if self.reducer.dimension and not self.named_vectors:
+            logger.warning(
+                f"Collection {collection_name} has no small vector, "
+                "searching full vectors only (recreate or migrate the collection)"
+            )
+
+        self._ensure_payload_indexes()
+
+    def create_collection(self, collection_name: str):
+        """Create a collection for vectors of the configured embedding model"""
+        logger.info(f"Creating collection: {collection_name}")
+        if self.reducer.dimension:
+            # Full vectors are only read for rescoring and can live on disk
+            vectors_config = {
+                "full": VectorParams(
+                    size=self.embedding_dimension,
+                    distance=Distance.COSINE,
+                    on_disk=self.full_vectors_on_disk
+                ),
+                "small": VectorParams(size=self.reducer.dimension, distance=Distance.COSINE)
+            }
+        else:
+            vectors_config = VectorParams(
+                size=self.embedding_dimension,
+                distance=Distance.COSINE
+            )
+        self.client.create_collection(
+            collection_name=collection_name,
+            vectors_config=vectors_config
+        )
+        logger.info("Collection created successfully")
+
+    def get_aliases(self) -> Dict[str, str]:
+        """Map of alias name to collection name"""
+        return {a.alias_name: a.collection_name for a in self.client.get_aliases().aliases}
+
+    def _vector_size(self, collection_name: str) -> int:
+        vectors = self.client.get_collection(collection_name).config.params.vectors
+        if isinstance(vectors, dict):
+            vectors = vectors["full"]
+        return vectors.size
+
+    def _ensure_payload_indexes(self):
+        """Index the payload fields used in filters (no-op if they already exist)"""
+        if self.location:
+            # Embedded mode has no payload indexes
+            return
+
+        indexes = {
+            # Tenant index: points of one patient are stored together
+            "patient_id": KeywordIndexParams(type="keyword", is_tenant=True),
+            "section": PayloadSchemaType.KEYWORD,
+            "department": PayloadSchemaType.KEYWORD,
+            "admission_date": PayloadSchemaType.DATETIME,
+            # Lets migrations find points written after they started
+            "ingested_at": PayloadSchemaType.FLOAT
+        }
+        existing = self.client.get_collection(self.collection_name).payload_schema
+        for field, schema in indexes.items():
+            if field not in existing:
+                self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field,
+                    field_schema=schema
+                )
+                logger.info(f"Created payload index on {field}")
+
     def store_vectors(
         self,
         vectors: List[List[float]],
-        payloads: List[Dict[str, Any]]
+        payloads: List[Dict[str, Any]],
+        ids: Optional[List[str]] = None
     ) -> List[str]:
-        """Store vectors with metadata in Qdrant"""
+        """Store vectors with metadata in Qdrant (upserting over existing ids)"""
         try:
             points = []
-            ids = []
+            point_ids = ids or [str(uuid.uuid4()) for _ in vectors]
+            ingested_at = time.time()
+            payloads = self.split_texts(point_ids, payloads)
 
-            for vector, payload in zip(vectors, payloads):
-                point_id = str(uuid.uuid4())
-                ids.append(point_id)
+            small_vectors = self.reducer.reduce(vectors) if self.named_vectors else None
+
+            for i, (point_id, vector, payload) in enumerate(zip(point_ids, vectors, payloads)):
+                if self.named_vectors:
+                    vector = {"full": vector}
+                    if small_vectors:
+                        vector["small"] = small_vectors[i]
 
                 points.append(
                     PointStruct(
                         id=point_id,
                         vector=vector,
-                        payload=payload
+                        # Copies made by a migration keep their original timestamp
+                        payload={'ingested_at': ingested_at, **payload}
                     )
                 )
 
-            self.client.upsert(
-                collection_name=self.collection_name,
-                points=points
-            )
+            with observe_stage("qdrant", "upsert", "qdrant"):
+                self.client.upsert(
+                    collection_name=self.collection_name,
+                    points=points
+                )
+            for patient_id in {payload.get('patient_id') for payload in payloads}:
+                self.hot_cache.invalidate(patient_id)
 
             logger.info(f"Stored {len(points)} vectors in Qdrant")
-            return ids
+            return point_ids
 
         except Exception as e:
             logger.error(f"Error storing vectors: {str(e)}")
             raise
 
+    def split_texts(self, ids: List[Any], payloads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Move chunk texts from the payloads to the chunk store"""
+        if self.chunk_store is None:
+            return payloads
+
+        stored_ids, texts, slim = [], [], []
+        for point_id, payload in zip(ids, payloads):
+            if 'text' in payload:
+                stored_ids.append(point_id)
+                texts.append(payload['text'])
+                payload = {k: v for k, v in payload.items() if k != 'text'}
+                payload['chars'] = len(texts[-1])
+            slim.append(payload)
+
+        if texts:
+            with observe_stage("chunk_store", "put", "local"):
+                self.chunk_store.put_many(stored_ids, texts)
+        return slim
+
+    def attach_texts(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fill in the chunk texts of results in one bulk read, in place"""
+        missing = [r for r in results if 'text' not in r['payload']]
+        if not missing:
+            return results
+
+        texts = {}
+        if self.chunk_store is not None:
+            with observe_stage("chunk_store", "get", "local"):
+                texts = self.chunk_store.get_many([r['id'] for r in missing])
+        for result in missing:
+            result['payload']['text'] = texts.get(result['id'], "")
+        return results
+
     def search(
         self,
         query_vector: List[float],
         patient_id: str,
         limit: int = 5,
-        score_threshold: float = 0.5
+        score_threshold: float = 0.5,
+        with_vectors: bool = False,
+        with_text: bool = True
     ) -> List[Dict[str, Any]]:
-        """Search for similar vectors"""
+        """Search for similar vectors
+
+        With with_text=False hits carry no chunk text; callers that only use
+        some of them fetch the texts afterwards with attach_texts.
+        """
         try:
+            cached = self.hot_cache.search(
+                self.collection_name, patient_id, query_vector, limit, score_threshold, with_vectors
+            )
+            if cached is not None:
+                return cached
+
             # Create filter for patient_id
             query_filter = Filter(
                 must=[
@@ -101,45 +317,309 @@ class QdrantService:
             )
 
             # Search
-            results = self.client.search(
-                collection_name=self.collection_name,
-                query_vector=query_vector,
-                query_filter=query_filter,
-                limit=limit,
-                score_threshold=score_threshold
-            )
+            with observe_stage("qdrant", "search", "qdrant"):
+                results = self.client.query_points(
+                    collection_name=self.collection_name,
+                    query=query_vector,
+                    using=self._full_vector_name,
+                    prefetch=self._prefetch(query_vector, query_filter, limit),
+                    query_filter=query_filter,
+                    limit=limit,
+                    score_threshold=score_threshold,
+                    with_payload=RESULT_PAYLOAD_KEYS,
+                    with_vectors=self._with_vectors(with_vectors)
+                ).points
 
             # Format results
             formatted_results = []
             for result in results:
-                formatted_results.append({
+                formatted_result = {
                     'id': result.id,
                     'score': result.score,
                     'payload': result.payload
-                })
+                }
+                if with_vectors:
+                    formatted_result['vector'] = self._full_vector(result.vector)
+                formatted_results.append(formatted_result)
 
             logger.info(f"Found {len(formatted_results)} results for patient {patient_id}")
+            if with_text:
+                self.attach_texts(formatted_results)
             return formatted_results
 
         except Exception as e:
             logger.error(f"Error searching vectors: {str(e)}")
             return []
 
-    def delete_by_patient(self, patient_id: str):
-        """Delete all documents for a patient"""
-        try:
-            self.client.delete(
+    def search_groups(
+        self,
+        query_vector: List[float],
+        limit: int = 20,
+        group_size: int = 3,
+        score_threshold: float = 0.3,
+        department: Optional[str] = None,
+        sections: Optional[List[str]] = None,
+        admitted_from: Optional[datetime] = None,
+        admitted_to: Optional[datetime] = None,
+        exclude_patient_ids: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Search across all patients, grouping the best hits by patient"""
+        conditions = []
+        if department:
+            conditions.append(FieldCondition(key="department", match=MatchValue(value=department)))
+        if sections:
+            conditions.append(FieldCondition(key="section", match=MatchAny(any=sections)))
+        if admitted_from or admitted_to:
+            conditions.append(FieldCondition(
+                key="admission_date",
+                range=DatetimeRange(gte=admitted_from, lte=admitted_to)
+            ))
+        if exclude_patient_ids:
+            conditions.append(FieldCondition(key="patient_id", match=MatchExcept(**{"except": exclude_patient_ids})))
+
+        query_filter = Filter(must=conditions) if conditions else None
+        with observe_stage("qdrant", "search_groups", "qdrant"):
+            result = self.client.query_points_groups(
                 collection_name=self.collection_name,
-                points_selector=Filter(
-                    must=[
-                        FieldCondition(
-                            key="patient_id",
-                            match=MatchValue(value=patient_id)
-                        )
-                    ]
+                query=query_vector,
+                using=self._full_vector_name,
+                # Groups need more candidates than a plain search
+                prefetch=self._prefetch(query_vector, query_filter, limit * group_size),
+                group_by="patient_id",
+                query_filter=query_filter,
+                limit=limit,
+                group_size=group_size,
+                score_threshold=score_threshold,
+                with_payload=RESULT_PAYLOAD_KEYS,
+                with_vectors=False
+            )
+
+        groups = [
+            {
+                'patient_id': group.id,
+                'hits': [{'id': p.id, 'score': p.score, 'payload': p.payload} for p in group.hits]
+            }
+            for group in result.groups
+        ]
+        self.attach_texts([hit for group in groups for hit in group['hits']])
+        return groups
+
+    def set_patient_metadata(self, patient_id: str, metadata: Dict[str, Any]):
+        """Set per-patient payload fields on all points of a patient"""
+        try:
+            with observe_stage("qdrant", "set_payload", "qdrant"):
+                self.client.set_payload(
+                    collection_name=self.collection_name,
+                    payload=metadata,
+                    points=Filter(must=[FieldCondition(key="patient_id", match=MatchValue(value=patient_id))])
+                )
+            self.hot_cache.invalidate(patient_id)
+        except Exception as e:
+            logger.error(f"Error setting metadata for patient {patient_id}: {str(e)}")
+
+    def set_points_payload(self, patient_id: str, point_ids: List[Any], payload: Dict[str, Any]):
+        """Set payload fields on the given points of a patient"""
+        try:
+            with observe_stage("qdrant", "set_payload", "qdrant"):
+                self.client.set_payload(
+                    collection_name=self.collection_name,
+                    payload=payload,
+                    points=point_ids
                 )
+            self.hot_cache.invalidate(patient_id)
+        except Exception as e:
+            logger.error(f"Error setting payload on {len(point_ids)} points: {str(e)}")
+
+    def get_patient_metadata(self, patient_id: str) -> Dict[str, Any]:
+        """Per-patient payload fields of a patient, empty if none are stored yet"""
+        try:
+            with observe_stage("qdrant", "scroll", "qdrant"):
+                results, _ = self.client.scroll(
+                    collection_name=self.collection_name,
+                    scroll_filter=Filter(
+                        must=[FieldCondition(key="patient_id", match=MatchValue(value=patient_id))],
+                        must_not=[IsEmptyCondition(is_empty=PayloadField(key="department"))]
+                    ),
+                    limit=1,
+                    with_payload=list(PATIENT_METADATA_KEYS),
+                    with_vectors=False
+                )
+            if not results:
+                return {}
+            return {k: v for k, v in results[0].payload.items() if k in PATIENT_METADATA_KEYS}
+
+        except Exception as e:
+            logger.error(f"Error getting metadata for patient {patient_id}: {str(e)}")
+            return {}
+
+    def scroll_patient(
+        self,
+        patient_id: str,
+        sections: Optional[List[str]] = None,
+        with_vectors: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Get all points of a patient, optionally restricted to some sections"""
+        try:
+            conditions = [FieldCondition(key="patient_id", match=MatchValue(value=patient_id))]
+            if sections:
+                conditions.append(FieldCondition(key="section", match=MatchAny(any=sections)))
+
+            points = []
+            offset = None
+            while True:
+                with observe_stage("qdrant", "scroll", "qdrant"):
+                    results, offset = self.client.scroll(
+                        collection_name=self.collection_name,
+                        scroll_filter=Filter(must=conditions),
+                        limit=256,
+                        offset=offset,
+                        with_payload=RESULT_PAYLOAD_KEYS,
+                        with_vectors=self._with_vectors(with_vectors)
+                    )
+
+                for point in results:
+                    points.append({
+                        'id': point.id,
+                        'payload': point.payload,
+                        'vector': self._full_vector(point.vector)
+                    })
+
+                if offset is None:
+                    break
+
+            return self.attach_texts(points)
+
+        except Exception as e:
+            logger.error(f"Error scrolling points for patient {patient_id}: {str(e)}")
+            return []
+
+    def load_patient(self, patient_id: str) -> int:
+        """Load the chunks and vectors of a patient into the hot cache, returns the chunk count"""
+        resident = self.hot_cache.chunk_count(self.collection_name, patient_id)
+        if resident is not None:
+            return resident
+        version = self.hot_cache.version(patient_id)
+        with observe_stage("hot_cache", "load", "qdrant"):
+            points = self.scroll_patient(patient_id, with_vectors=True)
+            loaded = self.hot_cache.put(self.collection_name, patient_id, points, version)
+        if loaded:
+            logger.info(f"Loaded {len(points)} chunks of patient {patient_id} into the hot cache")
+        return len(points)
+
+    def iter_full_vectors(self, batch_size: int = 256):
+        """Yield (ids, full vectors) batches over the whole collection"""
+        offset = None
+        while True:
+            with observe_stage("qdrant", "scroll", "qdrant"):
+                results, offset = self.client.scroll(
+                    collection_name=self.collection_name,
+                    limit=batch_size,
+                    offset=offset,
+                    with_payload=False,
+                    with_vectors=self._with_vectors(True)
+                )
+            if results:
+                yield [p.id for p in results], [self._full_vector(p.vector) for p in results]
+            if offset is None:
+                break
+
+    def update_small_vectors(self, ids: List[Any], full_vectors: List[List[float]]):
+        """Recompute and store the small vectors of existing points"""
+        small_vectors = self.reducer.reduce(full_vectors)
+        with observe_stage("qdrant", "update_vectors", "qdrant"):
+            self.client.update_vectors(
+                collection_name=self.collection_name,
+                points=[PointVectors(id=i, vector={"small": v}) for i, v in zip(ids, small_vectors)]
             )
-            logger.info(f"Deleted documents for patient {patient_id}")
+
+    @property
+    def use_small_vectors(self) -> bool:
+        return self.named_vectors and self.reducer.ready
+
+    @property
+    def _full_vector_name(self) -> Optional[str]:
+        return "full" if self.named_vectors else None
+
+    def _prefetch(self, query_vector: List[float], query_filter: Optional[Filter], limit: int) -> Optional[Prefetch]:
+        """First-stage search on the small vector, rescored by the main query"""
+        if not self.use_small_vectors:
+            return None
+        return Prefetch(
+            query=self.reducer.reduce([query_vector])[0],
+            using="small",
+            filter=query_filter,
+            limit=limit * self.rescore_factor
+        )
+
+    def _with_vectors(self, with_vectors: bool):
+        if with_vectors and self.named_vectors:
+            return ["full"]
+        return with_vectors
+
+    def _full_vector(self, vector):
+        if isinstance(vector, dict):
+            return vector.get("full")
+        return vector
+
+    def retrieve_points(self, ids: List[str]) -> List[Dict[str, Any]]:
+        """Get points by id"""
+        try:
+            with observe_stage("qdrant", "retrieve", "qdrant"):
+                results = self.client.retrieve(
+                    collection_name=self.collection_name,
+                    ids=ids,
+                    with_payload=RESULT_PAYLOAD_KEYS,
+                    with_vectors=False
+                )
+            return self.attach_texts([{'id': point.id, 'payload': point.payload} for point in results])
+
+        except Exception as e:
+            logger.error(f"Error retrieving points: {str(e)}")
+            return []
+
+    def iter_point_ids(self, patient_id: Optional[str] = None, batch_size: int = 1000):
+        """Yield batches of point ids, of one patient or the whole collection"""
+        scroll_filter = None
+        if patient_id is not None:
+            scroll_filter = Filter(must=[FieldCondition(key="patient_id", match=MatchValue(value=patient_id))])
+        offset = None
+        while True:
+            with observe_stage("qdrant", "scroll", "qdrant"):
+                results, offset = self.client.scroll(
+                    collection_name=self.collection_name,
+                    scroll_filter=scroll_filter,
+                    limit=batch_size,
+                    offset=offset,
+                    with_payload=False,
+                    with_vectors=False
+                )
+            if results:
+                yield [p.id for p in results]
+            if offset is None:
+                break
+
+    def delete_by_patient(self, patient_id: str):
+        """Delete all documents for a patient, including their texts in the chunk store"""
+        try:
+            point_ids = [point_id for batch in self.iter_point_ids(patient_id) for point_id in batch]
+            with observe_stage("qdrant", "delete", "qdrant"):
+                self.client.delete(
+                    collection_name=self.collection_name,
+                    points_selector=Filter(
+                        must=[
+                            FieldCondition(
+                                key="patient_id",
+                                match=MatchValue(value=patient_id)
+                            )
+                        ]
+                    )
+                )
+            self.hot_cache.invalidate(patient_id)
+            if self.chunk_store is not None:
+                # Patient texts must not outlive their points; compaction reclaims the space
+                with observe_stage("chunk_store", "delete", "local"):
+                    self.chunk_store.delete_many(point_ids)
+            logger.info(f"Deleted {len(point_ids)} documents for patient {patient_id}")
 
         except Exception as e:
             logger.error(f"Error deleting documents: {str(e)}")
@@ -153,13 +633,14 @@ class QdrantService:
             offset = None
 
             while True:
-                results, offset = self.client.scroll(
-                    collection_name=self.collection_name,
-                    limit=100,
-                    offset=offset,
-                    with_payload=True,
-                    with_vectors=False
-                )
+                with observe_stage("qdrant", "scroll", "qdrant"):
+                    results, offset = self.client.scroll(
+                        collection_name=self.collection_name,
+                        limit=100,
+                        offset=offset,
+                        with_payload=["patient_id"],
+                        with_vectors=False
+                    )
 
                 if not results:
                     break
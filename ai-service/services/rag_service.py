@@ -1,14 +1,29 @@
 import logging
-from typing import List, Dict, Any
+import time
+import uuid
+import threading
+from collections import Counter
+from typing import List, Dict, Any, Optional
 import os
 from openai import OpenAI
 import requests
 
 from services.embedding_service import EmbeddingService
-from services.qdrant_service import QdrantService
+from services.qdrant_service import QdrantService, PATIENT_METADATA_KEYS
+from services.mmr import mmr_select
+from services.dedup import ChunkDeduplicator
+from services.llm_scheduler import LLMScheduler, LLMOverloadedError
+from services.metrics import observe_stage, record_llm_usage, record_prompt_cache, PROMPT_CONTEXT_CHARS
+from services.tracing import set_attributes
 
 logger = logging.getLogger(__name__)
 
+# Sections that make up the pinned structured patient summary, in prompt order
+SUMMARY_SECTIONS = ["demographics", "admission", "diagnoses", "medications", "allergies", "procedures"]
+
+# Earlier chat messages sent with a question (3 exchanges)
+HISTORY_WINDOW = 6
+
 
 class RAGService:
     """Service for Retrieval-Augmented Generation"""
@@ -16,7 +31,8 @@ class RAGService:
     def __init__(self, embedding_service: EmbeddingService):
         self.embedding_service = embedding_service
         self.qdrant_service = QdrantService(
-            embedding_dimension=embedding_service.get_embedding_dimension()
+            embedding_dimension=embedding_service.get_embedding_dimension(),
+            embedding_model=embedding_service.embedding_model
         )
 
         # Initialize LLM
@@ -44,15 +60,62 @@ class RAGService:
             self.llm_client = None
             logger.warning(f"Unsupported model type: {self.model_type}, using local responses")
 
-    def store_documents(self, patient_id: str, chunks: List[Dict[str, Any]]):
-        """Store document chunks in vector database"""
+        # Prompt layout: "classic" rebuilds the prompt each turn, "stable" pins a
+        # per-patient context block at the start so LLM prompt caches can reuse it
+        self.prompt_mode = os.getenv("CHAT_PROMPT_MODE", "classic")
+        self.pinned_chunk_count = int(os.getenv("PINNED_CHUNKS", "4"))
+        self.pinned_context_ttl = float(os.getenv("PINNED_CONTEXT_TTL", "1800"))
+        self.ollama_keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+        self._pinned_contexts: Dict[str, Dict[str, Any]] = {}
+        self._chunk_hits: Dict[str, Counter] = {}
+        self._pin_lock = threading.Lock()
+
+        # Department/admission date per patient, copied onto every stored chunk
+        self._metadata_cache: Dict[str, Dict[str, Any]] = {}
+
+        # Maximal marginal relevance: fetch candidates, keep a smaller diverse set
+        self.mmr_enabled = os.getenv("MMR_ENABLED", "true").lower() == "true"
+        self.mmr_lambda = float(os.getenv("MMR_LAMBDA", "0.7"))
+        self.mmr_fetch_k = int(os.getenv("MMR_FETCH_K", "20"))
+        self.mmr_top_k = int(os.getenv("MMR_TOP_K", "5"))
+
+        # Concurrency limits and priority queuing shared with report generation
+        self.scheduler = LLMScheduler.shared()
+
+        # Near-duplicate chunks are skipped before embedding, their sources merged
+        self.dedup = ChunkDeduplicator(self.qdrant_service) if os.getenv("DEDUP_ENABLED", "false").lower() == "true" else None
+
+    def store_documents(
+        self,
+        patient_id: str,
+        chunks: List[Dict[str, Any]],
+        ids: Optional[List[str]] = None
+    ) -> Dict[str, int]:
+        """Store document chunks in vector database
+
+        Passing stable ids makes re-ingesting the same chunks idempotent.
+        Returns how many chunks were stored and how many were dropped as
+        near-duplicates.
+        """
         try:
+            duplicates = 0
+            batch = None
+            if self.dedup:
+                ids = ids or [str(uuid.uuid4()) for _ in chunks]
+                with observe_stage("ingest", "dedup", "local"):
+                    chunks, ids, duplicates, batch = self.dedup.filter(patient_id, chunks, ids)
+                    set_attributes({'ingest.chunks': len(chunks) + duplicates, 'ingest.duplicates': duplicates})
+                if not chunks:
+                    return {'stored': 0, 'duplicates': duplicates}
+
             # Extract texts
             texts = [chunk['text'] for chunk in chunks]
 
             # Create embeddings
             embeddings = self.embedding_service.create_embeddings(texts)
 
+            metadata = self._patient_metadata(patient_id, chunks)
+
             # Prepare payloads
             payloads = []
             for chunk, embedding in zip(chunks, embeddings):
@@ -60,38 +123,89 @@ class RAGService:
                     'patient_id': patient_id,
                     'text': chunk['text'],
                     'source': chunk.get('source', 'unknown'),
-                    'section': chunk.get('section', 'unknown')
+                    'section': chunk.get('section', 'unknown'),
+                    **metadata
                 }
+                # Every document a deduplicated chunk was also found in
+                if chunk.get('sources'):
+                    payload['sources'] = chunk['sources']
                 payloads.append(payload)
 
             # Store in Qdrant
-            self.qdrant_service.store_vectors(embeddings, payloads)
+            self.qdrant_service.store_vectors(embeddings, payloads, ids=ids)
+            if batch is not None:
+                self.dedup.commit(patient_id, batch)
+
+            # New documents invalidate the pinned context of this patient
+            with self._pin_lock:
+                self._pinned_contexts.pop(patient_id, None)
 
             logger.info(f"Stored {len(chunks)} chunks for patient {patient_id}")
+            return {'stored': len(chunks), 'duplicates': duplicates}
 
         except Exception as e:
             logger.error(f"Error storing documents: {str(e)}")
             raise
 
+    def _patient_metadata(self, patient_id: str, chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Department and admission date of a patient for cohort search filters"""
+        for chunk in chunks:
+            metadata = {k: chunk[k] for k in PATIENT_METADATA_KEYS if chunk.get(k)}
+            if metadata:
+                # Backfill documents stored before the structured data arrived; unchanged
+                # metadata is already on every stored point, and the rewrite touches all of them
+                if self._metadata_cache.get(patient_id) != metadata:
+                    self.qdrant_service.set_patient_metadata(patient_id, metadata)
+                    self._metadata_cache[patient_id] = metadata
+                return metadata
+
+        if patient_id not in self._metadata_cache:
+            metadata = self.qdrant_service.get_patient_metadata(patient_id)
+            if not metadata:
+                return {}
+            self._metadata_cache[patient_id] = metadata
+        return self._metadata_cache[patient_id]
+
     def query(
         self,
         patient_id: str,
         question: str,
         conversation_history: List[Dict[str, str]] = None,
-        top_k: int = 5
+        top_k: int = 5,
+        conversation_summary: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Query patient documents using RAG"""
+        """Query patient documents using RAG
+
+        Server-side chat sessions pass the summary of earlier turns alongside
+        their recent messages.
+        """
         try:
+            backend = self.model_type if self.llm_client else "template"
+
             # Create embedding for question
-            question_embedding = self.embedding_service.create_embedding(question)
+            with observe_stage("rag", "embed_question", backend):
+                question_embedding = self.embedding_service.create_embedding(question)
 
             # Search for relevant context
-            search_results = self.qdrant_service.search(
-                query_vector=question_embedding,
-                patient_id=patient_id,
-                limit=top_k + 5,  # Get more results for better coverage
-                score_threshold=0.1  # Lower threshold to include more relevant docs
-            )
+            with observe_stage("rag", "search", backend):
+                search_results = self.qdrant_service.search(
+                    query_vector=question_embedding,
+                    patient_id=patient_id,
+                    limit=max(self.mmr_fetch_k, top_k + 5) if self.mmr_enabled else top_k + 5,
+                    score_threshold=0.1,  # Lower threshold to include more relevant docs
+                    with_vectors=self.mmr_enabled,
+                    with_text=False
+                )
+                set_attributes({'rag.candidates': len(search_results)})
+
+            # Drop near-duplicate hits (overlapping chunks, repeated notes)
+            if self.mmr_enabled and search_results:
+                with observe_stage("rag", "mmr", backend):
+                    search_results = self._select_diverse(question_embedding, search_results)
+
+            # Texts are only read for the chunks that go into the prompt
+            with observe_stage("rag", "fetch_texts", backend):
+                self.qdrant_service.attach_texts(search_results)
 
             if not search_results:
                 return {
@@ -99,31 +213,49 @@ class RAGService:
                     'sources': []
                 }
 
-            # Build context from search results
-            context_parts = []
-            sources = []
-
-            for i, result in enumerate(search_results):
-                payload = result['payload']
-                context_parts.append(
-                    f"[Quelle {i+1} - {payload['source']} / {payload['section']}]:\n{payload['text']}"
-                )
-
-                sources.append({
-                    'source': payload['source'],
-                    'section': payload['section'],
-                    'score': result['score'],
-                    'text': payload['text'][:200] + "..." if len(payload['text']) > 200 else payload['text']
-                })
-
-            context = "\n\n".join(context_parts)
+            with observe_stage("rag", "build_prompt", backend):
+                pinned = None
+                context_results = search_results
+                if self.llm_client and self.prompt_mode == "stable":
+                    self._record_chunk_hits(patient_id, search_results)
+                    pinned = self._get_pinned_context(patient_id)
+                    # Chunks already in the pinned block are not repeated
+                    context_results = [r for r in search_results if str(r['id']) not in pinned['ids']]
+
+                # Build context from search results
+                context_parts = []
+                sources = []
+
+                for i, result in enumerate(context_results):
+                    payload = result['payload']
+                    context_parts.append(
+                        f"[Quelle {i+1} - {payload['source']} / {payload['section']}]:\n{payload['text']}"
+                    )
+
+                for result in search_results:
+                    payload = result['payload']
+                    sources.append({
+                        'source': payload['source'],
+                        'section': payload['section'],
+                        'score': result['score'],
+                        'text': payload['text'][:200] + "..." if len(payload['text']) > 200 else payload['text']
+                    })
+
+                context = "\n\n".join(context_parts)
 
             # Generate answer using LLM or template
-            if self.llm_client:
-                answer = self._generate_answer(question, context, conversation_history)
-            else:
-                # Template-based answer (local mode)
-                answer = self._generate_template_answer(question, search_results)
+            with observe_stage("rag", "generate", backend):
+                if self.llm_client:
+                    answer = self._generate_answer(
+                        question,
+                        context,
+                        conversation_history,
+                        pinned_context=pinned['text'] if pinned else None,
+                        conversation_summary=conversation_summary
+                    )
+                else:
+                    # Template-based answer (local mode)
+                    answer = self._generate_template_answer(question, search_results)
 
             return {
                 'answer': answer,
@@ -134,13 +266,109 @@ class RAGService:
             logger.error(f"Error in RAG query: {str(e)}")
             raise
 
+    def prewarm(self, patient_id: str) -> int:
+        """Load a patient into the hot cache and build its pinned context, returns the chunk count"""
+        chunks = self.qdrant_service.load_patient(patient_id)
+        if chunks and self.llm_client and self.prompt_mode == "stable":
+            self._get_pinned_context(patient_id)
+        return chunks
+
+    def _select_diverse(self, query_vector: List[float], search_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Reduce search results to a diverse subset with MMR"""
+        selected = mmr_select(
+            query_vector,
+            [result['vector'] for result in search_results],
+            k=self.mmr_top_k,
+            lambda_mult=self.mmr_lambda
+        )
+        diverse = [search_results[i] for i in selected]
+
+        candidate_chars = sum(_text_chars(r['payload']) for r in search_results)
+        selected_chars = sum(_text_chars(r['payload']) for r in diverse)
+        PROMPT_CONTEXT_CHARS.labels("rag", "candidates").observe(candidate_chars)
+        PROMPT_CONTEXT_CHARS.labels("rag", "selected").observe(selected_chars)
+        logger.info(
+            f"MMR kept {len(diverse)} of {len(search_results)} chunks "
+            f"({selected_chars} of {candidate_chars} context chars)"
+        )
+        return diverse
+
+    def _record_chunk_hits(self, patient_id: str, search_results: List[Dict[str, Any]]):
+        """Count how often each chunk of a patient is retrieved"""
+        with self._pin_lock:
+            hits = self._chunk_hits.setdefault(patient_id, Counter())
+            hits.update(str(result['id']) for result in search_results)
+
+    def _get_pinned_context(self, patient_id: str) -> Dict[str, Any]:
+        """Get the stable per-patient context block, building it if needed
+
+        The block holds the structured summary sections plus the most
+        frequently retrieved chunks. It is kept unchanged until it expires or
+        new documents are stored for the patient, so consecutive prompts
+        share the same prefix.
+        """
+        with self._pin_lock:
+            pinned = self._pinned_contexts.get(patient_id)
+            if pinned and time.time() - pinned['built_at'] < self.pinned_context_ttl:
+                return pinned
+            frequent_ids = [
+                chunk_id for chunk_id, count in self._chunk_hits.get(patient_id, Counter()).most_common(self.pinned_chunk_count)
+                if count > 1
+            ]
+
+        summary_points = self.qdrant_service.scroll_patient(patient_id, sections=SUMMARY_SECTIONS)
+        summary_points.sort(key=lambda p: (SUMMARY_SECTIONS.index(p['payload']['section']), p['payload']['source']))
+
+        summary_ids = {str(p['id']) for p in summary_points}
+        frequent_ids = [chunk_id for chunk_id in frequent_ids if chunk_id not in summary_ids]
+        frequent_points = self.qdrant_service.retrieve_points(frequent_ids) if frequent_ids else []
+        # Keep a deterministic order so the rebuilt block is byte-identical
+        frequent_points.sort(key=lambda p: str(p['id']))
+
+        parts = [
+            f"[{p['payload']['source']} / {p['payload']['section']}]:\n{p['payload']['text']}"
+            for p in summary_points + frequent_points
+        ]
+        pinned = {
+            'text': "\n\n".join(parts),
+            'ids': summary_ids | {str(p['id']) for p in frequent_points},
+            'built_at': time.time()
+        }
+
+        with self._pin_lock:
+            self._pinned_contexts[patient_id] = pinned
+        logger.info(f"Built pinned context for patient {patient_id}: {len(parts)} chunks")
+        return pinned
+
+    def _history_window(self, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Earlier messages sent with the question
+
+        Whole turns from a reset point that only moves forward by
+        HISTORY_WINDOW messages at a time, so between HISTORY_WINDOW and
+        2 * HISTORY_WINDOW - 2 messages are sent. The prompt prefix stays
+        identical for several turns instead of shifting by one exchange per
+        question, which stable prompts need for cache reuse. Chat sessions
+        fold their messages in the same blocks.
+        """
+        if len(history) < 2 * HISTORY_WINDOW:
+            return history
+        start = (len(history) - HISTORY_WINDOW) // HISTORY_WINDOW * HISTORY_WINDOW
+        return history[start:]
+
     def _generate_answer(
         self,
         question: str,
         context: str,
-        conversation_history: List[Dict[str, str]] = None
+        conversation_history: List[Dict[str, str]] = None,
+        pinned_context: Optional[str] = None,
+        conversation_summary: Optional[str] = None
     ) -> str:
-        """Generate answer using LLM"""
+        """Generate answer using LLM
+
+        With a pinned context the message list starts with a byte-identical
+        prefix (system prompt, pinned patient context, earlier turns) and only
+        the newly retrieved context and the question are appended.
+        """
         try:
             # Build messages
             messages = [
@@ -166,15 +394,34 @@ Formatierung:
                 }
             ]
 
+            if pinned_context:
+                messages.append({
+                    "role": "system",
+                    "content": f"Feststehende Patientendaten:\n\n{pinned_context}"
+                })
+
+            if conversation_summary:
+                messages.append({
+                    "role": "system",
+                    "content": f"Zusammenfassung des bisherigen Gesprächs:\n{conversation_summary}"
+                })
+
             # Add conversation history if provided
             if conversation_history:
-                for msg in conversation_history[-6:]:  # Last 3 exchanges
-                    messages.append(msg)
+                messages.extend(self._history_window(conversation_history))
 
             # Add current question with context
-            messages.append({
-                "role": "user",
-                "content": f"""Kontext aus den Patientenakten:
+            if pinned_context and not context:
+                messages.append({
+                    "role": "user",
+                    "content": f"""Frage: {question}
+
+Bitte beantworte die Frage basierend auf den feststehenden Patientendaten."""
+                })
+            elif pinned_context:
+                messages.append({
+                    "role": "user",
+                    "content": f"""Zusätzlicher Kontext aus den Patientenakten:
 
 {context}
 
@@ -182,35 +429,78 @@ Formatierung:
 
 Frage: {question}
 
-Bitte beantworte die Frage basierend auf dem oben stehenden Kontext."""
-            })
-
-            # Call LLM
-            if self.llm_client == "ollama":
-                # Ollama API call
-                response = requests.post(
-                    f"{self.ollama_base_url}/api/chat",
-                    json={
-                        "model": self.llm_model,
-                        "messages": messages,
-                        "stream": False
-                    },
-                    timeout=60
-                )
-                response.raise_for_status()
-                answer = response.json()["message"]["content"]
+Bitte beantworte die Frage basierend auf den Patientendaten und dem zusätzlichen Kontext."""
+                })
             else:
-                # OpenAI API call
-                response = self.llm_client.chat.completions.create(
-                    model=self.llm_model,
-                    messages=messages,
-                    temperature=0.7,
-                    max_tokens=1000
-                )
-                answer = response.choices[0].message.content
+                messages.append({
+                    "role": "user",
+                    "content": f"""Kontext aus den Patientenakten:
+
+{context}
+
+---
+
+Frage: {question}
+
+Bitte beantworte die Frage basierend auf dem oben stehenden Kontext."""
+                })
+
+            # Call LLM in the interactive class, admitted ahead of queued reports
+            with self.scheduler.slot(self.model_type, "interactive"):
+                if self.llm_client == "ollama":
+                    # Ollama API call, keeping the model (and its KV cache) resident
+                    response = requests.post(
+                        f"{self.ollama_base_url}/api/chat",
+                        json={
+                            "model": self.llm_model,
+                            "messages": messages,
+                            "stream": False,
+                            "keep_alive": self.ollama_keep_alive
+                        },
+                        timeout=60
+                    )
+                    response.raise_for_status()
+                    result = response.json()
+                    answer = result["message"]["content"]
+                    record_llm_usage("rag", "ollama", result.get("prompt_eval_count"), result.get("eval_count"))
+
+                    # Ollama does not report cached prompt tokens, only the time to first token
+                    time_to_first_token = (result.get("load_duration", 0) + result.get("prompt_eval_duration", 0)) / 1e9
+                    record_prompt_cache("rag", "ollama", None, time_to_first_token)
+                else:
+                    # OpenAI API call, streamed to measure time to first token
+                    start = time.perf_counter()
+                    time_to_first_token = None
+                    parts = []
+                    usage = None
+                    stream = self.llm_client.chat.completions.create(
+                        model=self.llm_model,
+                        messages=messages,
+                        temperature=0.7,
+                        max_tokens=1000,
+                        stream=True,
+                        stream_options={"include_usage": True}
+                    )
+                    for chunk in stream:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            if time_to_first_token is None:
+                                time_to_first_token = time.perf_counter() - start
+                            parts.append(chunk.choices[0].delta.content)
+                        if getattr(chunk, "usage", None):
+                            usage = chunk.usage
+                    answer = "".join(parts)
+
+                    cached_tokens = None
+                    if usage:
+                        record_llm_usage("rag", "openai", usage.prompt_tokens, usage.completion_tokens)
+                        details = getattr(usage, "prompt_tokens_details", None)
+                        cached_tokens = getattr(details, "cached_tokens", None) if details else None
+                    record_prompt_cache("rag", "openai", cached_tokens, time_to_first_token)
 
             return answer
 
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             logger.error(f"Error generating answer: {str(e)}")
             return f"Fehler bei der Antwortgenerierung: {str(e)}"
@@ -252,3 +542,10 @@ Bitte beantworte die Frage basierend auf dem oben stehenden Kontext."""
         except Exception as e:
             logger.error(f"Error generating template answer: {str(e)}")
             return "Fehler beim Erstellen der Antwort."
+
+
+def _text_chars(payload: Dict[str, Any]) -> int:
+    """Length of a chunk text without reading it from the chunk store"""
+    if 'chars' in payload:
+        return payload['chars']
+    return len(payload.get('text', ""))
@@ -1,16 +1,96 @@
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import os
 from openai import OpenAI
 import requests
 import json
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from services.embedding_service import EmbeddingService
 from services.qdrant_service import QdrantService
+from services.rules_report import RulesReportGenerator
+from services.metrics import observe_stage, record_llm_usage
+from services.llm_scheduler import LLMScheduler, LLMOverloadedError
 
 logger = logging.getLogger(__name__)
 
+# Sections of the discharge report for REPORT_MODE=sections. Each section is
+# retrieved and generated on its own; "example" is both the JSON shape shown
+# to the LLM and the schema its answer is validated against.
+REPORT_SECTIONS = {
+    "patientInfo": {
+        "title": "PATIENTENINFORMATIONEN",
+        "instructions": "Name, Alter, Geschlecht, Aufnahmedatum, Entlassungsdatum, Aufenthaltsdauer und Abteilung/Station",
+        "queries": ["Patientendaten Demographie Aufnahme"],
+        "example": {
+            "name": "...",
+            "age": 0,
+            "gender": "...",
+            "admissionDate": "...",
+            "dischargeDate": "...",
+            "lengthOfStay": 0,
+            "department": "..."
+        },
+        "max_tokens": 300
+    },
+    "admissionReason": {
+        "title": "GRUND DER HOSPITALISATION",
+        "instructions": "Aufnahmegrund und Leitsymptome",
+        "queries": ["Aufnahmegrund Leitsymptome Beschwerden"],
+        "example": "...",
+        "max_tokens": 300
+    },
+    "diagnoses": {
+        "title": "DIAGNOSEN",
+        "instructions": "Hauptdiagnose und Nebendiagnosen",
+        "queries": ["Diagnosen"],
+        "example": {"primary": "...", "secondary": ["..."]},
+        "max_tokens": 300
+    },
+    "clinicalCourse": {
+        "title": "KLINISCHER VERLAUF",
+        "instructions": "Zusammenfassung des Verlaufs, wichtige Befunde, durchgeführte Untersuchungen/Prozeduren",
+        "queries": ["Klinischer Verlauf", "Prozeduren Operationen"],
+        "example": "...",
+        "max_tokens": 600
+    },
+    "therapy": {
+        "title": "THERAPIE",
+        "instructions": "Durchgeführte Behandlungen und operative Eingriffe (falls zutreffend)",
+        "queries": ["Medikation Therapie", "Prozeduren Operationen"],
+        "example": "...",
+        "max_tokens": 400
+    },
+    "medications": {
+        "title": "MEDIKATION BEI ENTLASSUNG",
+        "instructions": "Liste aller Medikamente mit Dosierung",
+        "queries": ["Medikation Therapie", "Entlassmedikation"],
+        "example": [{"name": "...", "dose": "...", "frequency": "...", "indication": "..."}],
+        "max_tokens": 600
+    },
+    "labs": {
+        "title": "LABORWERTE",
+        "instructions": "Wichtigste/auffällige Laborwerte und Trend (Aufnahme vs. Entlassung)",
+        "queries": ["Laborwerte"],
+        "example": {"summary": "...", "notable": ["..."]},
+        "max_tokens": 400
+    },
+    "recommendations": {
+        "title": "EMPFEHLUNGEN",
+        "instructions": "Weitere Verlaufskontrolle, ambulante Weiterbehandlung, Medikamentenanpassungen",
+        "queries": ["Empfehlungen Nachsorge Weiterbehandlung", "Medikation Therapie"],
+        "example": {"followUp": ["..."], "ambulatory": ["..."], "lifestyle": ["..."]},
+        "max_tokens": 400
+    }
+}
+
+# Free-text sections the LLM writes on top of the rules-based draft in hybrid mode
+NARRATIVE_SECTIONS = ["clinicalCourse", "therapy", "recommendations"]
+
+SYSTEM_PROMPT = "Du bist ein medizinischer AI-Assistent, der Entlassungsberichte erstellt. Antworte NUR mit validen JSON, ohne zusätzlichen Text."
+
 
 class ReportService:
     """Service for generating medical reports"""
@@ -18,7 +98,8 @@ class ReportService:
     def __init__(self, embedding_service: EmbeddingService):
         self.embedding_service = embedding_service
         self.qdrant_service = QdrantService(
-            embedding_dimension=embedding_service.get_embedding_dimension()
+            embedding_dimension=embedding_service.get_embedding_dimension(),
+            embedding_model=embedding_service.embedding_model
         )
 
         # Initialize LLM
@@ -38,6 +119,7 @@ class ReportService:
             self.ollama_base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
             self.llm_model = os.getenv("OLLAMA_LLM_MODEL", "llama3.2:3b")
             self.llm_client = "ollama"
+            self.ollama_keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
             logger.info(f"Initialized Ollama LLM for reports: {self.llm_model} at {self.ollama_base_url}")
         elif self.model_type == "local":
             self.llm_client = None
@@ -46,31 +128,82 @@ class ReportService:
             self.llm_client = None
             logger.warning(f"Unsupported model type: {self.model_type}, using local reports")
 
+        # "single" sends one prompt for the whole report, "sections" generates
+        # every section concurrently from its own retrieved context, "rules"
+        # builds the report from structured data only and "hybrid" lets the
+        # LLM rewrite the narrative sections of the rules-based draft
+        self.report_mode = os.getenv("REPORT_MODE", "single")
+        self.rules_report = RulesReportGenerator()
+        self.section_concurrency = int(os.getenv("REPORT_SECTION_CONCURRENCY", str(len(REPORT_SECTIONS))))
+        self.section_retries = int(os.getenv("REPORT_SECTION_RETRIES", "1"))
+        self.scheduler = LLMScheduler.shared()
+
     def generate_report(self, patient_id: str) -> Dict[str, Any]:
         """Generate discharge report for patient"""
         try:
-            # Load structured patient data from JSON
-            structured_data = self._load_patient_json(patient_id)
-
-            # Retrieve all relevant patient data from RAG
-            patient_data = self._retrieve_patient_data(patient_id)
+            backend = self.model_type if self.llm_client else "template"
 
-            if not patient_data:
-                return {
-                    'error': 'Keine Patientendaten gefunden',
-                    'patient_id': patient_id
-                }
-
-            # Generate structured report using LLM
-            if self.llm_client:
-                report = self._generate_structured_report(patient_id, patient_data)
+            # Load structured patient data from JSON
+            with observe_stage("report", "load_structured", backend):
+                structured_data = self._load_patient_json(patient_id)
+
+            # Deterministic draft straight from patient.json and labs.txt
+            if structured_data and (not self.llm_client or self.report_mode in ("rules", "hybrid")):
+                with observe_stage("report", "rules", backend):
+                    report = self.rules_report.generate(
+                        patient_id, structured_data, self._load_patient_file(patient_id, "labs.txt")
+                    )
+
+                if self.llm_client and self.report_mode == "hybrid":
+                    with observe_stage("report", "retrieve", backend):
+                        section_data = self._retrieve_section_data(patient_id, NARRATIVE_SECTIONS)
+                    # Sections the LLM fails on keep their rules-based text
+                    try:
+                        with observe_stage("report", "generate", backend):
+                            report.update(self._generate_sections(section_data))
+                        report['generator'] = 'hybrid'
+                    except LLMOverloadedError as e:
+                        logger.warning(f"Keeping the rules-based report for patient {patient_id}: {str(e)}")
+
+                return report
+
+            if self.llm_client and self.report_mode == "sections":
+                # Retrieve context for every section separately
+                with observe_stage("report", "retrieve", backend):
+                    section_data = self._retrieve_section_data(patient_id)
+
+                if not any(section_data.values()):
+                    return {
+                        'error': 'Keine Patientendaten gefunden',
+                        'patient_id': patient_id
+                    }
+
+                # Generate all sections concurrently and merge them
+                with observe_stage("report", "generate", backend):
+                    report = self._generate_sectioned_report(patient_id, section_data)
             else:
-                # Fallback report without LLM
-                report = self._generate_basic_report(patient_id, patient_data)
+                # Retrieve all relevant patient data from RAG
+                with observe_stage("report", "retrieve", backend):
+                    patient_data = self._retrieve_patient_data(patient_id)
+
+                if not patient_data:
+                    return {
+                        'error': 'Keine Patientendaten gefunden',
+                        'patient_id': patient_id
+                    }
+
+                # Generate structured report using LLM
+                with observe_stage("report", "generate", backend):
+                    if self.llm_client:
+                        report = self._generate_structured_report(patient_id, patient_data)
+                    else:
+                        # Fallback report without LLM
+                        report = self._generate_basic_report(patient_id, patient_data)
 
             # Override critical fields with accurate structured data
             if structured_data:
-                report = self._merge_structured_data(report, structured_data)
+                with observe_stage("report", "merge", backend):
+                    report = self._merge_structured_data(report, structured_data)
 
             return report
 
@@ -220,7 +353,7 @@ Wichtig:
             messages = [
                 {
                     "role": "system",
-                    "content": "Du bist ein medizinischer AI-Assistent, der Entlassungsberichte erstellt. Antworte NUR mit validen JSON, ohne zusätzlichen Text."
+                    "content": SYSTEM_PROMPT
                 },
                 {
                     "role": "user",
@@ -228,38 +361,7 @@ Wichtig:
                 }
             ]
 
-            if self.llm_client == "ollama":
-                # Ollama API call with format json
-                logger.info("Calling Ollama for report generation...")
-                response = requests.post(
-                    f"{self.ollama_base_url}/api/chat",
-                    json={
-                        "model": self.llm_model,
-                        "messages": messages,
-                        "stream": False,
-                        "format": "json"  # Force JSON output
-                    },
-                    timeout=180  # Increased timeout for report generation
-                )
-                response.raise_for_status()
-                result = response.json()
-                content = result["message"]["content"]
-                logger.info(f"Received response from Ollama: {len(content)} chars")
-            else:
-                # OpenAI API call
-                response = self.llm_client.chat.completions.create(
-                    model=self.llm_model,
-                    messages=messages,
-                    temperature=0.3,
-                    max_tokens=2000,
-                    response_format={"type": "json_object"}
-                )
-                content = response.choices[0].message.content
-
-            # Parse JSON response
-            if not content or not content.strip():
-                logger.error("Empty response from LLM")
-                raise ValueError("Empty response from LLM")
+            content = self._call_llm(messages, max_tokens=2000, timeout=180)
 
             logger.info(f"Parsing JSON response: {content[:200]}...")
             report_json = json.loads(content)
@@ -270,10 +372,197 @@ Wichtig:
 
             return report_json
 
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             logger.error(f"Error generating structured report: {str(e)}")
             return self._generate_basic_report(patient_id, patient_data)
 
+    def _retrieve_section_data(self, patient_id: str, keys: Optional[List[str]] = None) -> Dict[str, str]:
+        """Retrieve a focused context for every (or the given) report section"""
+        query_results: Dict[str, list] = {}
+        section_data = {}
+
+        for key in keys or REPORT_SECTIONS:
+            section = REPORT_SECTIONS[key]
+            seen_texts = set()
+            parts = []
+            for query in section['queries']:
+                # Several sections share queries, search each only once
+                if query not in query_results:
+                    try:
+                        query_results[query] = self.qdrant_service.search(
+                            query_vector=self.embedding_service.create_embedding(query),
+                            patient_id=patient_id,
+                            limit=6,
+                            score_threshold=0.2
+                        )
+                    except Exception as e:
+                        logger.error(f"Error retrieving data for query '{query}': {str(e)}")
+                        query_results[query] = []
+
+                for r in query_results[query]:
+                    text = r['payload']['text']
+                    if text not in seen_texts:
+                        seen_texts.add(text)
+                        parts.append(f"[{r['payload']['source']} - {r['payload']['section']}]:\n{text}")
+
+            section_data[key] = "\n\n".join(parts)
+
+        return section_data
+
+    def _generate_sectioned_report(self, patient_id: str, section_data: Dict[str, str]) -> Dict[str, Any]:
+        """Generate report sections concurrently and merge them into one report"""
+        results = self._generate_sections(section_data)
+
+        report = {}
+        for key, section in REPORT_SECTIONS.items():
+            report[key] = results[key] if key in results else _empty_value(section['example'])
+
+        failed = [key for key in REPORT_SECTIONS if key not in results]
+        if failed:
+            report['failedSections'] = failed
+
+        report['patient_id'] = patient_id
+        report['generated_at'] = None  # Will be set by main.py
+        return report
+
+    def _generate_sections(self, section_data: Dict[str, str]) -> Dict[str, Any]:
+        """Generate the given sections concurrently, retrying only the ones that failed
+
+        Sections shed by the scheduler count as failed. Only if every section
+        was shed is the LLMOverloadedError raised.
+        """
+        results: Dict[str, Any] = {}
+        pending = list(section_data)
+        shed: Optional[LLMOverloadedError] = None
+
+        # More workers than backend slots would only queue the report behind itself
+        workers = max(1, min(self.section_concurrency, self.scheduler.concurrency(self.model_type)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report-section") as executor:
+            for attempt in range(1 + self.section_retries):
+                futures = {
+                    key: executor.submit(contextvars.copy_context().run, self._generate_section, key, section_data[key])
+                    for key in pending
+                }
+                failed = []
+                for key, future in futures.items():
+                    try:
+                        value = future.result()
+                    except LLMOverloadedError as e:
+                        # Retrying would only queue up again on the saturated backend
+                        shed = e
+                        continue
+                    if value is None:
+                        failed.append(key)
+                    else:
+                        results[key] = value
+
+                if not failed:
+                    break
+                if attempt < self.section_retries:
+                    logger.warning(f"Retrying failed report sections: {', '.join(failed)}")
+                pending = failed
+
+        if shed is not None and not results:
+            raise shed
+        failed = [key for key in section_data if key not in results]
+        if failed:
+            logger.error(f"Report sections failed after retries: {', '.join(failed)}")
+        return results
+
+    def _generate_section(self, key: str, section_context: str) -> Optional[Any]:
+        """Generate and validate a single report section, None on failure"""
+        section = REPORT_SECTIONS[key]
+        backend = self.model_type if self.llm_client else "template"
+        try:
+            with observe_stage("report", "section", backend):
+                prompt = f"""Erstelle den Abschnitt "{section['title']}" eines Entlassungsberichts basierend auf den folgenden Patientendaten.
+
+Inhalt: {section['instructions']}
+
+PATIENTENDATEN:
+{section_context or "Keine Angaben"}
+
+---
+
+Antworte als JSON mit folgender Struktur:
+{json.dumps({key: section['example']}, ensure_ascii=False, indent=2)}
+
+Wichtig:
+- Sei präzise und medizinisch korrekt
+- Nutze die tatsächlichen Daten aus den Patientenakten
+- Wenn Informationen fehlen, lasse das Feld leer oder schreibe "Keine Angaben"
+"""
+                messages = [
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ]
+                content = self._call_llm(messages, max_tokens=section['max_tokens'], timeout=90)
+
+            parsed = json.loads(content)
+            value = parsed[key] if isinstance(parsed, dict) and key in parsed else parsed
+            if not _matches_schema(value, section['example']):
+                logger.warning(f"Report section {key} does not match the expected structure")
+                return None
+            return value
+
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            logger.error(f"Error generating report section {key}: {str(e)}")
+            return None
+
+    def _call_llm(self, messages: list, max_tokens: int, timeout: int) -> str:
+        """Send a JSON-mode chat request to the configured LLM and return its content"""
+        # Reports are batch work, chat requests are admitted first
+        with self.scheduler.slot(self.model_type, "batch"):
+            return self._send_llm_request(messages, max_tokens, timeout)
+
+    def _send_llm_request(self, messages: list, max_tokens: int, timeout: int) -> str:
+        if self.llm_client == "ollama":
+            # Ollama API call with format json
+            logger.info("Calling Ollama for report generation...")
+            response = requests.post(
+                f"{self.ollama_base_url}/api/chat",
+                json={
+                    "model": self.llm_model,
+                    "messages": messages,
+                    "stream": False,
+                    "format": "json",  # Force JSON output
+                    "keep_alive": self.ollama_keep_alive,
+                    "options": {"num_predict": max_tokens}
+                },
+                timeout=timeout
+            )
+            response.raise_for_status()
+            result = response.json()
+            content = result["message"]["content"]
+            record_llm_usage("report", "ollama", result.get("prompt_eval_count"), result.get("eval_count"))
+            logger.info(f"Received response from Ollama: {len(content)} chars")
+        else:
+            # OpenAI API call
+            response = self.llm_client.chat.completions.create(
+                model=self.llm_model,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=max_tokens,
+                response_format={"type": "json_object"},
+                timeout=timeout
+            )
+            content = response.choices[0].message.content
+            if response.usage:
+                record_llm_usage(
+                    "report", "openai", response.usage.prompt_tokens, response.usage.completion_tokens
+                )
+
+        # Parse JSON response
+        if not content or not content.strip():
+            logger.error("Empty response from LLM")
+            raise ValueError("Empty response from LLM")
+
+        return content
+
     def _generate_basic_report(self, patient_id: str, patient_data: str) -> Dict[str, Any]:
         """Generate basic report without LLM (fallback)"""
         return {
@@ -286,11 +575,25 @@ Wichtig:
             'message': 'Bericht konnte nicht vollständig generiert werden (kein LLM-API-Key konfiguriert)'
         }
 
+    def _load_patient_file(self, patient_id: str, filename: str) -> Optional[str]:
+        """Read a text file from the patient's sample data directory"""
+        try:
+            sample_data_dir = os.getenv("SAMPLE_DATA_DIR", "/app/sample-data")
+            path = Path(sample_data_dir) / patient_id / filename
+            if not path.exists():
+                return None
+            return path.read_text(encoding='utf-8')
+
+        except Exception as e:
+            logger.error(f"Error loading {filename}: {str(e)}")
+            return None
+
     def _load_patient_json(self, patient_id: str) -> Optional[Dict[str, Any]]:
         """Load structured patient data from JSON file"""
         try:
             # Try to find patient.json in sample-data directory
-            patient_json_path = Path(f"/app/sample-data/{patient_id}/patient.json")
+            sample_data_dir = os.getenv("SAMPLE_DATA_DIR", "/app/sample-data")
+            patient_json_path = Path(sample_data_dir) / patient_id / "patient.json"
 
             if not patient_json_path.exists():
                 logger.warning(f"No patient.json found for {patient_id}")
@@ -333,3 +636,28 @@ Wichtig:
         except Exception as e:
             logger.error(f"Error merging structured data: {str(e)}")
             return report
+
+
+def _matches_schema(value: Any, example: Any) -> bool:
+    """Check that an LLM-generated value has the shape of the example"""
+    if isinstance(example, dict):
+        return isinstance(value, dict) and all(
+            k in value and _matches_schema(value[k], v) for k, v in example.items()
+        )
+    if isinstance(example, list):
+        return isinstance(value, list) and all(_matches_schema(item, example[0]) for item in value)
+    if isinstance(example, str):
+        return isinstance(value, str)
+    # Numbers are often returned as strings or left empty
+    return value is None or isinstance(value, (int, float, str))
+
+
+def _empty_value(example: Any) -> Any:
+    """Placeholder with the shape of the example for a section that could not be generated"""
+    if isinstance(example, dict):
+        return {k: _empty_value(v) for k, v in example.items()}
+    if isinstance(example, list):
+        return []
+    if isinstance(example, str):
+        return "Keine Angaben"
+    return None
@@ -0,0 +1,408 @@
+import re
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# "AUFNAHME (15.11.2024, 08:45 Uhr)" or "POSTOPERATIV Tag 1 (12.11.2024)"
+TIMEPOINT_PATTERN = re.compile(
+    r"^(?P<label>[A-ZÄÖÜ][^(]*?)\s*\((?P<date>\d{2}\.\d{2}\.\d{4})(?:,\s*(?P<time>\d{1,2}:\d{2})\s*Uhr)?\)\s*$"
+)
+# "- Troponin T: 1.85 ng/mL (Normal: <0.014) ↑↑ STARK ERHÖHT"
+RESULT_PATTERN = re.compile(r"^-\s*(?P<name>[^:]+):\s*(?P<rest>.+)$")
+VALUE_PATTERN = re.compile(r"^(?P<prefix>[<>]?)\s*(?P<value>\d+(?:[.,]\d+)?)\s*(?P<unit>[^\s(↑↓]*)")
+REFERENCE_PATTERN = re.compile(r"\(Normal:\s*(?P<reference>[^)]*)\)")
+RANGE_PATTERN = re.compile(r"^(?P<low>\d+(?:[.,]\d+)?)\s*-\s*(?P<high>\d+(?:[.,]\d+)?)")
+BOUND_PATTERN = re.compile(r"^(?P<op>[<>])\s*(?P<bound>\d+(?:[.,]\d+)?)")
+
+# Follow-up advice derived from ICD-10 code prefixes of the diagnoses
+DIAGNOSIS_RULES = {
+    "I21": {
+        "followUp": ["Kardiologische Verlaufskontrolle inkl. Echokardiographie in 4-6 Wochen"],
+        "ambulatory": ["Kardiale Rehabilitation"],
+        "lifestyle": ["Nikotinverzicht, regelmässige körperliche Aktivität nach Rücksprache"]
+    },
+    "I10": {
+        "followUp": ["Regelmässige Blutdruckkontrollen"],
+        "lifestyle": ["Salzarme Ernährung"]
+    },
+    "I48": {
+        "followUp": ["Kontrolle von Herzrhythmus und Antikoagulation"]
+    },
+    "E11": {
+        "followUp": ["HbA1c-Kontrolle in 3 Monaten"],
+        "lifestyle": ["Diabetesgerechte Ernährung"]
+    },
+    "E78": {
+        "followUp": ["Lipidkontrolle in 6-8 Wochen"],
+        "lifestyle": ["Fettarme Ernährung"]
+    },
+    "J18": {
+        "followUp": ["Klinische Kontrolle und ggf. Thorax-Röntgen in 6 Wochen"],
+        "lifestyle": ["Pneumokokken- und Grippeimpfung prüfen"]
+    },
+    "J44": {
+        "ambulatory": ["Pneumologische Weiterbetreuung"],
+        "lifestyle": ["Nikotinverzicht"]
+    },
+    "C18": {
+        "followUp": ["Tumornachsorge gemäss Tumorboard inkl. CEA-Kontrollen"],
+        "ambulatory": ["Onkologische Weiterbetreuung"]
+    },
+    "N18": {
+        "followUp": ["Kontrolle der Nierenfunktion"]
+    }
+}
+
+# Vital signs keys and how they are shown
+VITAL_SIGNS = {
+    "bloodPressure": ("Blutdruck", "mmHg"),
+    "heartRate": ("Herzfrequenz", "/min"),
+    "temperature": ("Temperatur", "°C"),
+    "respiratoryRate": ("Atemfrequenz", "/min"),
+    "oxygenSaturation": ("SpO2", "%")
+}
+
+
+class RulesReportGenerator:
+    """Deterministic discharge report built from patient.json and labs.txt"""
+
+    def generate(self, patient_id: str, structured_data: Dict[str, Any], lab_text: Optional[str] = None) -> Dict[str, Any]:
+        """Fill every section of the report schema from structured data"""
+        demographics = structured_data.get('demographics', {})
+        admission = structured_data.get('admission', {})
+        diagnoses = structured_data.get('diagnoses', [])
+        medications = structured_data.get('medications', [])
+        procedures = sorted(structured_data.get('procedures', []), key=lambda p: p.get('date') or '')
+        allergies = structured_data.get('allergies', [])
+        vital_signs = sorted(structured_data.get('vitalSigns', []), key=lambda v: v.get('timestamp') or '')
+        labs = self.parse_labs(lab_text) if lab_text else {'timepoints': [], 'results': [], 'interpretation': ''}
+
+        primary = [d for d in diagnoses if d.get('type') == 'Hauptdiagnose'] or diagnoses[:1]
+        secondary = [d for d in diagnoses if d not in primary]
+
+        report = {
+            'patient_id': patient_id,
+            'patientInfo': {
+                'name': demographics.get('name'),
+                'age': demographics.get('age'),
+                'gender': demographics.get('gender'),
+                'admissionDate': admission.get('admissionDate'),
+                'dischargeDate': admission.get('dischargeDate'),
+                'lengthOfStay': admission.get('lengthOfStay'),
+                'department': admission.get('department')
+            },
+            'admissionReason': admission.get('admissionReason') or "Keine Angaben",
+            'diagnoses': {
+                'primary': _format_diagnosis(primary[0]) if primary else "Keine Angaben",
+                'secondary': [_format_diagnosis(d) for d in secondary]
+            },
+            'clinicalCourse': self._clinical_course(admission, procedures, vital_signs, labs),
+            'therapy': self._therapy(procedures, medications),
+            'medications': [
+                {
+                    'name': m.get('name', ''),
+                    'dose': m.get('dose', ''),
+                    'frequency': m.get('frequency', ''),
+                    'indication': m.get('indication', '') + (f" ({m['pausedDuring']})" if m.get('pausedDuring') else '')
+                }
+                for m in medications
+            ],
+            'labs': self._labs(labs),
+            'procedures': [
+                {
+                    'name': p.get('name', ''),
+                    'date': _format_date(p.get('date')),
+                    'description': p.get('description', '')
+                }
+                for p in procedures
+            ],
+            'allergies': [
+                {
+                    'substance': a.get('substance', ''),
+                    'reaction': a.get('reaction', ''),
+                    'severity': a.get('severity', '')
+                }
+                for a in allergies
+            ],
+            'vitals': self._vitals(vital_signs),
+            'recommendations': self._recommendations(diagnoses, medications, admission, labs),
+            'generated_at': None,  # Will be set by main.py
+            'generator': 'rules'
+        }
+        return report
+
+    def parse_labs(self, text: str) -> Dict[str, Any]:
+        """Parse a labs.txt file into timepoints, individual results and the interpretation"""
+        timepoints: List[Dict[str, Any]] = []
+        results: List[Dict[str, Any]] = []
+        references: Dict[str, str] = {}
+        interpretation: List[str] = []
+        group = None
+        in_interpretation = False
+
+        for raw_line in text.splitlines():
+            line = raw_line.strip()
+            if not line or set(line) <= set("=-"):
+                continue
+
+            if line.rstrip(':') == 'INTERPRETATION':
+                in_interpretation = True
+                continue
+            if in_interpretation:
+                interpretation.append(line)
+                continue
+
+            timepoint = TIMEPOINT_PATTERN.match(line)
+            if timepoint:
+                timepoints.append({
+                    'label': timepoint.group('label').strip(),
+                    'date': timepoint.group('date'),
+                    'time': timepoint.group('time')
+                })
+                group = None
+                continue
+
+            result = RESULT_PATTERN.match(line)
+            if result and timepoints:
+                name = result.group('name').strip()
+                parsed = self._parse_result(name, result.group('rest'), references)
+                parsed['group'] = group
+                parsed['timepoint'] = len(timepoints) - 1
+                results.append(parsed)
+                continue
+
+            if line.endswith(':') and not line.startswith('-'):
+                group = line[:-1].strip()
+
+        return {'timepoints': timepoints, 'results': results, 'interpretation': " ".join(interpretation)}
+
+    def _parse_result(self, name: str, rest: str, references: Dict[str, str]) -> Dict[str, Any]:
+        """Parse value, unit, reference range and flag of a single lab line"""
+        value = None
+        unit = ''
+        match = VALUE_PATTERN.match(rest)
+        if match:
+            value = float(match.group('value').replace(',', '.'))
+            unit = match.group('unit')
+
+        reference_match = REFERENCE_PATTERN.search(rest)
+        if reference_match:
+            references[name] = reference_match.group('reference').strip()
+        reference = references.get(name)
+
+        # Follow-up values often only carry trend arrows ("↓ rückläufig"), so the
+        # reference range decides whenever one is known
+        if value is not None and any(bound is not None for bound in _parse_reference(reference)):
+            flag = _outside_range(value, reference)
+        elif '↑' in rest:
+            flag = 'high'
+        elif '↓' in rest:
+            flag = 'low'
+        else:
+            flag = None
+
+        return {
+            'name': name,
+            'value': value,
+            'unit': unit,
+            'text': rest.strip(),
+            'reference': reference,
+            'flag': flag
+        }
+
+    def _clinical_course(self, admission, procedures, vital_signs, labs) -> str:
+        """Chronological summary of the stay"""
+        sentences = []
+        if admission.get('admissionDate'):
+            sentence = f"Stationäre Aufnahme am {_format_date(admission['admissionDate'])}"
+            if admission.get('department'):
+                sentence += f" ({admission['department']})"
+            sentences.append(sentence + ".")
+            if admission.get('admissionReason'):
+                sentences.append(f"Aufnahmegrund: {admission['admissionReason']}.")
+
+        for procedure in procedures:
+            text = f"{_format_date(procedure.get('date'))}: {procedure.get('name', '')}"
+            if procedure.get('description'):
+                text += f" ({procedure['description']})"
+            sentences.append(text + ".")
+
+        if len(vital_signs) > 1:
+            first, last = vital_signs[0], vital_signs[-1]
+            changes = [
+                f"{label} {first[key]} → {last[key]} {unit}"
+                for key, (label, unit) in VITAL_SIGNS.items()
+                if key in first and key in last and first[key] != last[key]
+            ]
+            if changes:
+                sentences.append("Verlauf der Vitalparameter: " + ", ".join(changes) + ".")
+
+        if labs['interpretation']:
+            sentences.append(labs['interpretation'])
+
+        if admission.get('dischargeDate'):
+            sentences.append(f"Entlassung am {_format_date(admission['dischargeDate'])}.")
+
+        return " ".join(sentences) if sentences else "Keine Angaben"
+
+    def _therapy(self, procedures, medications) -> str:
+        """Procedures and newly started medication"""
+        parts = []
+        if procedures:
+            parts.append("Durchgeführte Prozeduren: " + ", ".join(p.get('name', '') for p in procedures) + ".")
+        indications = []
+        for medication in medications:
+            if medication.get('indication'):
+                indications.append(f"{medication.get('name', '')} ({medication['indication']})")
+        if indications:
+            parts.append("Medikamentöse Therapie: " + ", ".join(indications) + ".")
+        return " ".join(parts) if parts else "Keine Angaben"
+
+    def _labs(self, labs) -> Dict[str, Any]:
+        """Abnormal values with their trend from first to last measurement"""
+        series: Dict[str, List[Dict[str, Any]]] = {}
+        for result in labs['results']:
+            if result['value'] is not None:
+                series.setdefault(result['name'], []).append(result)
+
+        notable = []
+        trends = []
+        for name, values in series.items():
+            if not any(v['flag'] for v in values):
+                continue
+            first, last = values[0], values[-1]
+            unit = first['unit'] or last['unit']
+            reference = f" (Normal: {first['reference']})" if first['reference'] else ""
+            if len(values) > 1:
+                timepoints = labs['timepoints']
+                text = (
+                    f"{name}: {_format_number(first['value'])} → {_format_number(last['value'])} {unit}{reference}, "
+                    f"{timepoints[first['timepoint']]['date']} bis {timepoints[last['timepoint']]['date']}"
+                )
+                trends.append({
+                    'name': name,
+                    'unit': unit,
+                    'reference': first['reference'],
+                    'values': [
+                        {'date': timepoints[v['timepoint']]['date'], 'value': v['value'], 'flag': v['flag']}
+                        for v in values
+                    ],
+                    'direction': _direction(first['value'], last['value'])
+                })
+            else:
+                text = f"{name}: {_format_number(first['value'])} {unit}{reference}"
+            notable.append(text.replace(" ,", ","))
+
+        if labs['interpretation']:
+            summary = labs['interpretation']
+        elif notable:
+            summary = f"{len(notable)} auffällige Laborparameter."
+        else:
+            summary = "Keine auffälligen Laborwerte." if labs['results'] else "Keine Angaben"
+
+        return {'summary': summary, 'notable': notable, 'trends': trends}
+
+    def _vitals(self, vital_signs) -> Dict[str, Any]:
+        """Vital signs at admission and at the last measurement"""
+        if not vital_signs:
+            return {'admission': None, 'latest': None, 'measurements': 0}
+
+        def describe(entry):
+            values = {label: f"{entry[key]} {unit}" for key, (label, unit) in VITAL_SIGNS.items() if key in entry}
+            if entry.get('oxygenSupport'):
+                values['Sauerstoff'] = entry['oxygenSupport']
+            return {'timestamp': entry.get('timestamp'), 'values': values}
+
+        return {
+            'admission': describe(vital_signs[0]),
+            'latest': describe(vital_signs[-1]),
+            'measurements': len(vital_signs)
+        }
+
+    def _recommendations(self, diagnoses, medications, admission, labs) -> Dict[str, List[str]]:
+        """Follow-up advice from diagnosis rules, medication and abnormal discharge labs"""
+        recommendations = {'followUp': [], 'ambulatory': [], 'lifestyle': []}
+
+        for diagnosis in diagnoses:
+            rules = DIAGNOSIS_RULES.get((diagnosis.get('code') or '')[:3], {})
+            for key, items in rules.items():
+                for item in items:
+                    if item not in recommendations[key]:
+                        recommendations[key].append(item)
+
+        # Values still abnormal at the last timepoint they were measured
+        latest: Dict[str, Dict[str, Any]] = {}
+        for result in labs['results']:
+            if result['value'] is not None:
+                latest[result['name']] = result
+        for name, result in latest.items():
+            if result['flag'] and result['timepoint'] > 0:
+                recommendations['followUp'].append(
+                    f"Kontrolle {name} (zuletzt {_format_number(result['value'])} {result['unit']})".replace(" )", ")")
+                )
+
+        admission_date = (admission.get('admissionDate') or '')[:10]
+        new_medications = [
+            m.get('name', '') for m in medications
+            if admission_date and (m.get('startDate') or '')[:10] >= admission_date
+        ]
+        if new_medications:
+            recommendations['ambulatory'].append(
+                "Fortführung der neu begonnenen Medikation: " + ", ".join(new_medications)
+            )
+        recommendations['ambulatory'].append("Weiterbetreuung durch den Hausarzt")
+
+        return recommendations
+
+
+def _format_diagnosis(diagnosis: Dict[str, Any]) -> str:
+    if diagnosis.get('code'):
+        return f"{diagnosis.get('description', '')} ({diagnosis['code']})"
+    return diagnosis.get('description', '')
+
+
+def _format_date(value: Optional[str]) -> str:
+    """ISO timestamp to dd.mm.yyyy, other values are returned unchanged"""
+    if not value:
+        return ""
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).strftime("%d.%m.%Y")
+    except ValueError:
+        return value
+
+
+def _format_number(value: float) -> str:
+    return f"{value:g}"
+
+
+def _direction(first: float, last: float) -> str:
+    if last > first:
+        return "steigend"
+    if last < first:
+        return "fallend"
+    return "stabil"
+
+
+def _parse_reference(reference: Optional[str]) -> Tuple[Optional[float], Optional[float]]:
+    """Lower and upper bound of a reference like "13.5-17.5", "<0.014" or ">60" """
+    if not reference:
+        return None, None
+    match = RANGE_PATTERN.match(reference)
+    if match:
+        return float(match.group('low').replace(',', '.')), float(match.group('high').replace(',', '.'))
+    match = BOUND_PATTERN.match(reference)
+    if match:
+        bound = float(match.group('bound').replace(',', '.'))
+        return (None, bound) if match.group('op') == '<' else (bound, None)
+    return None, None
+
+
+def _outside_range(value: float, reference: Optional[str]) -> Optional[str]:
+    low, high = _parse_reference(reference)
+    if high is not None and value > high:
+        return 'high'
+    if low is not None and value < low:
+        return 'low'
+    return None
@@ -0,0 +1,126 @@
+import os
+import json
+import base64
+import hashlib
+import logging
+from typing import List, Dict, Any, Optional, Iterator
+
+from services.embedding_service import EmbeddingService
+from services.qdrant_service import QdrantService
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor is malformed or belongs to another query"""
+
+
+class SearchService:
+    """Cohort search across all patients, grouped by patient and paginated by cursor
+
+    Group-by queries have no offset and Qdrant cannot bound scores from
+    above, so the cursor carries the patient ids already returned and the
+    next page excludes them in the filter. That filter grows with every page,
+    which is why paging stops at SEARCH_MAX_CURSOR_PATIENTS and the page
+    summary then says truncated. Every page is fetched in batches and
+    streamed as soon as a batch arrives.
+    """
+
+    def __init__(self, embedding_service: EmbeddingService):
+        self.embedding_service = embedding_service
+        self.qdrant_service = QdrantService(
+            embedding_dimension=embedding_service.get_embedding_dimension(),
+            embedding_model=embedding_service.embedding_model
+        )
+        self.max_page_size = int(os.getenv("SEARCH_MAX_PAGE_SIZE", "200"))
+        self.batch_groups = int(os.getenv("SEARCH_BATCH_GROUPS", "50"))
+        self.max_seen = int(os.getenv("SEARCH_MAX_CURSOR_PATIENTS", "5000"))
+
+    def decode_cursor(self, cursor: Optional[str], fingerprint: str) -> List[str]:
+        """Patient ids already returned for this query"""
+        if not cursor:
+            return []
+        try:
+            state = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        except Exception:
+            raise InvalidCursorError("Malformed cursor")
+        if state.get('q') != fingerprint:
+            raise InvalidCursorError("Cursor belongs to a different query")
+        return state['seen']
+
+    def encode_cursor(self, seen: List[str], fingerprint: str) -> str:
+        state = json.dumps({'q': fingerprint, 'seen': seen}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(state.encode()).decode()
+
+    def fingerprint(self, query: str, filters: Dict[str, Any]) -> str:
+        """Stable hash of query text and filters, binding cursors to their query"""
+        key = json.dumps({'query': query, **filters}, sort_keys=True, default=str)
+        return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+    def search(
+        self,
+        query: str,
+        filters: Dict[str, Any],
+        limit: int = 20,
+        hits_per_patient: int = 3,
+        score_threshold: float = 0.3,
+        seen: Optional[List[str]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Yield one result per matching patient, followed by a page summary"""
+        limit = max(1, min(limit, self.max_page_size))
+        seen = list(seen or [])
+        fingerprint = self.fingerprint(query, filters)
+        query_vector = self.embedding_service.create_embedding(query)
+
+        returned = 0
+        exhausted = False
+        while returned < limit:
+            batch_size = min(self.batch_groups, limit - returned)
+            groups = self.qdrant_service.search_groups(
+                query_vector=query_vector,
+                limit=batch_size,
+                group_size=hits_per_patient,
+                score_threshold=score_threshold,
+                exclude_patient_ids=seen,
+                **filters
+            )
+
+            for group in groups:
+                seen.append(group['patient_id'])
+                returned += 1
+                yield self._format_group(group)
+
+            if len(groups) < batch_size:
+                exhausted = True
+                break
+
+        logger.info(f"Cohort search returned {returned} patients ({len(seen)} total for this query)")
+        next_cursor = None
+        # Results may remain, but the cursor would exceed SEARCH_MAX_CURSOR_PATIENTS
+        truncated = not exhausted and len(seen) >= self.max_seen
+        if not exhausted and not truncated:
+            next_cursor = self.encode_cursor(seen, fingerprint)
+        elif truncated:
+            logger.warning(f"Cohort search stopped paging after {len(seen)} patients (SEARCH_MAX_CURSOR_PATIENTS)")
+        yield {'type': 'page', 'patients': returned, 'next_cursor': next_cursor, 'truncated': truncated}
+
+    def _format_group(self, group: Dict[str, Any]) -> Dict[str, Any]:
+        hits = group['hits']
+        first = hits[0]['payload'] if hits else {}
+        return {
+            'type': 'patient',
+            'patient_id': group['patient_id'],
+            'score': hits[0]['score'] if hits else 0.0,
+            'department': first.get('department'),
+            'admission_date': first.get('admission_date'),
+            'hits': [
+                {
+                    'id': str(hit['id']),
+                    'score': hit['score'],
+                    'source': hit['payload'].get('source'),
+                    'section': hit['payload'].get('section'),
+                    'text': hit['payload']['text'][:300]
+                }
+                for hit in hits
+            ]
+        }
@@ -0,0 +1,62 @@
+"""Response serialization with content negotiation.
+
+REST responses are encoded with orjson. Clients that send
+`Accept: application/msgpack` (the Node backend) get MessagePack instead,
+which is smaller and cheaper to encode for the large report and source
+payloads.
+"""
+from typing import Any
+
+import msgpack
+import orjson
+from fastapi import Request, Response
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+class FastJSONResponse(ORJSONResponse):
+    """orjson response that also accepts numpy values and non-string keys"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+
+def wants_msgpack(request: Request) -> bool:
+    return MSGPACK_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def to_builtin(content: Any) -> Any:
+    """Plain dicts and lists for pydantic models, other values unchanged"""
+    if isinstance(content, BaseModel):
+        return content.model_dump(mode="json")
+    if isinstance(content, list):
+        return [to_builtin(item) for item in content]
+    return content
+
+
+def encode(content: Any, msgpack_format: bool) -> bytes:
+    data = to_builtin(content)
+    if msgpack_format:
+        return msgpack.packb(data, use_bin_type=True, default=_msgpack_default)
+    return orjson.dumps(data, option=ORJSON_OPTIONS)
+
+
+def negotiated_response(request: Request, content: Any, status_code: int = 200) -> Response:
+    """Encode a response body in the format the client asked for"""
+    msgpack_format = wants_msgpack(request)
+    return Response(
+        content=encode(content, msgpack_format),
+        status_code=status_code,
+        media_type=MSGPACK_MEDIA_TYPE if msgpack_format else "application/json"
+    )
+
+
+def _msgpack_default(value: Any) -> Any:
+    # numpy scalars and arrays from scores and vectors
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
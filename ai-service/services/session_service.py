@@ -0,0 +1,191 @@
+import os
+import re
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Session ids end up in file names, so only plain tokens are accepted
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+MARKDOWN_NOISE = re.compile(r"[#*_`>|]+")
+WHITESPACE = re.compile(r"\s+")
+
+
+class SessionService:
+    """Server-side chat sessions with a rolling summary of older turns
+
+    Each session keeps the most recent messages verbatim. Once twice
+    CHAT_SESSION_RECENT_MESSAGES have accumulated, the oldest block of that
+    size is condensed into short "Frage/Antwort" lines of a running summary.
+    Folding whole blocks keeps the summary and the start of the history
+    unchanged for several turns, which stable prompts rely on. The oldest
+    summary lines are dropped once it exceeds its size limit, so the history
+    sent to the LLM stays bounded however long the conversation gets.
+    Sessions live in an in-memory LRU; with CHAT_SESSION_DIR set they are
+    also written to disk, which survives restarts and lets several uvicorn
+    workers share sessions.
+    """
+
+    def __init__(self):
+        self.max_sessions = int(os.getenv("CHAT_SESSION_MAX", "1000"))
+        self.ttl = float(os.getenv("CHAT_SESSION_TTL", "86400"))
+        self.recent_messages = int(os.getenv("CHAT_SESSION_RECENT_MESSAGES", "6"))
+        self.message_chars = int(os.getenv("CHAT_SESSION_MESSAGE_CHARS", "1500"))
+        self.summary_chars = int(os.getenv("CHAT_SESSION_SUMMARY_CHARS", "2000"))
+        self.summary_line_chars = int(os.getenv("CHAT_SESSION_SUMMARY_LINE_CHARS", "200"))
+        self.directory = os.getenv("CHAT_SESSION_DIR")
+
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Guards the LRU and every read-modify-save of a session; reentrant
+        # because saving a turn updates the LRU under it
+        self._lock = threading.RLock()
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            logger.info(f"Persisting chat sessions to {self.directory}")
+
+    def get_or_create(self, session_id: Optional[str], patient_id: str) -> Dict[str, Any]:
+        """The session for an id, a fresh one for unknown, expired or foreign ids"""
+        if session_id and not SESSION_ID_PATTERN.match(session_id):
+            raise ValueError("Invalid session id")
+
+        session = self._load(session_id) if session_id else None
+        if session is not None and session['patient_id'] != patient_id:
+            logger.warning(f"Session {session_id} belongs to another patient, starting a new one")
+            session, session_id = None, None
+
+        if session is None:
+            session = {
+                'session_id': session_id or uuid.uuid4().hex,
+                'patient_id': patient_id,
+                'summary': "",
+                'messages': [],
+                'turns': 0,
+                'created_at': time.time(),
+                'updated_at': time.time()
+            }
+        return session
+
+    def history(self, session: Dict[str, Any]) -> Tuple[List[Dict[str, str]], str, int]:
+        """Recent messages, summary and turn count of a session, read consistently"""
+        with self._lock:
+            return list(session['messages']), session['summary'], session['turns']
+
+    def add_turn(self, session: Dict[str, Any], question: str, answer: str, turns: Optional[int] = None):
+        """Append a question/answer pair and fold overflowing messages into the summary
+
+        turns is the turn count the caller read the history at. If another
+        request on the same history already recorded the identical pair, as
+        with a double submit coalesced into one computation, it is not
+        recorded again.
+        """
+        user = {'role': 'user', 'content': question[:self.message_chars]}
+        assistant = {'role': 'assistant', 'content': answer[:self.message_chars]}
+        with self._lock:
+            if turns is not None and session['turns'] > turns and session['messages'][-2:] == [user, assistant]:
+                logger.info(f"Turn already recorded in session {session['session_id']}")
+                return
+
+            session['messages'].append(user)
+            session['messages'].append(assistant)
+            session['turns'] += 1
+
+            if len(session['messages']) >= 2 * self.recent_messages:
+                folded = len(session['messages']) - self.recent_messages
+                folded, session['messages'] = session['messages'][:folded], session['messages'][folded:]
+                session['summary'] = self._summarize(session['summary'], folded)
+
+            session['updated_at'] = time.time()
+            self._save(session)
+
+    def delete(self, session_id: str) -> bool:
+        if not SESSION_ID_PATTERN.match(session_id):
+            return False
+        with self._lock:
+            found = self._sessions.pop(session_id, None) is not None
+        path = self._path(session_id)
+        if path and os.path.exists(path):
+            os.remove(path)
+            found = True
+        return found
+
+    def _summarize(self, summary: str, messages: List[Dict[str, str]]) -> str:
+        """Rolling summary: one condensed line per message, oldest lines dropped first"""
+        lines = summary.splitlines() if summary else []
+        for message in messages:
+            label = "Frage" if message['role'] == 'user' else "Antwort"
+            lines.append(f"- {label}: {self._condense(message['content'])}")
+
+        while lines and sum(len(line) + 1 for line in lines) > self.summary_chars:
+            lines.pop(0)
+        return "\n".join(lines)
+
+    def _condense(self, text: str) -> str:
+        """First sentences of a message without markdown, cut at a word boundary"""
+        text = WHITESPACE.sub(" ", MARKDOWN_NOISE.sub(" ", text)).strip()
+        if len(text) <= self.summary_line_chars:
+            return text
+        cut = text[:self.summary_line_chars]
+        sentence_end = max(cut.rfind(". "), cut.rfind("? "), cut.rfind("! "))
+        if sentence_end > self.summary_line_chars // 2:
+            return cut[:sentence_end + 1]
+        return cut.rsplit(" ", 1)[0] + " …"
+
+    def _load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+
+        path = self._path(session_id)
+        if path and os.path.exists(path):
+            # Another worker may have written a newer version of the session
+            if session is None or os.path.getmtime(path) > session['saved_at']:
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        session = json.load(f)
+                    session['saved_at'] = os.path.getmtime(path)
+                except Exception as e:
+                    logger.error(f"Error loading session {session_id}: {str(e)}")
+
+        if session is None:
+            return None
+        if time.time() - session['updated_at'] > self.ttl:
+            self.delete(session_id)
+            return None
+
+        self._remember(session)
+        return session
+
+    def _save(self, session: Dict[str, Any]):
+        path = self._path(session['session_id'])
+        if path:
+            try:
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({k: v for k, v in session.items() if k != 'saved_at'}, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+                session['saved_at'] = os.path.getmtime(path)
+            except Exception as e:
+                logger.error(f"Error saving session {session['session_id']}: {str(e)}")
+        else:
+            session['saved_at'] = session['updated_at']
+        self._remember(session)
+
+    def _remember(self, session: Dict[str, Any]):
+        with self._lock:
+            self._sessions[session['session_id']] = session
+            self._sessions.move_to_end(session['session_id'])
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def _path(self, session_id: str) -> Optional[str]:
+        if not self.directory:
+            return None
+        return os.path.join(self.directory, f"{session_id}.json")
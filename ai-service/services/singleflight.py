@@ -0,0 +1,61 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from services.metrics import count_llm_calls, COALESCED_REQUESTS, LLM_CALLS_SAVED
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(question: str) -> str:
+    """Question text as used in coalescing keys: case, whitespace and trailing punctuation ignored"""
+    return " ".join(question.lower().split()).rstrip("?!. ")
+
+
+def history_digest(history: Optional[List[Dict[str, str]]], summary: Optional[str] = None) -> str:
+    """Digest of the conversation a question is asked in"""
+    payload = json.dumps([history or [], summary or ""], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """Coalesces concurrent identical requests into one computation
+
+    The first request for a key runs the computation in the threadpool;
+    requests with the same key arriving before it finishes await the same
+    result instead of repeating retrieval and the LLM call. Nothing is
+    cached once the computation is done. Coalescing works within one
+    process, every uvicorn worker has its own set of in-flight keys.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+    async def run(self, endpoint: str, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Result of func(*args, **kwargs), shared with identical requests in flight"""
+        key = (endpoint, key)
+        task = self._in_flight.get(key)
+        if task is None:
+            # A task of its own, so a disconnecting first caller does not cancel the others
+            task = asyncio.ensure_future(run_in_threadpool(_counted, func, args, kwargs))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            result, _ = await asyncio.shield(task)
+            return result
+
+        COALESCED_REQUESTS.labels(endpoint).inc()
+        result, llm_calls = await asyncio.shield(task)
+        if llm_calls:
+            LLM_CALLS_SAVED.labels(endpoint).inc(llm_calls)
+        logger.info(f"Coalesced {endpoint} request with an identical one in flight ({llm_calls} LLM calls saved)")
+        return result
+
+
+def _counted(func: Callable[..., Any], args, kwargs):
+    with count_llm_calls() as calls:
+        result = func(*args, **kwargs)
+    return result, len(calls)
@@ -0,0 +1,200 @@
+import os
+import gzip
+import json
+import time
+import base64
+import logging
+from typing import Iterator, List, Dict, Any, Optional
+
+import numpy as np
+from qdrant_client.models import PointStruct
+
+from services.embedding_service import EmbeddingService
+from services.qdrant_service import QdrantService
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+
+# Text embedded to check that a snapshot was built with the same model weights
+FINGERPRINT_PROBE = "Patient mit akutem Myokardinfarkt, Troponin erhöht."
+
+
+class SnapshotService:
+    """Exports the collection to a compressed file and bulk-loads it on a fresh volume
+
+    The file is gzip-compressed JSON lines: a header with the embedding-model
+    fingerprint and vector layout, one line per point (vectors as base64
+    float32, payload including the chunk text from the chunk store) and a
+    trailer with the chunk manifest and point count. Restoring skips parsing
+    and embedding entirely and only works if the fingerprint of the running
+    model matches, so stale vectors are never loaded.
+    """
+
+    def __init__(self, embedding_service: EmbeddingService, qdrant_service: QdrantService):
+        self.embedding_service = embedding_service
+        self.qdrant_service = qdrant_service
+        self.batch_size = int(os.getenv("SNAPSHOT_BATCH_SIZE", "512"))
+
+    def fingerprint(self) -> Dict[str, Any]:
+        """Identifies the embedding model and the vector layout of the collection"""
+        vectors = self.qdrant_service.client.get_collection(self.qdrant_service.collection_name).config.params.vectors
+        if isinstance(vectors, dict):
+            layout = {name: params.size for name, params in vectors.items()}
+        else:
+            layout = {"": vectors.size}
+
+        return {
+            'embedding_model': self.embedding_service.embedding_model,
+            'dimension': self.embedding_service.get_embedding_dimension(),
+            'vectors': layout,
+            'probe': self.embedding_service.create_embeddings([FINGERPRINT_PROBE])[0]
+        }
+
+    def matches(self, fingerprint: Dict[str, Any]) -> bool:
+        """Whether vectors built under the given fingerprint are valid for the running model"""
+        current = self.fingerprint()
+        if any(fingerprint.get(key) != current[key] for key in ('embedding_model', 'dimension', 'vectors')):
+            return False
+
+        # Tolerate floating point noise between machines, not different weights
+        a = np.asarray(fingerprint['probe'], dtype=np.float32)
+        b = np.asarray(current['probe'], dtype=np.float32)
+        norms = np.linalg.norm(a) * np.linalg.norm(b)
+        if norms == 0:
+            return False
+        return float(a @ b / norms) > 0.999
+
+    def export(self, path: str) -> Dict[str, Any]:
+        """Write all points of the collection to a snapshot file"""
+        client = self.qdrant_service.client
+        collection_name = self.qdrant_service.collection_name
+        manifest: Dict[str, Dict[str, int]] = {}
+        count = 0
+        start = time.time()
+
+        tmp_path = f"{path}.tmp"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            f.write(json.dumps({
+                'format': SNAPSHOT_FORMAT,
+                'created_at': time.time(),
+                'collection': collection_name,
+                'fingerprint': self.fingerprint()
+            }) + "\n")
+
+            offset = None
+            while True:
+                points, offset = client.scroll(
+                    collection_name=collection_name,
+                    limit=self.batch_size,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=True
+                )
+                records = self.qdrant_service.attach_texts([{'id': p.id, 'payload': p.payload} for p in points])
+                for point, record in zip(points, records):
+                    vectors = point.vector if isinstance(point.vector, dict) else {"": point.vector}
+                    f.write(json.dumps({
+                        'id': point.id,
+                        'vector': {name: _encode_vector(v) for name, v in vectors.items()},
+                        'payload': record['payload']
+                    }, ensure_ascii=False) + "\n")
+
+                    sources = manifest.setdefault(point.payload.get('patient_id', ''), {})
+                    source = point.payload.get('source', '')
+                    sources[source] = sources.get(source, 0) + 1
+                    count += 1
+                if offset is None:
+                    break
+
+            f.write(json.dumps({'manifest': manifest, 'points': count}, ensure_ascii=False) + "\n")
+
+        os.replace(tmp_path, path)
+        result = {
+            'path': path,
+            'points': count,
+            'patients': len(manifest),
+            'bytes': os.path.getsize(path),
+            'seconds': round(time.time() - start, 2)
+        }
+        logger.info(f"Exported {count} points of {len(manifest)} patients to {path} ({result['bytes']} bytes)")
+        return result
+
+    def read_header(self, path: str) -> Dict[str, Any]:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return json.loads(f.readline())
+
+    def restore(self, path: str) -> Optional[Dict[str, Any]]:
+        """Bulk-load a snapshot into the collection, None if it does not fit the running model"""
+        header = self.read_header(path)
+        if header.get('format') != SNAPSHOT_FORMAT:
+            logger.warning(f"Snapshot {path} has unsupported format {header.get('format')}, skipping it")
+            return None
+        if not self.matches(header['fingerprint']):
+            logger.warning(
+                f"Snapshot {path} was built with {header['fingerprint'].get('embedding_model')}, "
+                f"which does not match the running embedding model {self.embedding_service.embedding_model}"
+            )
+            return None
+
+        start = time.time()
+        trailer: Dict[str, Any] = {}
+        self.qdrant_service.client.upload_points(
+            collection_name=self.qdrant_service.collection_name,
+            points=self._read_points(path, trailer),
+            batch_size=self.batch_size,
+            wait=True
+        )
+
+        loaded = self.qdrant_service.client.count(collection_name=self.qdrant_service.collection_name).count
+        if 'points' not in trailer:
+            logger.error(f"Snapshot {path} is truncated, loaded {loaded} points")
+        elif loaded < trailer['points']:
+            logger.error(f"Snapshot {path} lists {trailer['points']} points but only {loaded} were loaded")
+
+        result = {
+            'path': path,
+            'points': loaded,
+            'patients': len(trailer.get('manifest', {})),
+            'seconds': round(time.time() - start, 2)
+        }
+        logger.info(f"Restored {loaded} points of {result['patients']} patients from {path} in {result['seconds']}s")
+        return result
+
+    def _read_points(self, path: str, trailer: Dict[str, Any]) -> Iterator[PointStruct]:
+        """Stream the points of a snapshot, filling in the trailer once it is reached"""
+        batch = []
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            f.readline()
+            for line in f:
+                record = json.loads(line)
+                if 'manifest' in record:
+                    trailer.update(record)
+                    break
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    yield from self._to_points(batch)
+                    batch = []
+        yield from self._to_points(batch)
+
+    def _to_points(self, records: List[Dict[str, Any]]) -> List[PointStruct]:
+        """Points of a batch of snapshot records, with their texts moved to the chunk store"""
+        payloads = self.qdrant_service.split_texts([r['id'] for r in records], [r['payload'] for r in records])
+        points = []
+        for record, payload in zip(records, payloads):
+            vectors = {name: _decode_vector(v) for name, v in record['vector'].items()}
+            points.append(PointStruct(
+                id=record['id'],
+                vector=vectors[""] if "" in vectors else vectors,
+                payload=payload
+            ))
+        return points
+
+
+def _encode_vector(vector) -> str:
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode_vector(data: str):
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32).tolist()
@@ -0,0 +1,92 @@
+"""OpenTelemetry tracing of requests and processing stages.
+
+Tracing is off unless OTEL_TRACES_EXPORTER is set to `otlp` (OTLP/HTTP to
+OTEL_EXPORTER_OTLP_ENDPOINT), `file` (one JSON span per line in
+OTEL_TRACES_FILE) or `console`. Every observe_stage block becomes a span, so
+requests are broken down into the same stages as the Prometheus metrics.
+The W3C traceparent header of incoming requests is honoured, linking the
+spans to the trace started in the backend. Sampling and the service name
+follow the standard OTEL_TRACES_SAMPLER / OTEL_SERVICE_NAME variables.
+"""
+import os
+import logging
+from contextlib import contextmanager
+from typing import Any, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+_tracer = None
+
+
+def setup_tracing(service_name: str = "ai-service"):
+    """Install the tracer provider and span exporter configured in the environment"""
+    global _tracer
+    exporter_name = os.getenv("OTEL_TRACES_EXPORTER", "none").lower()
+    if exporter_name == "none" or _tracer is not None:
+        return
+
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource, SERVICE_NAME
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+        if exporter_name == "otlp":
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            exporter = OTLPSpanExporter()
+        elif exporter_name == "file":
+            path = os.getenv("OTEL_TRACES_FILE", "/app/data/traces.jsonl")
+            exporter = ConsoleSpanExporter(
+                out=open(path, "a", encoding="utf-8"),
+                formatter=lambda span: span.to_json(indent=None) + "\n"
+            )
+        elif exporter_name == "console":
+            exporter = ConsoleSpanExporter()
+        else:
+            raise ValueError(f"Unsupported OTEL_TRACES_EXPORTER: {exporter_name}")
+
+        # OTEL_SERVICE_NAME, if set, takes precedence over the default name
+        provider = TracerProvider(resource=Resource.create({SERVICE_NAME: service_name}))
+        provider.add_span_processor(BatchSpanProcessor(exporter))
+        trace.set_tracer_provider(provider)
+        _tracer = trace.get_tracer("ai-service")
+        logger.info(f"Tracing enabled with {exporter_name} exporter")
+    except Exception as e:
+        logger.error(f"Tracing disabled: {str(e)}")
+
+
+@contextmanager
+def span(name: str, attributes: Optional[Mapping[str, Any]] = None):
+    """Span around a block, a no-op while tracing is disabled"""
+    if _tracer is None:
+        yield
+        return
+    with _tracer.start_as_current_span(name, attributes=attributes):
+        yield
+
+
+@contextmanager
+def server_span(name: str, headers: Mapping[str, str], attributes: Optional[Mapping[str, Any]] = None):
+    """Root span of an incoming request, continuing the caller's trace"""
+    if _tracer is None:
+        yield None
+        return
+    from opentelemetry import propagate, trace
+    with _tracer.start_as_current_span(
+        name,
+        context=propagate.extract(headers),
+        kind=trace.SpanKind.SERVER,
+        attributes=attributes
+    ) as current:
+        yield current
+
+
+def set_attributes(attributes: Mapping[str, Any]):
+    """Add attributes to the current span, e.g. chunk or token counts"""
+    if _tracer is None:
+        return
+    from opentelemetry import trace
+    current = trace.get_current_span()
+    for key, value in attributes.items():
+        if value is not None:
+            current.set_attribute(key, value)
@@ -0,0 +1,106 @@
+import os
+import logging
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Models trained with Matryoshka representation learning: their leading
+# dimensions form a usable embedding on their own
+MATRYOSHKA_MODELS = {
+    "text-embedding-3-small",
+    "text-embedding-3-large",
+    "nomic-embed-text",
+}
+
+
+class VectorReducer:
+    """Projects full embeddings to the small first-stage search vector
+
+    Matryoshka models are truncated to their leading dimensions, other
+    models use a PCA projection fitted on the stored corpus (see
+    `python manage.py fit-pca`). SMALL_VECTOR_DIM=0 disables the small vector.
+    """
+
+    def __init__(self, embedding_model: Optional[str], full_dimension: int):
+        self.embedding_model = embedding_model or "unknown"
+        self.full_dimension = full_dimension
+        self.dimension = int(os.getenv("SMALL_VECTOR_DIM", "0"))
+        self.pca_path = os.getenv("PCA_MODEL_PATH", "/app/data/pca.npz")
+
+        method = os.getenv("SMALL_VECTOR_METHOD", "auto")
+        if method == "auto":
+            method = "matryoshka" if self.embedding_model.split(":")[0] in MATRYOSHKA_MODELS else "pca"
+        self.method = method
+
+        self._mean: Optional[np.ndarray] = None
+        self._components: Optional[np.ndarray] = None
+
+        if not self.dimension:
+            return
+        if self.dimension >= full_dimension:
+            logger.warning(f"SMALL_VECTOR_DIM={self.dimension} is not below the full dimension {full_dimension}, disabled")
+            self.dimension = 0
+            return
+        if self.method == "pca":
+            self._load_pca()
+        logger.info(f"Small search vectors: {self.dimension} dims via {self.method} (full: {full_dimension})")
+
+    @property
+    def ready(self) -> bool:
+        """Whether small vectors are meaningful and can be used for search"""
+        if not self.dimension:
+            return False
+        return self.method == "matryoshka" or self._components is not None
+
+    def reduce(self, vectors: List[List[float]]) -> List[List[float]]:
+        """Project full vectors to unit-length small vectors
+
+        Before a PCA projection is fitted this truncates, so every point still
+        gets a small vector that `fit-pca` later overwrites; search does not
+        use small vectors until the reducer is ready.
+        """
+        full = np.asarray(vectors, dtype=np.float32)
+        if self.method == "matryoshka" or self._components is None:
+            small = full[:, :self.dimension]
+        else:
+            small = (full - self._mean) @ self._components.T
+
+        norms = np.linalg.norm(small, axis=1, keepdims=True)
+        return (small / np.where(norms == 0, 1.0, norms)).tolist()
+
+    def fit_pca(self, vectors: List[List[float]]):
+        """Learn the PCA projection from a sample of full vectors and save it"""
+        sample = np.asarray(vectors, dtype=np.float32)
+        if len(sample) < self.dimension:
+            raise ValueError(f"Need at least {self.dimension} vectors to fit PCA, got {len(sample)}")
+
+        mean = sample.mean(axis=0)
+        # Rows of vt are the principal axes ordered by explained variance
+        _, singular_values, vt = np.linalg.svd(sample - mean, full_matrices=False)
+        self._mean = mean
+        self._components = vt[:self.dimension]
+
+        explained = (singular_values[:self.dimension] ** 2).sum() / (singular_values ** 2).sum()
+        os.makedirs(os.path.dirname(self.pca_path) or ".", exist_ok=True)
+        np.savez(
+            self.pca_path,
+            mean=self._mean,
+            components=self._components,
+            embedding_model=self.embedding_model
+        )
+        logger.info(f"Fitted PCA to {self.dimension} dims on {len(sample)} vectors ({explained:.1%} variance kept)")
+        return float(explained)
+
+    def _load_pca(self):
+        if not os.path.exists(self.pca_path):
+            logger.warning(f"No PCA model at {self.pca_path}, small vectors stay off until `manage.py fit-pca` runs")
+            return
+
+        data = np.load(self.pca_path)
+        if str(data['embedding_model']) != self.embedding_model or data['components'].shape != (self.dimension, self.full_dimension):
+            logger.warning(f"PCA model at {self.pca_path} does not match {self.embedding_model}/{self.dimension} dims, ignoring it")
+            return
+        self._mean = data['mean']
+        self._components = data['components']
@@ -0,0 +1,63 @@
+"""Deleting and compacting texts in the chunk store"""
+import os
+import uuid
+
+import pytest
+
+from services.chunk_store import ChunkStore
+
+
+def ids(count: int):
+    return [str(uuid.uuid4()) for _ in range(count)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChunkStore(str(tmp_path))
+
+
+def test_deleted_texts_are_gone_after_reopening(store, tmp_path):
+    point_ids = ids(3)
+    store.put_many(point_ids, ["Befund A", "Befund B", "Befund C"])
+
+    assert store.delete_many(point_ids[:2] + ids(1)) == 2
+
+    assert store.get_many(point_ids) == {point_ids[2]: "Befund C"}
+    assert ChunkStore(str(tmp_path)).get_many(point_ids) == {point_ids[2]: "Befund C"}
+
+
+def test_compaction_keeps_only_live_texts(store, tmp_path):
+    point_ids = ids(4)
+    store.put_many(point_ids, [f"Arztbrief {i} " * 50 for i in range(4)])
+    # Re-uploading supersedes the old texts
+    store.put_many(point_ids[:2], ["neu 0", "neu 1"])
+    store.delete_many(point_ids[3:])
+
+    result = store.compact()
+
+    assert result == {
+        'chunks': 3,
+        'dropped': 0,
+        'bytes_before': result['bytes_before'],
+        'bytes_after': result['bytes_after']
+    }
+    assert result['bytes_after'] < result['bytes_before']
+    expected = {point_ids[0]: "neu 0", point_ids[1]: "neu 1", point_ids[2]: "Arztbrief 2 " * 50}
+    assert store.get_many(point_ids) == expected
+    assert ChunkStore(str(tmp_path)).get_many(point_ids) == expected
+    assert len([name for name in os.listdir(tmp_path) if name.startswith("segment-")]) == 1
+
+
+def test_compaction_prunes_ids_without_point(store):
+    point_ids = ids(3)
+    store.put_many(point_ids, ["a", "b", "c"])
+
+    result = store.compact(keep={point_ids[1]})
+
+    assert result['dropped'] == 2
+    assert store.get_many(point_ids) == {point_ids[1]: "b"}
+
+    # Appends continue in the compacted segments
+    more = ids(1)
+    store.put_many(more, ["d"])
+    assert store.get_many(more) == {more[0]: "d"}
@@ -0,0 +1,45 @@
+"""Detection of FHIR Bundles and failures of the streaming ingest path"""
+import json
+
+import pytest
+
+from services.document_service import DocumentService
+from services.fhir import is_fhir_bundle
+
+CONDITION = {'resource': {'resourceType': 'Condition', 'code': {'text': 'Diabetes mellitus Typ 2'}}}
+
+
+def write_json(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_text(json.dumps(data), encoding='utf-8')
+    return str(path)
+
+
+def test_bundle_is_recognised_after_a_long_meta(tmp_path):
+    bundle = {'meta': {'tag': [{'code': 'x' * 5000}]}, 'id': 'b1', 'resourceType': 'Bundle', 'entry': [CONDITION]}
+    path = write_json(tmp_path, 'bundle.json', bundle)
+
+    assert is_fhir_bundle(path)
+    chunks = list(DocumentService().process_file(path, 'p1', 'bundle.json'))
+    assert [chunk['text'].splitlines()[0] for chunk in chunks] == ["DIAGNOSEN:"]
+
+
+def test_nested_resource_type_is_not_a_bundle(tmp_path):
+    path = write_json(tmp_path, 'other.json', {'entry': [{'resource': {'resourceType': 'Bundle'}}]})
+
+    assert not is_fhir_bundle(path)
+
+
+def test_json_without_patient_data_raises(tmp_path):
+    path = write_json(tmp_path, 'other.json', {'foo': 1})
+
+    with pytest.raises(ValueError):
+        list(DocumentService().process_file(path, 'p1', 'other.json'))
+
+
+def test_malformed_text_file_raises(tmp_path):
+    path = tmp_path / 'notes.txt'
+    path.write_bytes(b'Befund ' * 100 + b'\xff\xfe')
+
+    with pytest.raises(UnicodeDecodeError):
+        list(DocumentService().process_file(str(path), 'p1', 'notes.txt'))
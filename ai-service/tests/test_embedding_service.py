@@ -0,0 +1,202 @@
+"""OpenAI embedding batching, rate-limit backoff and partial failures against a local fake server"""
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from services.embedding_service import EmbeddingService, collect_ingest_stats, _parse_reset_duration
+
+DIMENSION = 8
+
+
+class FakeOpenAI:
+    """Minimal /v1/embeddings endpoint that records requests and replays scripted errors"""
+
+    def __init__(self):
+        self.requests = []
+        # (status, headers) of the next responses, served before any successful one
+        self.script = []
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with fake.lock:
+                    fake.requests.append({'input': body['input'], 'at': time.monotonic()})
+                    status, headers = fake.script.pop(0) if fake.script else (200, {})
+
+                if status == 200:
+                    payload = {
+                        'object': 'list',
+                        'model': body['model'],
+                        'data': [
+                            {'object': 'embedding', 'index': i, 'embedding': [float(len(text))] * DIMENSION}
+                            for i, text in enumerate(body['input'])
+                        ],
+                        'usage': {'prompt_tokens': len(body['input']), 'total_tokens': len(body['input'])}
+                    }
+                else:
+                    payload = {'error': {'message': f'status {status}', 'type': 'fake', 'code': None}}
+
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_openai():
+    server = FakeOpenAI()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def service(fake_openai, monkeypatch):
+    monkeypatch.setenv("MODEL_TYPE", "openai")
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_BASE_URL", fake_openai.base_url)
+    monkeypatch.setenv("EMBEDDING_MODEL", "text-embedding-3-small")
+    monkeypatch.setenv("EMBEDDING_MAX_CONCURRENCY", "1")
+    service = EmbeddingService(use_sidecar=False)
+    service._dimension = DIMENSION
+    # Estimated token counts (~4 characters per token) unless a test loads tiktoken
+    service._encoding = False
+    return service
+
+
+@pytest.fixture
+def encoding():
+    tiktoken = pytest.importorskip("tiktoken")
+    try:
+        return tiktoken.encoding_for_model("text-embedding-3-small")
+    except Exception as e:
+        pytest.skip(f"tiktoken encoding unavailable: {e}")
+
+
+def test_batches_are_bounded_by_tiktoken_tokens(service, fake_openai, encoding):
+    service._encoding = encoding
+    service.batch_max_tokens = 60
+    texts = [("Hämoglobin im Verlauf stabil " * (i % 5 + 1)).strip() for i in range(20)]
+
+    embeddings = service.create_embeddings(texts)
+
+    assert len(fake_openai.requests) > 1
+    for request in fake_openai.requests:
+        assert sum(len(encoding.encode(text)) for text in request['input']) <= service.batch_max_tokens
+    assert [text for request in fake_openai.requests for text in request['input']] == texts
+    assert embeddings == [[float(len(text))] * DIMENSION for text in texts]
+
+
+def test_batches_are_bounded_by_input_count(service, fake_openai):
+    service.batch_max_inputs = 3
+
+    service.create_embeddings([f"Befund {i}" for i in range(7)])
+
+    assert [len(request['input']) for request in fake_openai.requests] == [3, 3, 1]
+
+
+@pytest.mark.parametrize("headers, min_delay", [
+    ({'retry-after-ms': '300'}, 0.3),
+    ({'retry-after': '1'}, 1.0),
+    ({'x-ratelimit-reset-tokens': '400ms'}, 0.4),
+])
+def test_rate_limited_request_waits_for_reset(service, fake_openai, headers, min_delay):
+    fake_openai.script = [(429, headers)]
+
+    embeddings = service.create_embeddings(["Troponin negativ"])
+
+    assert len(fake_openai.requests) == 2
+    assert fake_openai.requests[1]['at'] - fake_openai.requests[0]['at'] >= min_delay
+    assert embeddings == [[16.0] * DIMENSION]
+
+
+def test_rate_limit_gives_up_after_max_retries(service, fake_openai):
+    service.max_retries = 2
+    fake_openai.script = [(429, {'retry-after-ms': '10'})] * 3
+
+    embeddings = service.create_embeddings(["Troponin negativ"])
+
+    assert len(fake_openai.requests) == 3
+    assert embeddings == [[0.0] * DIMENSION]
+
+
+def test_failed_sub_batch_only_affects_its_texts(service, fake_openai):
+    service.batch_max_inputs = 2
+    # The second sub-batch is rejected, which is not retried
+    fake_openai.script = [(200, {}), (400, {})]
+    texts = ["eins", "zwei", "drei", "vier", "fünf"]
+
+    with collect_ingest_stats() as stats:
+        embeddings = service.create_embeddings(texts)
+
+    assert embeddings[0] == [4.0] * DIMENSION
+    assert embeddings[2] == embeddings[3] == [0.0] * DIMENSION
+    assert embeddings[4] == [4.0] * DIMENSION
+    assert stats['requests'] == 3
+    assert stats['failed_requests'] == 1
+
+
+def test_ingest_stats_add_up_across_calls(service, fake_openai):
+    with collect_ingest_stats() as stats:
+        service.create_embeddings(["a" * 40])
+        service.create_embeddings(["b" * 40, "c" * 40])
+
+    assert stats['texts'] == 3
+    assert stats['requests'] == 2
+    assert stats['tokens'] == 33
+    assert stats['cost_usd'] == pytest.approx(33 * 0.02 / 1_000_000)
+
+
+def test_concurrent_ingests_keep_separate_stats(service, fake_openai):
+    results = {}
+
+    def ingest(name: str, count: int):
+        with collect_ingest_stats() as stats:
+            for _ in range(count):
+                service.create_embeddings([name])
+        results[name] = stats['texts']
+
+    threads = [threading.Thread(target=ingest, args=(name, count)) for name, count in (("x", 3), ("y", 5))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {'x': 3, 'y': 5}
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("1s", 1.0),
+    ("250ms", 0.25),
+    ("6m0s", 360.0),
+    ("1h2m3.5s", 3723.5),
+    ("2", 2.0),
+    ("", None),
+    (None, None),
+    ("soon", None),
+])
+def test_parse_reset_duration(value, seconds):
+    assert _parse_reset_duration(value) == seconds
@@ -0,0 +1,136 @@
+"""Journal replay, retries, compaction and expiry of ingestion jobs"""
+import json
+import time
+import threading
+
+import pytest
+
+from services.document_service import DocumentService
+from services.job_service import JobService
+
+
+class RecordingRAG:
+    """Keeps stored chunk texts by point id and fails the first `failures` batches"""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.stored = {}
+        self.lock = threading.Lock()
+
+    def store_documents(self, patient_id, chunks, ids=None):
+        with self.lock:
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("qdrant unavailable")
+            for point_id, chunk in zip(ids, chunks):
+                self.stored[point_id] = chunk['text']
+        return {'stored': len(chunks), 'duplicates': 0}
+
+
+@pytest.fixture
+def jobs_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("JOBS_DIR", str(tmp_path / "jobs"))
+    monkeypatch.setenv("INGEST_WORKERS", "1")
+    monkeypatch.setenv("INGEST_RETRY_DELAY", "0.05")
+    return tmp_path / "jobs"
+
+
+def submit(service: JobService, names=("a.txt", "b.txt")) -> str:
+    job_id, files_dir = service.create_job_dir()
+    files = []
+    for name in names:
+        path = f"{files_dir}/{name}"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"Befund aus {name}. " * 20)
+        files.append({'name': name, 'path': path, 'bytes': 400})
+    service.submit(job_id, "p1", files)
+    return job_id
+
+
+def wait_finished(service: JobService, job_id: str):
+    deadline = time.monotonic() + 10
+    while service.get_job(job_id)['completed_at'] is None:
+        assert time.monotonic() < deadline, service.get_job(job_id)
+        time.sleep(0.02)
+    return service.get_job(job_id)
+
+
+def journal_events(service: JobService):
+    with open(service.journal_path, encoding="utf-8") as f:
+        return [json.loads(line)['event'] for line in f]
+
+
+def test_replay_after_crash_requeues_unfinished_files(jobs_dir):
+    # The first process journals the job and starts a file, then dies before any worker finishes it
+    crashed = JobService(DocumentService(), RecordingRAG())
+    job_id = submit(crashed)
+    crashed._append({'event': 'file_started', 'job_id': job_id, 'file': 0})
+    with open(crashed.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"event": "file_prog')
+
+    rag = RecordingRAG()
+    restarted = JobService(DocumentService(), rag)
+    restarted.start()
+    job = wait_finished(restarted, job_id)
+
+    assert job['status'] == 'completed'
+    assert [f['status'] for f in job['files']] == ['completed', 'completed']
+    assert [f['attempts'] for f in job['files']] == [2, 1]
+    assert job['chunks_created'] == len(rag.stored)
+
+
+def test_failed_store_is_retried(jobs_dir):
+    rag = RecordingRAG(failures=1)
+    service = JobService(DocumentService(), rag)
+    service.start()
+
+    job = wait_finished(service, submit(service, names=("a.txt",)))
+
+    assert job['status'] == 'completed'
+    assert job['files'][0]['attempts'] == 2
+    assert job['files'][0]['error'] is None
+    assert 'file_retrying' in journal_events(service)
+
+
+def test_file_fails_after_max_attempts(jobs_dir, monkeypatch):
+    monkeypatch.setenv("INGEST_MAX_ATTEMPTS", "2")
+    service = JobService(DocumentService(), RecordingRAG(failures=5))
+    service.start()
+
+    job = wait_finished(service, submit(service, names=("a.txt",)))
+
+    assert job['status'] == 'failed'
+    assert job['files'][0]['attempts'] == 2
+    assert job['files'][0]['error'] == "qdrant unavailable"
+
+
+def test_compaction_keeps_job_state(jobs_dir):
+    service = JobService(DocumentService(), RecordingRAG())
+    service.start()
+    job_id = submit(service)
+    before = wait_finished(service, job_id)
+    assert len(journal_events(service)) > 1
+
+    restarted = JobService(DocumentService(), RecordingRAG())
+    restarted.start()
+
+    assert journal_events(restarted) == ['snapshot']
+    assert restarted.get_job(job_id) == before
+    # A snapshot replays like the events it replaced
+    again = JobService(DocumentService(), RecordingRAG())
+    again.start()
+    assert again.get_job(job_id) == before
+
+
+def test_finished_jobs_expire(jobs_dir, monkeypatch):
+    service = JobService(DocumentService(), RecordingRAG())
+    service.start()
+    job_id = submit(service, names=("a.txt",))
+    wait_finished(service, job_id)
+
+    monkeypatch.setenv("JOB_RETENTION", "0")
+    restarted = JobService(DocumentService(), RecordingRAG())
+    restarted.start()
+
+    assert restarted.get_job(job_id) is None
+    assert journal_events(restarted) == []
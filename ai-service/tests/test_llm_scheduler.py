@@ -0,0 +1,112 @@
+"""Priority admission, queue limits and deadlines of the LLM scheduler"""
+import time
+import threading
+from typing import Optional
+
+import pytest
+
+from services.llm_scheduler import LLMScheduler, LLMOverloadedError, use_priority
+
+BACKEND = "test"
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setenv(f"LLM_MAX_CONCURRENCY_{BACKEND.upper()}", "1")
+    monkeypatch.setenv("LLM_QUEUE_LIMIT_BATCH", "1")
+    monkeypatch.setenv("LLM_QUEUE_TIMEOUT_BATCH", "0.3")
+    return LLMScheduler()
+
+
+@pytest.fixture
+def busy(scheduler):
+    """Holds the only slot of the backend until the test ends"""
+    release = threading.Event()
+
+    def hold():
+        with scheduler.slot(BACKEND, "batch"):
+            release.wait(5)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    queue = scheduler._queue(BACKEND)
+    deadline = time.monotonic() + 5
+    while queue.active < queue.limit:
+        assert time.monotonic() < deadline, "slot was not taken"
+        time.sleep(0.01)
+    yield release
+    release.set()
+    holder.join(5)
+
+
+def wait_queued(scheduler: LLMScheduler, count: int):
+    queue = scheduler._queue(BACKEND)
+    deadline = time.monotonic() + 5
+    while len(queue.waiting) < count:
+        assert time.monotonic() < deadline, "caller was not queued"
+        time.sleep(0.01)
+
+
+def call(scheduler: LLMScheduler, priority: str, order: list, label: Optional[str] = None):
+    with scheduler.slot(BACKEND, priority):
+        order.append(label or priority)
+
+
+def call_prefetch(scheduler: LLMScheduler, order: list):
+    # A background context, e.g. the report prefetch, overrides the caller's class
+    with use_priority("background"):
+        call(scheduler, "interactive", order, label="prefetch")
+
+
+def test_interactive_is_admitted_before_batch(scheduler, busy):
+    order = []
+    threads = [
+        threading.Thread(target=call_prefetch, args=(scheduler, order)),
+        threading.Thread(target=call, args=(scheduler, "batch", order)),
+        threading.Thread(target=call, args=(scheduler, "interactive", order))
+    ]
+    for count, thread in enumerate(threads, 1):
+        thread.start()
+        wait_queued(scheduler, count)
+
+    busy.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert order == ["interactive", "batch", "prefetch"]
+
+
+def test_full_queue_sheds_with_retry_after(scheduler, busy):
+    waiters = [threading.Thread(target=call, args=(scheduler, "batch", []))]
+    waiters[0].start()
+    wait_queued(scheduler, 1)
+
+    with pytest.raises(LLMOverloadedError) as shed:
+        with scheduler.slot(BACKEND, "batch"):
+            pass
+    assert shed.value.retry_after >= 1
+
+    # Interactive calls have a queue limit of their own and are still queued
+    waiters.append(threading.Thread(target=call, args=(scheduler, "interactive", [])))
+    waiters[1].start()
+    wait_queued(scheduler, 2)
+
+    busy.set()
+    for thread in waiters:
+        thread.join(5)
+
+
+def test_deadline_sheds_and_leaves_the_queue(scheduler, busy):
+    start = time.monotonic()
+    with pytest.raises(LLMOverloadedError) as shed:
+        with scheduler.slot(BACKEND, "batch"):
+            pass
+
+    assert time.monotonic() - start >= 0.3
+    assert shed.value.retry_after >= 1
+    assert scheduler._queue(BACKEND).waiting == []
+
+    # The slot is free again for the next caller once the holder is done
+    busy.set()
+    with scheduler.slot(BACKEND, "batch"):
+        assert scheduler._queue(BACKEND).active == 1
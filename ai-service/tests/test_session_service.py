@@ -0,0 +1,53 @@
+"""Recording chat turns in server-side sessions"""
+import threading
+
+import pytest
+
+from services.session_service import SessionService
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    monkeypatch.delenv("CHAT_SESSION_DIR", raising=False)
+    monkeypatch.setenv("CHAT_SESSION_RECENT_MESSAGES", "4")
+    return SessionService()
+
+
+def test_coalesced_duplicate_turn_is_recorded_once(sessions):
+    session = sessions.get_or_create(None, "p1")
+    _, _, turns = sessions.history(session)
+
+    # Both callers of a double submit read the same history and get the same answer
+    sessions.add_turn(session, "Welche Medikamente?", "Metformin", turns=turns)
+    sessions.add_turn(session, "Welche Medikamente?", "Metformin", turns=turns)
+
+    assert session['turns'] == 1
+    assert len(session['messages']) == 2
+
+
+def test_repeated_question_after_the_answer_is_recorded(sessions):
+    session = sessions.get_or_create(None, "p1")
+    for _ in range(2):
+        _, _, turns = sessions.history(session)
+        sessions.add_turn(session, "Welche Medikamente?", "Metformin", turns=turns)
+
+    assert session['turns'] == 2
+
+
+def test_concurrent_turns_fold_consistently(sessions):
+    session = sessions.get_or_create(None, "p1")
+
+    def ask(i: int):
+        for j in range(25):
+            sessions.add_turn(session, f"Frage {i}-{j}", f"Antwort {i}-{j}")
+
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert session['turns'] == 100
+    assert len(session['messages']) < 2 * sessions.recent_messages
+    # Messages stay in question/answer pairs
+    assert [m['role'] for m in session['messages']] == ['user', 'assistant'] * (len(session['messages']) // 2)
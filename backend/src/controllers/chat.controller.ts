@@ -1,9 +1,9 @@
 import { Request, Response } from 'express';
-import { aiService, ChatRequest } from '../services/ai.service';
+import { aiService, AIServiceBusyError, ChatRequest } from '../services/ai.service';
 
 export const chat = async (req: Request, res: Response) => {
   try {
-    const { patient_id, question, conversation_history } = req.body;
+    const { patient_id, question, conversation_history, session_id } = req.body;
 
     if (!patient_id || !question) {
       return res.status(400).json({
@@ -16,12 +16,22 @@ export const chat = async (req: Request, res: Response) => {
       patient_id,
       question,
       conversation_history: conversation_history || [],
+      session_id,
     };
 
     const response = await aiService.chat(chatRequest);
     res.json(response);
   } catch (error) {
     console.error('Error in chat:', error);
+    if (error instanceof AIServiceBusyError) {
+      if (error.retryAfter) {
+        res.set('Retry-After', error.retryAfter);
+      }
+      return res.status(429).json({
+        error: 'AI service is busy',
+        message: error.message,
+      });
+    }
     res.status(500).json({
       error: 'Failed to process chat request',
       message: error instanceof Error ? error.message : 'Unknown error',
@@ -13,3 +13,16 @@ export const getPatients = async (req: Request, res: Response) => {
     });
   }
 };
+
+export const prefetchPatient = async (req: Request, res: Response) => {
+  try {
+    const result = await aiService.prefetchPatient(req.params.patientId);
+    res.json(result);
+  } catch (error) {
+    console.error('Error in prefetchPatient:', error);
+    res.status(500).json({
+      error: 'Failed to prefetch patient',
+      message: error instanceof Error ? error.message : 'Unknown error',
+    });
+  }
+};
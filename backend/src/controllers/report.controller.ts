@@ -1,5 +1,5 @@
 import { Request, Response } from 'express';
-import { aiService, ReportRequest } from '../services/ai.service';
+import { aiService, AIServiceBusyError, ReportRequest } from '../services/ai.service';
 
 export const generateReport = async (req: Request, res: Response) => {
   try {
@@ -20,6 +20,15 @@ export const generateReport = async (req: Request, res: Response) => {
     res.json(response);
   } catch (error) {
     console.error('Error in generateReport:', error);
+    if (error instanceof AIServiceBusyError) {
+      if (error.retryAfter) {
+        res.set('Retry-After', error.retryAfter);
+      }
+      return res.status(429).json({
+        error: 'AI service is busy',
+        message: error.message,
+      });
+    }
     res.status(500).json({
       error: 'Failed to generate report',
       message: error instanceof Error ? error.message : 'Unknown error',
@@ -21,7 +21,7 @@ export const uploadDocuments = async (req: Request, res: Response) => {
     }
 
     const response = await aiService.uploadDocuments(patient_id, files);
-    res.json(response);
+    res.status(202).json(response);
   } catch (error) {
     console.error('Error in uploadDocuments:', error);
     res.status(500).json({
@@ -30,3 +30,17 @@ export const uploadDocuments = async (req: Request, res: Response) => {
     });
   }
 };
+
+export const getUploadJob = async (req: Request, res: Response) => {
+  try {
+    const { jobId } = req.params;
+    const response = await aiService.getUploadJob(jobId);
+    res.json(response);
+  } catch (error) {
+    console.error('Error in getUploadJob:', error);
+    res.status(500).json({
+      error: 'Failed to fetch upload job',
+      message: error instanceof Error ? error.message : 'Unknown error',
+    });
+  }
+};
@@ -1,3 +1,5 @@
+// Must be the first import, instrumentation patches modules as they are loaded
+import './tracing';
 import express, { Application } from 'express';
 import cors from 'cors';
 import morgan from 'morgan';
@@ -1,9 +1,12 @@
 import { Router } from 'express';
-import { getPatients } from '../controllers/patient.controller';
+import { getPatients, prefetchPatient } from '../controllers/patient.controller';
 
 const router = Router();
 
 // GET /api/patients - Get all patients
 router.get('/', getPatients);
 
+// POST /api/patients/:patientId/prefetch - Warm caches for an opened patient
+router.post('/:patientId/prefetch', prefetchPatient);
+
 export default router;
@@ -1,6 +1,6 @@
 import { Router } from 'express';
 import multer from 'multer';
-import { uploadDocuments } from '../controllers/upload.controller';
+import { uploadDocuments, getUploadJob } from '../controllers/upload.controller';
 
 const router = Router();
 
@@ -23,4 +23,7 @@ const upload = multer({
 // POST /api/upload - Upload patient documents
 router.post('/', upload.array('files', 10), uploadDocuments);
 
+// GET /api/upload/jobs/:jobId - Get ingestion job progress
+router.get('/jobs/:jobId', getUploadJob);
+
 export default router;
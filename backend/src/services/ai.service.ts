@@ -1,9 +1,47 @@
-import axios, { AxiosInstance } from 'axios';
+import http from 'http';
+import https from 'https';
+import axios, { AxiosInstance, AxiosResponseHeaders, RawAxiosResponseHeaders } from 'axios';
+import { decode } from '@msgpack/msgpack';
+
+const MSGPACK_MEDIA_TYPE = 'application/msgpack';
+
+// Decode a raw response body according to the content type the AI service chose
+function decodeBody(data: Buffer, headers: AxiosResponseHeaders | RawAxiosResponseHeaders): unknown {
+  if (!data || data.length === 0) {
+    return data;
+  }
+  const contentType = String(headers['content-type'] || '');
+  if (contentType.includes(MSGPACK_MEDIA_TYPE)) {
+    return decode(data);
+  }
+  const text = data.toString('utf8');
+  if (contentType.includes('application/json')) {
+    return JSON.parse(text);
+  }
+  return text;
+}
+
+// Raised when the AI service sheds a request because its LLM backend is saturated
+export class AIServiceBusyError extends Error {
+  constructor(message: string, public readonly retryAfter?: string) {
+    super(message);
+    this.name = 'AIServiceBusyError';
+  }
+}
+
+function busyError(error: unknown): AIServiceBusyError | null {
+  if (axios.isAxiosError(error) && error.response?.status === 429) {
+    const retryAfter = error.response.headers['retry-after'];
+    return new AIServiceBusyError('AI service is busy, please retry later', retryAfter ? String(retryAfter) : undefined);
+  }
+  return null;
+}
 
 export interface ChatRequest {
   patient_id: string;
   question: string;
   conversation_history?: Array<{ role: string; content: string }>;
+  session_id?: string;
 }
 
 export interface ChatResponse {
@@ -15,6 +53,7 @@ export interface ChatResponse {
     text: string;
   }>;
   timestamp: string;
+  session_id?: string;
 }
 
 export interface ReportRequest {
@@ -26,6 +65,45 @@ export interface ReportResponse {
   timestamp: string;
 }
 
+export interface UploadJobResponse {
+  job_id: string;
+  patient_id: string;
+  status: string;
+  files_queued: number;
+  bytes_received: number;
+  message: string;
+}
+
+export interface JobStatus {
+  job_id: string;
+  patient_id: string;
+  status: 'queued' | 'running' | 'completed' | 'partial' | 'failed';
+  created_at: string;
+  completed_at?: string;
+  files_total: number;
+  files_completed: number;
+  chunks_created: number;
+  chunks_deduplicated: number;
+  dedup_ratio: number;
+  embedding_tokens: number;
+  embedding_tokens_per_sec: number;
+  embedding_cost_usd?: number | null;
+  bytes_total: number;
+  process_peak_rss_mb: number;
+  files: Array<{
+    name: string;
+    status: string;
+    bytes: number;
+    chunks: number;
+    duplicates: number;
+    seconds: number;
+    chunks_per_sec: number;
+    bytes_per_sec: number;
+    attempts: number;
+    error?: string;
+  }>;
+}
+
 export interface PatientInfo {
   patient_id: string;
   name: string;
@@ -36,21 +114,39 @@ export interface PatientInfo {
   document_count: number;
 }
 
+export interface PrefetchResponse {
+  patient_id: string;
+  chunks: number;
+  report: string;
+}
+
 class AIService {
   private client: AxiosInstance;
 
   constructor() {
     const baseURL = process.env.AI_SERVICE_URL || 'http://ai-service:8000';
+    const format = process.env.AI_SERVICE_FORMAT || 'msgpack';
+
+    // Keep connections to the AI service open instead of a new TCP connection per request
+    const agentOptions = {
+      keepAlive: true,
+      maxSockets: parseInt(process.env.AI_SERVICE_MAX_SOCKETS || '64', 10),
+    };
 
     this.client = axios.create({
       baseURL,
       timeout: 60000, // 60 seconds
+      httpAgent: new http.Agent(agentOptions),
+      httpsAgent: new https.Agent(agentOptions),
       headers: {
         'Content-Type': 'application/json',
+        Accept: format === 'msgpack' ? `${MSGPACK_MEDIA_TYPE}, application/json` : 'application/json',
       },
+      responseType: 'arraybuffer',
+      transformResponse: [(data, headers) => decodeBody(data, headers)],
     });
 
-    console.log(`🤖 AI Service client initialized: ${baseURL}`);
+    console.log(`🤖 AI Service client initialized: ${baseURL} (${format})`);
   }
 
   async getPatients(): Promise<PatientInfo[]> {
@@ -63,13 +159,25 @@ class AIService {
     }
   }
 
+  async prefetchPatient(patientId: string): Promise<PrefetchResponse> {
+    try {
+      const response = await this.client.post<PrefetchResponse>(
+        `/patients/${encodeURIComponent(patientId)}/prefetch`
+      );
+      return response.data;
+    } catch (error) {
+      console.error('Error prefetching patient:', error);
+      throw new Error('Failed to prefetch patient in AI service');
+    }
+  }
+
   async chat(request: ChatRequest): Promise<ChatResponse> {
     try {
       const response = await this.client.post<ChatResponse>('/chat', request);
       return response.data;
     } catch (error) {
       console.error('Error in chat:', error);
-      throw new Error('Failed to get chat response from AI service');
+      throw busyError(error) ?? new Error('Failed to get chat response from AI service');
     }
   }
 
@@ -86,11 +194,11 @@ class AIService {
       return response.data;
     } catch (error) {
       console.error('Error generating report:', error);
-      throw new Error('Failed to generate report from AI service');
+      throw busyError(error) ?? new Error('Failed to generate report from AI service');
     }
   }
 
-  async uploadDocuments(patientId: string, files: Express.Multer.File[]): Promise<any> {
+  async uploadDocuments(patientId: string, files: Express.Multer.File[]): Promise<UploadJobResponse> {
     try {
       const formData = new FormData();
 
@@ -100,7 +208,7 @@ class AIService {
         formData.append('files', blob, file.originalname);
       }
 
-      const response = await this.client.post(
+      const response = await this.client.post<UploadJobResponse>(
         `/upload?patient_id=${patientId}`,
         formData,
         {
@@ -117,6 +225,16 @@ class AIService {
     }
   }
 
+  async getUploadJob(jobId: string): Promise<JobStatus> {
+    try {
+      const response = await this.client.get<JobStatus>(`/jobs/${jobId}`);
+      return response.data;
+    } catch (error) {
+      console.error('Error fetching upload job:', error);
+      throw new Error('Failed to fetch upload job from AI service');
+    }
+  }
+
   async healthCheck(): Promise<boolean> {
     try {
       const response = await this.client.get('/health');
@@ -0,0 +1,32 @@
+import dotenv from 'dotenv';
+import { NodeSDK } from '@opentelemetry/sdk-node';
+import { ConsoleSpanExporter } from '@opentelemetry/sdk-trace-base';
+import { OTLPTraceExporter } from '@opentelemetry/exporter-trace-otlp-http';
+import { HttpInstrumentation } from '@opentelemetry/instrumentation-http';
+import { ExpressInstrumentation } from '@opentelemetry/instrumentation-express';
+
+// Loaded before express and http are imported, so their modules get patched.
+// Outgoing calls to the AI service carry the W3C traceparent header, which
+// links the ai-service spans to the backend request.
+dotenv.config();
+
+const exporterName = (process.env.OTEL_TRACES_EXPORTER || 'none').toLowerCase();
+
+if (exporterName !== 'none') {
+  const sdk = new NodeSDK({
+    serviceName: process.env.OTEL_SERVICE_NAME || 'backend',
+    traceExporter: exporterName === 'console' ? new ConsoleSpanExporter() : new OTLPTraceExporter(),
+    instrumentations: [
+      new HttpInstrumentation({
+        ignoreIncomingRequestHook: (req) => req.url === '/health'
+      }),
+      new ExpressInstrumentation()
+    ]
+  });
+  sdk.start();
+  console.log(`🔭 Tracing enabled with ${exporterName} exporter`);
+
+  process.on('SIGTERM', () => {
+    sdk.shutdown().finally(() => process.exit(0));
+  });
+}
@@ -1,6 +1,6 @@
 import { useState, useEffect, useRef } from 'react';
 import { Patient, Message } from '../types';
-import { apiService } from '../services/api.service';
+import { apiService, busyMessage } from '../services/api.service';
 import { Send, Loader2, FileText, User, Bot } from 'lucide-react';
 import ReactMarkdown from 'react-markdown';
 
@@ -12,10 +12,12 @@ export default function ChatInterface({ patient }: ChatInterfaceProps) {
   const [messages, setMessages] = useState<Message[]>([]);
   const [input, setInput] = useState('');
   const [loading, setLoading] = useState(false);
+  const [sessionId, setSessionId] = useState<string | undefined>(undefined);
   const messagesEndRef = useRef<HTMLDivElement>(null);
 
   useEffect(() => {
     // Reset chat when patient changes
+    setSessionId(undefined);
     setMessages([
       {
         role: 'assistant',
@@ -47,13 +49,8 @@ export default function ChatInterface({ patient }: ChatInterfaceProps) {
     setLoading(true);
 
     try {
-      // Build conversation history
-      const history = messages.map((msg) => ({
-        role: msg.role,
-        content: msg.content,
-      }));
-
-      const response = await apiService.chat(patient.patient_id, input, history);
+      const response = await apiService.chat(patient.patient_id, input, sessionId);
+      setSessionId(response.session_id);
 
       const assistantMessage: Message = {
         role: 'assistant',
@@ -67,7 +64,7 @@ export default function ChatInterface({ patient }: ChatInterfaceProps) {
       console.error('Error sending message:', error);
       const errorMessage: Message = {
         role: 'assistant',
-        content: 'Entschuldigung, es gab einen Fehler bei der Verarbeitung Ihrer Anfrage.',
+        content: busyMessage(error) ?? 'Entschuldigung, es gab einen Fehler bei der Verarbeitung Ihrer Anfrage.',
         timestamp: new Date().toISOString(),
       };
       setMessages((prev) => [...prev, errorMessage]);
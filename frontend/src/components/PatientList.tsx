@@ -1,4 +1,6 @@
+import { useEffect } from 'react';
 import { Patient } from '../types';
+import { apiService } from '../services/api.service';
 import { User, Calendar, Building2, FileText } from 'lucide-react';
 
 interface PatientListProps {
@@ -14,6 +16,16 @@ export default function PatientList({
   onSelectPatient,
   loading,
 }: PatientListProps) {
+  const selectedPatientId = selectedPatient?.patient_id;
+
+  // Warm the AI service caches while the clinician is still reading the patient
+  useEffect(() => {
+    if (!selectedPatientId) return;
+    apiService.prefetchPatient(selectedPatientId).catch((error) => {
+      console.warn('Prefetch failed:', error);
+    });
+  }, [selectedPatientId]);
+
   if (loading) {
     return (
       <div className="bg-white rounded-lg shadow-sm p-6">
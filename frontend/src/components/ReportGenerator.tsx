@@ -1,6 +1,6 @@
 import { useState } from 'react';
 import { Patient, Report } from '../types';
-import { apiService } from '../services/api.service';
+import { apiService, busyMessage } from '../services/api.service';
 import { FileText, Loader2, Download, RefreshCw } from 'lucide-react';
 
 interface ReportGeneratorProps {
@@ -27,7 +27,7 @@ export default function ReportGenerator({ patient }: ReportGeneratorProps) {
       setReport(response.report);
     } catch (err) {
       console.error('Error generating report:', err);
-      setError(err instanceof Error ? err.message : 'Fehler beim Generieren des Berichts');
+      setError(busyMessage(err) ?? (err instanceof Error ? err.message : 'Fehler beim Generieren des Berichts'));
     } finally {
       setLoading(false);
     }
@@ -222,6 +222,37 @@ export default function ReportGenerator({ patient }: ReportGeneratorProps) {
               </div>
             )}
 
+            {/* Allergies */}
+            {report.allergies && Array.isArray(report.allergies) && report.allergies.length > 0 && (
+              <div className="border border-gray-200 rounded-lg p-4">
+                <h3 className="font-semibold text-gray-900 mb-3">Allergien</h3>
+                <ul className="list-disc list-inside text-sm space-y-1">
+                  {report.allergies.map((allergy: any, idx: number) => (
+                    <li key={idx}>
+                      {allergy?.substance}
+                      {allergy?.reaction && ` – ${allergy.reaction}`}
+                      {allergy?.severity && ` (${allergy.severity})`}
+                    </li>
+                  ))}
+                </ul>
+              </div>
+            )}
+
+            {/* Procedures */}
+            {report.procedures && Array.isArray(report.procedures) && report.procedures.length > 0 && (
+              <div className="border border-gray-200 rounded-lg p-4">
+                <h3 className="font-semibold text-gray-900 mb-3">Prozeduren</h3>
+                <div className="space-y-3">
+                  {report.procedures.map((procedure: any, idx: number) => (
+                    <div key={idx} className="text-sm bg-gray-50 p-3 rounded">
+                      <p className="font-medium">{procedure?.date} {procedure?.name}</p>
+                      {procedure?.description && <p className="text-gray-600">{procedure.description}</p>}
+                    </div>
+                  ))}
+                </div>
+              </div>
+            )}
+
             {/* Labs */}
             {report.labs && (
               <div className="border border-gray-200 rounded-lg p-4">
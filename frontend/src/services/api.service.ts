@@ -23,15 +23,20 @@ class ApiService {
     return response.data;
   }
 
+  async prefetchPatient(patientId: string): Promise<void> {
+    await this.client.post(`/patients/${encodeURIComponent(patientId)}/prefetch`);
+  }
+
   async chat(
     patientId: string,
     question: string,
-    conversationHistory: Array<{ role: string; content: string }> = []
-  ): Promise<{ answer: string; sources: any[]; timestamp: string }> {
+    sessionId?: string
+  ): Promise<{ answer: string; sources: any[]; timestamp: string; session_id?: string }> {
+    // The conversation is kept server-side, only the new question is sent
     const response = await this.client.post('/chat', {
       patient_id: patientId,
       question,
-      conversation_history: conversationHistory,
+      session_id: sessionId,
     });
     return response.data;
   }
@@ -66,6 +71,22 @@ class ApiService {
 
     return response.data;
   }
+
+  async getUploadJob(jobId: string): Promise<any> {
+    const response = await this.client.get(`/upload/jobs/${jobId}`);
+    return response.data;
+  }
 }
 
 export const apiService = new ApiService();
+
+// German hint for requests the AI service rejected because it is saturated, null otherwise
+export function busyMessage(error: unknown): string | null {
+  if (!axios.isAxiosError(error) || error.response?.status !== 429) {
+    return null;
+  }
+  const retryAfter = error.response.headers['retry-after'];
+  return retryAfter
+    ? `Der KI-Dienst ist gerade ausgelastet. Bitte versuchen Sie es in ${retryAfter} Sekunden erneut.`
+    : 'Der KI-Dienst ist gerade ausgelastet. Bitte versuchen Sie es in Kürze erneut.';
+}
@@ -55,5 +55,16 @@ export interface Report {
     ambulatory: string[];
     lifestyle: string[];
   };
+  procedures?: Array<{
+    name: string;
+    date: string;
+    description: string;
+  }>;
+  allergies?: Array<{
+    substance: string;
+    reaction: string;
+    severity: string;
+  }>;
+  generator?: 'rules' | 'hybrid';
   [key: string]: any;
 }